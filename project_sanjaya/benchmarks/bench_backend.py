@@ -0,0 +1,171 @@
+"""
+Load test for the Flask backend (`main.py`).
+
+Requests go through Flask's test client from a thread pool sized like the
+Waitress deployment, so the suite needs no network or running server while
+still exercising the real routes, trip store and event logs. Each run works
+in a throwaway directory.
+
+    python benchmarks/bench_backend.py
+    python benchmarks/bench_backend.py --concurrency 16 --trip-events 10000 100000 --requests 500
+    python benchmarks/bench_backend.py --baseline benchmarks/results/backend-<timestamp>.json
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from common import IOSampler, latency_stats, report
+
+WAITRESS_THREADS = 8   # Matches run_app.py
+PRELOAD_CHUNK = 5000
+
+# A schedule in the past keeps the status scheduler idle and avoids any flight lookup
+BENCH_FLIGHT_INFO = {
+    "status": "landed",
+    "scheduled_departure": "2025-10-16T16:15:00+00:00",
+    "scheduled_arrival": "2025-10-16T18:50:00+00:00",
+    "departure_iata": "BLR",
+    "arrival_iata": "LKO",
+}
+
+class NoRender:
+    """Stands in for the map renderer, which needs a browser and tile downloads."""
+
+    def submit_trip(self, *args, **kwargs):
+        future = Future()
+        future.set_result(None)
+        return future
+
+def synthetic_track(n, end, start=(12.97, 77.59), step_seconds=1.0):
+    """`n` random-walk events one step apart, the last at `end`."""
+    lat, lon = start
+    events = []
+    for i in range(n):
+        lat += random.uniform(-1e-4, 1e-4)
+        lon += random.uniform(-1e-4, 1e-4)
+        when = end - timedelta(seconds=(n - 1 - i) * step_seconds)
+        events.append({"lat": round(lat, 6), "lon": round(lon, 6), "timestamp": when.isoformat(), "source": "web"})
+    return events
+
+def load_app(render):
+    os.environ.setdefault("SANJAYA_LOG_LEVEL", "WARNING")  # Per-request logs would swamp the report
+    import main
+    if not render:
+        main.render_service = NoRender()
+    return main
+
+def run_phase(main, name, jobs, concurrency):
+    """Runs `jobs` (callables taking a test client) on `concurrency` threads and measures them."""
+    clients = [main.app.test_client() for _ in range(concurrency)]
+    latencies, errors = [], 0
+
+    def worker(index):
+        client, timings, failed = clients[index], [], 0
+        for job in jobs[index::concurrency]:
+            start = time.perf_counter()
+            resp = job(client)
+            timings.append(time.perf_counter() - start)
+            failed += resp.status_code >= 400
+        return timings, failed
+
+    sampler = IOSampler()
+    sampler.start()
+    wall_start = time.perf_counter()
+    # The app logs every trip start; keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for timings, failed in pool.map(worker, range(concurrency)):
+            latencies.extend(timings)
+            errors += failed
+    wall = time.perf_counter() - wall_start
+    stats = latency_stats(latencies, wall)
+    stats["errors"] = errors
+    io_stats = sampler.stop(len(latencies))
+    if io_stats:
+        stats["io"] = io_stats
+    print(f"  {name}: {stats.get('p50_ms')} ms p50, {stats.get('p99_ms')} ms p99, {stats.get('throughput_rps')} req/s")
+    return stats
+
+def bench_trip_length(main, trip_events, concurrency, requests_per_worker):
+    print(f"Trip length {trip_events} events, {concurrency} concurrent clients")
+    results = {}
+    trips = []
+
+    def start(client):
+        resp = client.post('/start_trip', json={"user_name": "bench", "flight_info": BENCH_FLIGHT_INFO})
+        trips.append(resp.get_json())
+        return resp
+    results["start_trip"] = run_phase(main, "/start_trip", [start] * concurrency * 5, concurrency)
+
+    # Preload the trips that the remaining phases use; this setup isn't measured
+    active = trips[:concurrency]
+    end = datetime.now(timezone.utc) - timedelta(seconds=1)
+    for trip in active:
+        track = synthetic_track(trip_events, end)
+        for i in range(0, len(track), PRELOAD_CHUNK):
+            main.trips.append_events(trip["trip_id"], track[i:i + PRELOAD_CHUNK])
+
+    def log_job(token):
+        def job(client):
+            point = {"token": token, "lat": 12.97 + random.uniform(-0.01, 0.01), "lon": 77.59 + random.uniform(-0.01, 0.01)}
+            return client.post('/log', json=point)
+        return job
+    def status_job(token):
+        return lambda client: client.get('/status', query_string={"token": token})
+    def batch_job(token, offset):
+        def job(client):
+            base = int(time.time() * 1000) + offset
+            points = [{"lat": 12.97, "lon": 77.59 + i * 1e-4, "timestamp": base + i} for i in range(10)]
+            return client.post('/log/batch', json={"token": token, "points": points})
+        return job
+    def end_job(token):
+        return lambda client: client.post('/end_trip', json={"token": token})
+
+    # Job i runs on worker i % concurrency, so each worker keeps to its own trip
+    tokens = [t["token"] for t in active]
+    per_trip = lambda make: [make(tokens[i % concurrency]) for i in range(concurrency * requests_per_worker)]
+    results["log"] = run_phase(main, "/log", per_trip(log_job), concurrency)
+    results["status"] = run_phase(main, "/status", per_trip(status_job), concurrency)
+    batches = [batch_job(tokens[i % concurrency], 20 * (i // concurrency)) for i in range(concurrency * max(requests_per_worker // 10, 1))]
+    results["log_batch"] = run_phase(main, "/log/batch", batches, concurrency)
+    results["end_trip"] = run_phase(main, "/end_trip", [end_job(t["token"]) for t in trips], concurrency)
+    return results
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=WAITRESS_THREADS)
+    parser.add_argument("--trip-events", type=int, nargs="+", default=[10000, 100000],
+                        help="Events preloaded into each trip before measuring")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per client per endpoint")
+    parser.add_argument("--render", action="store_true", help="Render final maps on /end_trip (needs Chromium and network)")
+    parser.add_argument("--baseline", help="Earlier result file to check for regressions")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    args = parser.parse_args(argv)
+
+    random.seed(0)
+    workdir = tempfile.mkdtemp(prefix="sanjaya-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)  # main.py keeps its trips under ./logs
+    try:
+        main = load_app(args.render)
+        results = {"config": {"concurrency": args.concurrency, "requests_per_client": args.requests}}
+        for n in args.trip_events:
+            results[f"trip_{n}"] = bench_trip_length(main, n, args.concurrency, args.requests)
+        main.trips.flush()
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"Scratch data kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report("backend", results, args.baseline)
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
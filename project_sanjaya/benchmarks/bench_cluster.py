@@ -0,0 +1,117 @@
+"""
+Throughput of the multi-process backend (`python -m jules.cluster`) by worker count.
+
+Each configuration runs a real server in a throwaway directory. Client
+processes then act as separate travellers: each starts its own trip and posts
+`/log` pings over one keep-alive connection. The single-process file store
+(`waitress-serve`) is measured too, as the baseline. Scaling efficiency is
+throughput divided by (workers x one-worker throughput), so 1.0 means
+linear. Expect scaling only up to the number of free cores, including the
+ones the clients use.
+
+    python benchmarks/bench_cluster.py
+    python benchmarks/bench_cluster.py --workers 1 2 4 8 --clients 16 --requests 500
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+from common import PROJECT_DIR, latency_stats, report
+
+from jules.probes import wait_until_ready
+
+THREADS_PER_WORKER = 8   # Matches run_app.py
+
+# A schedule in the past keeps the status scheduler idle and avoids any flight lookup
+BENCH_FLIGHT_INFO = {
+    "status": "landed",
+    "scheduled_departure": "2025-10-16T16:15:00+00:00",
+    "scheduled_arrival": "2025-10-16T18:50:00+00:00",
+}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(workers, port, workdir):
+    """`workers=0` runs the single-process file store; otherwise a cluster of that many workers."""
+    if workers:
+        args = [sys.executable, "-m", "jules.cluster", "serve", "--workers", str(workers),
+                "--threads", str(THREADS_PER_WORKER), "--host", "127.0.0.1", "--port", str(port), "main:app"]
+    else:
+        args = [sys.executable, "-m", "waitress", f"--threads={THREADS_PER_WORKER}", "--host=127.0.0.1",
+                f"--port={port}", "main:app"]
+    env = dict(os.environ, PYTHONPATH=PROJECT_DIR, SANJAYA_LOG_LEVEL="WARNING")
+    process = subprocess.Popen(args, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until_ready(f"http://127.0.0.1:{port}/healthz", process)
+    return process
+
+def client(args):
+    """One traveller: starts a trip, then sends `requests` pings. Returns (latencies, start, end, errors)."""
+    port, requests, seed = args
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {"Content-Type": "application/json"}
+    def post(path, body):
+        conn.request("POST", path, json.dumps(body), headers)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    status, body = post("/start_trip", {"user_name": f"bench-{seed}", "flight_info": BENCH_FLIGHT_INFO})
+    token = json.loads(body)["token"]
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for i in range(requests):
+        t0 = time.perf_counter()
+        status, _ = post("/log", {"token": token, "lat": 12.97 + seed * 0.01 + i * 1e-5, "lon": 77.59})
+        latencies.append(time.perf_counter() - t0)
+        errors += status != 200
+    end = time.perf_counter()
+    conn.close()
+    return latencies, start, end, errors
+
+def bench_config(workers, clients, requests):
+    workdir = tempfile.mkdtemp(prefix="sanjaya-cluster-")
+    port = free_port()
+    server = start_server(workers, port, workdir)
+    try:
+        with Pool(clients) as pool:
+            runs = pool.map(client, [(port, requests, seed) for seed in range(clients)])
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    latencies = [x for run in runs for x in run[0]]
+    wall = max(r[2] for r in runs) - min(r[1] for r in runs)
+    stats = latency_stats(latencies, wall)
+    stats["errors"] = sum(r[3] for r in runs)
+    return stats
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent travellers (client processes)")
+    parser.add_argument("--requests", type=int, default=300, help="/log pings per traveller")
+    parser.add_argument("--baseline", help="Earlier result file to check for regressions")
+    args = parser.parse_args(argv)
+
+    results = {"config": {"cpus": os.cpu_count(), "clients": args.clients, "requests": args.requests},
+               "single_process": bench_config(0, args.clients, args.requests)}
+    for workers in args.workers:
+        results[f"workers_{workers}"] = bench_config(workers, args.clients, args.requests)
+    one = results.get("workers_1", {}).get("throughput_rps")
+    if one:
+        for workers in args.workers:
+            stats = results[f"workers_{workers}"]
+            stats["scaling_efficiency"] = round(stats["throughput_rps"] / (workers * one), 2)
+    return report("cluster", results, args.baseline)
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,105 @@
+"""
+Microbenchmarks for the hot helpers: distance, airport proximity and map
+generation. Inputs are seeded random points around India, so runs are
+repeatable and need no network.
+
+    python benchmarks/bench_micro.py
+    python benchmarks/bench_micro.py --map-events 10000 100000 --baseline benchmarks/results/micro-<timestamp>.json
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from itertools import cycle
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from common import latency_stats, report, time_calls
+
+from jules.geovec import haversine_np
+from jules.utils import check_airport_proximity, check_airport_proximity_many, haversine_distance
+
+INDIA_BOUNDS = ((8.0, 30.0), (70.0, 90.0))
+
+def random_points(n, seed=0):
+    rng = random.Random(seed)
+    (lat_lo, lat_hi), (lon_lo, lon_hi) = INDIA_BOUNDS
+    return [(rng.uniform(lat_lo, lat_hi), rng.uniform(lon_lo, lon_hi)) for _ in range(n)]
+
+def per_call(seconds):
+    return {"per_call_us": round(seconds * 1e6, 3), "calls_per_s": round(1 / seconds, 1)}
+
+def bench_haversine(points):
+    pairs = cycle(list(zip(points, points[1:] + points[:1])))
+    def one():
+        a, b = next(pairs)
+        return haversine_distance(a[0], a[1], b[0], b[1])
+    results = {"scalar": per_call(time_calls(one, 20000))}
+
+    lats, lons = np.array([p[0] for p in points]), np.array([p[1] for p in points])
+    vec = time_calls(lambda: haversine_np(lats[:-1], lons[:-1], lats[1:], lons[1:]), 20) / (len(points) - 1)
+    results["numpy_per_point"] = per_call(vec)
+    return results
+
+def bench_proximity(points):
+    cycled = cycle(points)
+    one = lambda: check_airport_proximity(*next(cycled))
+    results = {"single": per_call(time_calls(one, 20000))}
+    many = time_calls(lambda: check_airport_proximity_many(points), 5) / len(points)
+    results["many_per_point"] = per_call(many)
+    return results
+
+def synthetic_events(n):
+    """A ground track, a gap for the flight, and another ground track."""
+    start = datetime(2025, 10, 16, 12, 0, tzinfo=timezone.utc)
+    rng = random.Random(n)
+    lat, lon = 12.97, 77.59
+    events = []
+    for i in range(n):
+        if i == n // 2:
+            lat, lon = 26.76, 80.88
+        lat += rng.uniform(-1e-4, 1e-4)
+        lon += rng.uniform(-1e-4, 1e-4)
+        events.append({"lat": lat, "lon": lon, "timestamp": (start + timedelta(seconds=i)).isoformat(), "source": "web"})
+    return events
+
+def bench_map_generation(sizes, repeat):
+    from jules.maps import generate_trip_map
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="sanjaya-bench-") as tmp:
+        html_path = os.path.join(tmp, "map.html")
+        for n in sizes:
+            events = synthetic_events(n)
+            samples = []
+            for i in range(repeat):
+                start = time.perf_counter()
+                # A fresh trip id each time so the polyline cache doesn't hide the work
+                generate_trip_map(events, trip_id=f"bench-{n}-{i}", html_path=html_path)
+                samples.append(time.perf_counter() - start)
+            stats = latency_stats(samples)
+            stats["html_bytes"] = os.path.getsize(html_path)
+            results[f"events_{n}"] = stats
+            print(f"  generate_trip_map({n} events): {stats['p50_ms']} ms p50")
+    return results
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--points", type=int, default=10000, help="Random points for the distance/proximity benchmarks")
+    parser.add_argument("--map-events", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--map-repeat", type=int, default=3)
+    parser.add_argument("--baseline", help="Earlier result file to check for regressions")
+    args = parser.parse_args(argv)
+
+    points = random_points(args.points)
+    results = {
+        "haversine_distance": bench_haversine(points),
+        "check_airport_proximity": bench_proximity(points),
+        "generate_trip_map": bench_map_generation(args.map_events, args.map_repeat),
+    }
+    return report("micro", results, args.baseline)
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,116 @@
+"""
+Cold-start timings: module import cost and time-to-ready for each service.
+
+Every sample starts a fresh interpreter in a throwaway directory, so nothing
+is shared with earlier runs apart from the OS file cache. Import times are the
+wall time of `python -c "import <module>"` minus that of an empty interpreter.
+Ready times run from spawning a service to its health check answering 200,
+the same probe `run_app.py` waits on. A run fails when a median exceeds its
+budget.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 10 --services waitress streamlit tiles
+    python benchmarks/bench_startup.py --baseline benchmarks/results/startup-<timestamp>.json
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import PROJECT_DIR, latency_stats, report
+
+from jules.probes import wait_until_ready
+
+IMPORT_MODULES = ("main", "jules.renderer", "jules.maps", "jules.tiles")
+SERVICES = ("waitress", "streamlit", "tiles")
+
+# Budgets for the medians, in milliseconds
+IMPORT_BUDGET_MS = {"main": 500}
+READY_BUDGET_MS = {"waitress": 2000, "streamlit": 8000, "tiles": 1500}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def child_env():
+    env = dict(os.environ, PYTHONPATH=PROJECT_DIR, SANJAYA_LOG_LEVEL="WARNING")
+    env.pop("SANJAYA_TILES_URL", None)
+    return env
+
+def time_import(module, workdir):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=workdir, env=child_env(), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def bench_imports(modules, repeat, workdir):
+    interpreter = [time_import("sys", workdir) for _ in range(repeat)]
+    results = {"interpreter": latency_stats(interpreter)}
+    floor = min(interpreter)
+    for module in modules:
+        results[module] = latency_stats([max(time_import(module, workdir) - floor, 0.0) for _ in range(repeat)])
+    return results
+
+def service_command(service, port, workdir):
+    if service == "waitress":
+        return [sys.executable, "-m", "waitress", f"--port={port}", "--host=127.0.0.1", "main:app"], "/healthz"
+    if service == "streamlit":
+        return [sys.executable, "-m", "streamlit", "run", os.path.join(PROJECT_DIR, "dashboard", "app.py"),
+                "--server.port", str(port), "--server.headless", "true"], "/_stcore/health"
+    if service == "tiles":
+        return [sys.executable, "-m", "jules.tiles", "--db", os.path.join(workdir, "tiles.mbtiles"), "--offline",
+                "serve", "--port", str(port)], "/healthz"
+    raise ValueError(f"Unknown service {service}")
+
+def time_ready(service, workdir):
+    port = free_port()
+    args, health_path = service_command(service, port, workdir)
+    start = time.perf_counter()
+    process = subprocess.Popen(args, cwd=workdir, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(f"http://127.0.0.1:{port}{health_path}", process)
+        return time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+def over_budget(results):
+    failures = []
+    for section, budgets in (("imports", IMPORT_BUDGET_MS), ("ready", READY_BUDGET_MS)):
+        for name, budget in budgets.items():
+            p50 = results[section].get(name, {}).get("p50_ms")
+            if p50 is not None and p50 > budget:
+                failures.append(f"{section}.{name}: p50 {p50} ms > budget {budget} ms")
+    return failures
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=list(IMPORT_MODULES))
+    parser.add_argument("--services", nargs="*", default=list(SERVICES), choices=SERVICES)
+    parser.add_argument("--baseline", help="Earlier result file to check for regressions")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="sanjaya-startup-")
+    try:
+        os.makedirs(os.path.join(workdir, "logs"))
+        results = {
+            "imports": bench_imports(args.modules, args.repeat, workdir),
+            "ready": {s: latency_stats([time_ready(s, workdir) for _ in range(args.repeat)]) for s in args.services},
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    status = report("startup", results, args.baseline)
+    for line in over_budget(results):
+        print(f"OVER BUDGET {line}")
+        status = 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,140 @@
+"""Shared helpers for the benchmark scripts: timing stats, I/O counters and result files."""
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REGRESSION_THRESHOLD = 0.20  # Flag metrics that got more than 20% worse than the baseline
+
+# Make `main` and `jules` importable when a script is run directly
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+# --- Measurements ---
+
+def latency_stats(samples, wall_seconds=None):
+    """Summarizes latencies (seconds) as milliseconds, plus throughput if the wall time is known."""
+    samples = np.asarray(samples, dtype=np.float64) * 1000.0
+    if samples.size == 0:
+        return {"count": 0}
+    stats = {
+        "count": int(samples.size),
+        "mean_ms": round(float(samples.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p90_ms": round(float(np.percentile(samples, 90)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "max_ms": round(float(samples.max()), 3),
+    }
+    if wall_seconds:
+        stats["throughput_rps"] = round(samples.size / wall_seconds, 1)
+    return stats
+
+class IOSampler:
+    """
+    Process-wide file I/O counters (via psutil) between `start()` and `stop()`.
+    Counters include background threads such as the trip-state flusher, which
+    is intended: that I/O is part of what a request costs.
+    """
+
+    def __init__(self):
+        try:
+            import psutil
+            self._process = psutil.Process()
+            self._process.io_counters()
+        except (ImportError, AttributeError, NotImplementedError, OSError):
+            self._process = None
+        self._start = None
+
+    def _read(self):
+        if self._process is None:
+            return None
+        c = self._process.io_counters()
+        return {"read_count": c.read_count, "write_count": c.write_count,
+                "read_bytes": c.read_bytes, "write_bytes": c.write_bytes}
+
+    def start(self):
+        self._start = self._read()
+
+    def stop(self, requests):
+        end = self._read()
+        if end is None or self._start is None:
+            return None
+        return {f"{k}_per_request": round((end[k] - self._start[k]) / max(requests, 1), 2) for k in end}
+
+def time_calls(fn, number, repeat=5):
+    """Best-of-`repeat` time per call of `fn` (seconds), timed over `number` calls each."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+# --- Result Files ---
+
+def write_results(name, results, out_dir=RESULTS_DIR):
+    """Writes a timestamped JSON result file and returns its path."""
+    os.makedirs(out_dir, exist_ok=True)
+    now = datetime.now(timezone.utc)
+    payload = {
+        "benchmark": name,
+        "timestamp": now.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    path = os.path.join(out_dir, f"{name}-{now.strftime('%Y%m%dT%H%M%SZ')}.json")
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+    return path
+
+def _flatten(results, prefix=""):
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{name}.")
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    """
+    Compares results against a previous result file. Latency/time metrics
+    (`*_ms`, `*_us`) regress when they grow; throughput metrics (`*_rps`,
+    `*_per_s`) regress when they shrink. Returns a list of regression messages.
+    """
+    with open(baseline_path, "r") as f:
+        baseline = dict(_flatten(json.load(f)["results"]))
+    regressions = []
+    for name, value in _flatten(results):
+        old = baseline.get(name)
+        if not old:
+            continue
+        if name.endswith(("_ms", "_us")):
+            change = (value - old) / old
+        elif name.endswith(("_rps", "_per_s")):
+            change = (old - value) / old
+        else:
+            continue
+        if change > threshold:
+            regressions.append(f"{name}: {old} -> {value} ({change:+.0%} worse)")
+    return regressions
+
+def report(name, results, baseline=None):
+    """Prints results, saves them and, with a baseline, prints any regressions. Returns an exit code."""
+    print(json.dumps(results, indent=2))
+    print(f"Results saved to {write_results(name, results)}")
+    if not baseline:
+        return 0
+    regressions = compare(results, baseline)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print(f"No regressions against {baseline}.")
+    return 1 if regressions else 0
@@ -1,15 +1,18 @@
 import streamlit as st
 from streamlit_autorefresh import st_autorefresh
 import json
-import folium
-from streamlit_folium import st_folium
 import os
 import sys
-import requests
+import time
 from datetime import datetime, timezone, timedelta
-import qrcode
 from io import BytesIO
 from jules.utils import get_airport_coords # Import the new function
+from jules.trips import open_trip_log, read_latest_trip_id, trip_info_path, trip_events_path, trip_map_image_path
+from jules.stream import StreamFollower
+from jules.trajectory import fit_zoom, polyline_cache
+from jules.routes import estimate_position, flight_route, great_circle, split_at_antimeridian
+from jules.export import FORMATS as EXPORT_FORMATS, encode_chunks, export_chunks, trip_event_source
+from components import TripView
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -20,9 +23,21 @@ st.set_page_config(
 )
 
 # --- Constants ---
-TRIP_INFO_FILE = os.path.join(os.path.dirname(__file__), '..', 'logs', 'trip_info.json')
-TRIP_LOG_FILE = os.path.join(os.path.dirname(__file__), '..', 'logs', 'trip_log.json')
-MAP_IMAGE_FILE = os.path.join(os.path.dirname(__file__), '..', 'logs', 'final_trip_map.png')
+TRIPS_DIR = os.path.join(os.path.dirname(__file__), '..', 'logs', 'trips')
+BACKEND_URL = os.environ.get("SANJAYA_BACKEND_URL", "http://localhost:5000")
+# "poll" re-reads the log files on a timer; "stream" follows the backend's /stream SSE feed
+# (and polls the files while the backend refuses or drops the stream)
+DASHBOARD_MODE = os.environ.get("SANJAYA_DASHBOARD_MODE", "poll")
+STREAM_REFRESH_MS = 2000
+RAW_LOG_LIMIT = 200
+# Tile URL template, e.g. the local tile server from jules/tiles.py; CartoDB positron otherwise
+MAP_TILES_URL = os.environ.get("SANJAYA_TILES_URL")
+MAP_TILES_ATTR = os.environ.get("SANJAYA_TILES_ATTR", "Map tiles")
+# Written by run_app.py once the ngrok tunnel is up
+PUBLIC_URL_FILE = os.path.join(os.path.dirname(__file__), '..', 'logs', 'public_url.txt')
+
+# folium (with pandas), streamlit_folium, qrcode and requests are imported where
+# they're used, so the page header and metrics render before they have loaded
 
 # --- Helper Functions ---
 def load_json(file_path):
@@ -43,19 +58,137 @@ def to_ist(utc_dt_str):
     except (ValueError, TypeError):
         return "N/A"
 
+@st.cache_data
+def trip_token(trip_id):
+    """The trip's secret token, which the backend wants for /stream and /reset_trip."""
+    return load_json(trip_info_path(trip_id, TRIPS_DIR)).get("token")
+
+@st.cache_resource
+def get_stream_follower(trip_id):
+    """One shared SSE consumer per trip, kept across reruns."""
+    return StreamFollower(f"{BACKEND_URL}/stream?token={trip_token(trip_id)}").start()
+
+@st.cache_resource
+def get_trip_view(trip_id, source="files"):
+    """
+    One incrementally refreshed TripView per trip and source ("files" or
+    "stream"), shared by all sessions. The two track different cursors.
+    """
+    return TripView(trip_events_path(trip_id, TRIPS_DIR))
+
+@st.cache_data
+def make_qr_png(url):
+    import qrcode
+    qr_img = qrcode.make(url)
+    buf = BytesIO()
+    qr_img.save(buf, format="PNG")
+    return buf.getvalue()
+
+@st.cache_data
+def load_asset(path, mtime):
+    """Reads a static file once per modification time."""
+    with open(path, "rb") as f:
+        return f.read()
+
+def asset_bytes(path):
+    """Memoized file contents, or None if the file is missing or empty."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    return load_asset(path, os.path.getmtime(path))
+
+@st.cache_data
+def export_bytes(trip_id, fmt, events_size):
+    """A browserless export of the trip (see jules/export.py), redone only when its log grows."""
+    trip_info = load_json(trip_info_path(trip_id, TRIPS_DIR)) or {}
+    return b"".join(encode_chunks(export_chunks(fmt, trip_event_source(trip_id, TRIPS_DIR), trip_info)))
+
+def public_tracking_url():
+    """The tracking link passed on the command line, else the one run_app.py published."""
+    if len(sys.argv) > 1:
+        return sys.argv[1]
+    try:
+        with open(PUBLIC_URL_FILE, "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def build_map(trip_id, view, flight_info=None):
+    import folium
+    coords, events = view.coords, view.events
+    if not coords:
+        return folium.Map(location=[20.5937, 78.9629], zoom_start=5, tiles=MAP_TILES_URL or "OpenStreetMap",
+                          attr=MAP_TILES_ATTR if MAP_TILES_URL else None)
+
+    m = folium.Map(location=coords[-1], zoom_start=13, tiles=MAP_TILES_URL or "CartoDB positron",
+                   attr=MAP_TILES_ATTR if MAP_TILES_URL else None)
+
+    # Pre-flight and post-flight ground coordinates are kept partitioned by the TripView
+    pre_flight_coords, post_flight_coords = view.pre_flight, view.post_flight
+
+    # Simplify for the zoom Leaflet will fit to, so the payload stays bounded on long trips
+    zoom = fit_zoom(coords)
+    pre_flight_coords = polyline_cache.get(trip_id, "pre_flight", pre_flight_coords, zoom)
+    post_flight_coords = polyline_cache.get(trip_id, "post_flight", post_flight_coords, zoom)
+
+    if pre_flight_coords:
+        folium.PolyLine(pre_flight_coords, color="#3498db", weight=5, popup="Pre-Flight Path").add_to(m)
+    if post_flight_coords:
+        folium.PolyLine(post_flight_coords, color="#3498db", weight=5, popup="Post-Flight Path").add_to(m)
+
+    # Flight leg: the great-circle route between the scheduled airports when known,
+    # otherwise between the last and first ground points
+    flight_info = flight_info or {}
+    flight_path = flight_route(flight_info)
+    if flight_path is None and pre_flight_coords and post_flight_coords:
+        flight_path = great_circle(*pre_flight_coords[-1], *post_flight_coords[0])
+    if flight_path:
+        folium.PolyLine(split_at_antimeridian(flight_path), color="#f39c12", weight=4, dash_array='10, 5',
+                        popup="Flight Path").add_to(m)
+    if flight_info.get("status") == "in_flight":
+        position = estimate_position(flight_info, datetime.now(timezone.utc))
+        if position:
+            folium.Marker(location=position[:2], popup=f"Estimated position ({position[2]:.0%} of flight)",
+                          icon=folium.Icon(color='orange', icon='plane')).add_to(m)
+    folium.Marker(location=coords[0], popup="Trip Start", icon=folium.Icon(color='green', icon='play')).add_to(m)
+    folium.Marker(location=coords[-1], popup=f"Last Location\n{to_ist(events[-1]['timestamp'])}", icon=folium.Icon(color='red', icon='user')).add_to(m)
+    m.fit_bounds(m.get_bounds(), padding=(50, 50))
+    return m
+
 # --- Main Dashboard ---
 st.title("🛰️ Jules Tracker — Project Sanjaya (Keystone)")
 st.markdown("Live trip tracking with automated flight detection and multi-segment journey support.")
 
+# --- Trip Selection ---
+# Show the trip given by `?trip=<trip_id>`, or the most recently started one
+trip_id = st.query_params.get("trip") or read_latest_trip_id(TRIPS_DIR)
+follower = None
+try:
+    if trip_id and DASHBOARD_MODE == "stream":
+        follower = get_stream_follower(trip_id)
+        if not follower.connected:
+            follower = None
+    # While streaming, the trip info arrives with the stream's status events
+    trip_info = follower.snapshot()[2].get("trip_info") if follower else None
+    if trip_info is None:
+        trip_info = load_json(trip_info_path(trip_id, TRIPS_DIR)) if trip_id else {}
+except ValueError:
+    trip_id, trip_info, follower = None, {}, None
+
 # --- Auto-refresh for active monitoring ---
-trip_info = load_json(TRIP_INFO_FILE)
-if not trip_info or trip_info.get("trip_status") == "active":
+if DASHBOARD_MODE == "stream":
+    # Cheap reruns: the follower already holds the data, and the map is only rebuilt on change
+    st_autorefresh(interval=STREAM_REFRESH_MS, key="dashboard_refresh")
+elif not trip_info or trip_info.get("trip_status") == "active":
     st_autorefresh(interval=20 * 1000, key="dashboard_refresh")
 
 # --- Data Loading ---
-trip_log = load_json(TRIP_LOG_FILE)
-events = trip_log.get("events", [])
-coords = [(e["lat"], e["lon"]) for e in events if "lat" in e and "lon" in e]
+# The TripView only processes events appended since the previous rerun
+view = get_trip_view(trip_id, "stream" if follower else "files") if trip_info else TripView()
+if trip_info and follower:
+    view.refresh_from_stream(follower, trip_info.get("flight_info"))
+elif trip_info:
+    view.refresh(trip_info.get("flight_info"))
+events, coords = view.events, view.coords
 
 # --- Sidebar ---
 st.sidebar.title("Trip Details")
@@ -88,8 +221,9 @@ else:
     status_text, status_gif_path = status_map.get(display_status, ("Unknown", None))
 
     st.sidebar.metric("Status", status_text)
-    if status_gif_path and os.path.exists(status_gif_path):
-        st.sidebar.image(status_gif_path)
+    status_gif = asset_bytes(status_gif_path) if status_gif_path else None
+    if status_gif:
+        st.sidebar.image(status_gif)
 
     st.sidebar.info(f"**Flight Status:** {status_map.get(flight_status, ('Unknown', None))[0]}")
 
@@ -111,57 +245,66 @@ st.header("Live Journey Map")
 
 if not coords:
     st.info("No location data yet for this trip.")
-    m = folium.Map(location=[20.5937, 78.9629], zoom_start=5)
-else:
-    m = folium.Map(location=coords[-1], zoom_start=13, tiles="CartoDB positron")
-
-    # Find pre-flight and post-flight ground coordinates
-    dep_time = datetime.fromisoformat(trip_info['flight_info']['scheduled_departure'])
-    arr_time = datetime.fromisoformat(trip_info['flight_info']['scheduled_arrival'])
-
-    pre_flight_coords = [ (e['lat'], e['lon']) for e in events if datetime.fromisoformat(e['timestamp']) < dep_time ]
-    post_flight_coords = [ (e['lat'], e['lon']) for e in events if datetime.fromisoformat(e['timestamp']) > arr_time ]
-
-    if pre_flight_coords:
-        folium.PolyLine(pre_flight_coords, color="#3498db", weight=5, popup="Pre-Flight Path").add_to(m)
-    if post_flight_coords:
-        folium.PolyLine(post_flight_coords, color="#3498db", weight=5, popup="Post-Flight Path").add_to(m)
 
-    # Draw flight path between last and first ground points
-    if pre_flight_coords and post_flight_coords:
-        flight_path = [pre_flight_coords[-1], post_flight_coords[0]]
-        folium.PolyLine(flight_path, color="#f39c12", weight=4, dash_array='10, 5', popup="Flight Path").add_to(m)
-    folium.Marker(location=coords[0], popup="Trip Start", icon=folium.Icon(color='green', icon='play')).add_to(m)
-    folium.Marker(location=coords[-1], popup=f"Last Location\n{to_ist(events[-1]['timestamp'])}", icon=folium.Icon(color='red', icon='user')).add_to(m)
-    m.fit_bounds(m.get_bounds(), padding=(50, 50))
-
-st_folium(m, width="100%", height=500)
+# Reuse the previous map object while nothing changed so it isn't rebuilt or redrawn
+flight_info = trip_info.get("flight_info", {})
+map_key = (
+    trip_id, view.version, flight_info.get("status"), flight_info.get("departure_iata"), flight_info.get("arrival_iata"),
+    # The estimated in-flight position moves, so redraw it once a minute
+    int(time.time() // 60) if flight_info.get("status") == "in_flight" else None,
+)
+cached = st.session_state.get("live_map")
+if cached is None or cached[0] != map_key:
+    cached = (map_key, build_map(trip_id, view, flight_info))
+    st.session_state["live_map"] = cached
+from streamlit_folium import st_folium
+st_folium(cached[1], width="100%", height=500, key="live_map_view", returned_objects=[])
 
 # --- Summary & Data ---
 if trip_info.get('trip_status') == 'ended':
     st.header("Trip Summary")
-    if os.path.exists(MAP_IMAGE_FILE):
-        st.image(MAP_IMAGE_FILE, caption="Final Trip Map")
+    final_map = asset_bytes(trip_map_image_path(trip_id, TRIPS_DIR))
+    # Unchanged when the archive replaces the log, so cached exports stay valid
+    events_size = open_trip_log(trip_id, TRIPS_DIR).size()
+    if final_map:
+        st.image(final_map, caption="Final Trip Map")
     else:
-        st.warning("Final map image not generated yet.")
+        # No browser render yet (or none available); draw one straight from the log
+        st.image(export_bytes(trip_id, "png", events_size), caption="Final Trip Map")
+    for column, (fmt, label) in zip(st.columns(2), (("gpx", "GPX"), ("geojson", "GeoJSON"))):
+        column.download_button(f"Download {label}", export_bytes(trip_id, fmt, events_size),
+                               file_name=f"{trip_id}.{fmt}", mime=EXPORT_FORMATS[fmt])
 
-with st.expander("Show Raw Log Data"):
-    st.json(trip_log)
+segments = view.analyzer.segment_summaries()
+if segments:
+    st.header("Journey Segments")
+    mode_names = {"stationary": "🛑 Stopped", "walking": "🚶 Walking", "driving": "🚗 Driving",
+                  "airport_dwell": "🛫 At Airport", "flight": "✈️ Flight"}
+    st.dataframe([
+        {
+            "Mode": mode_names.get(s["mode"], s["mode"]) + (f" ({s['airport']})" if s.get("airport") else ""),
+            "From": to_ist(datetime.fromtimestamp(s["start"], timezone.utc).isoformat()),
+            "To": to_ist(datetime.fromtimestamp(s["end"], timezone.utc).isoformat()),
+            "Minutes": round(s["duration_s"] / 60, 1),
+            "Distance (km)": s["distance_km"],
+        }
+        for s in segments
+    ], width="stretch", hide_index=True)
+
+with st.expander(f"Show Raw Log Data (latest {RAW_LOG_LIMIT} of {len(events)})"):
+    st.json({"events": events[-RAW_LOG_LIMIT:]})
 with st.expander("Show Trip Info"):
-    st.json(trip_info)
+    st.json({k: v for k, v in trip_info.items() if k != "token"})
 
 # --- Sidebar Bottom ---
 st.sidebar.markdown("---")
-try:
-    public_url = sys.argv[1]
+public_url = public_tracking_url()
+if public_url:
     st.sidebar.subheader("📲 Your Public Tracking Link")
     st.sidebar.code(public_url)
-    qr_img = qrcode.make(public_url)
-    buf = BytesIO()
-    qr_img.save(buf, format="PNG")
-    st.sidebar.image(buf, width=200, caption="Scan to open tracking page")
-except IndexError:
-    st.sidebar.warning("Tracking URL not available. Run via `run_app.py`.")
+    st.sidebar.image(make_qr_png(public_url), width=200, caption="Scan to open tracking page")
+else:
+    st.sidebar.warning("Tracking URL not available yet. Run via `run_app.py`; it appears once the tunnel is up.")
 
 st.sidebar.markdown("---")
 # --- Admin Actions ---
@@ -170,8 +313,9 @@ is_admin = st.query_params.get("a") == "neelaksh"
 if is_admin:
     st.sidebar.subheader("Admin Actions")
     if st.sidebar.button("🗑️ Reset Trip Data"):
+        import requests
         try:
-            response = requests.post("http://localhost:5000/reset_trip")
+            response = requests.post(f"{BACKEND_URL}/reset_trip", json={"token": trip_token(trip_id)})
             if response.ok:
                 st.sidebar.success("Trip data has been reset!")
                 time.sleep(1)
@@ -0,0 +1,117 @@
+import os
+import threading
+from datetime import datetime
+
+from jules.analytics import TripAnalyzer
+from jules.archive import open_event_log
+
+def parse_epoch(ts):
+    """Epoch seconds for an ISO-8601 timestamp, or None if it can't be parsed."""
+    try:
+        return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+class TripView:
+    """
+    Incrementally maintained view of one trip's events for the dashboard.
+
+    Each event's timestamp is parsed exactly once when it is first seen, and the
+    ground path is kept pre-partitioned into pre-flight and post-flight
+    coordinates. A refresh only processes records appended since the last
+    cursor, so rerun cost scales with new data instead of trip length. The
+    partitions are rebuilt (from the already-parsed timestamps) only if the
+    flight schedule changes. A `TripAnalyzer` is fed the same new events to
+    keep stop and travel-mode segments current.
+    """
+
+    def __init__(self, events_path=None):
+        self.events_path = events_path
+        self.log = open_event_log(events_path) if events_path else None
+        self._lock = threading.Lock()
+        self._schedule = None
+        self._flight_info = None
+        self._source_key = None
+        self.version = 0
+        self._reset()
+
+    def _reset(self):
+        self.cursor = 0
+        self.events = []
+        self.coords = []
+        self.epochs = []
+        self.pre_flight = []
+        self.post_flight = []
+        self.analyzer = TripAnalyzer.for_flight(self._flight_info or {})
+        self.version += 1  # Never reused, so caches keyed on it stay valid across resets
+
+    def _partition(self, coord, epoch):
+        if self._schedule is None or epoch is None:
+            return
+        dep, arr = self._schedule
+        if epoch < dep:
+            self.pre_flight.append(coord)
+        elif epoch > arr:
+            self.post_flight.append(coord)
+
+    def _analyze(self, coord, epoch):
+        if epoch is not None:
+            self.analyzer.update(coord[0], coord[1], epoch)
+
+    def _set_schedule(self, flight_info):
+        dep = parse_epoch((flight_info or {}).get("scheduled_departure"))
+        arr = parse_epoch((flight_info or {}).get("scheduled_arrival"))
+        schedule = (dep, arr) if dep is not None and arr is not None else None
+        if schedule == self._schedule:
+            return
+        self._schedule = schedule
+        self._flight_info = flight_info
+        self.pre_flight, self.post_flight = [], []
+        self.analyzer = TripAnalyzer.for_flight(flight_info or {})
+        for coord, epoch in zip(self.coords, self.epochs):
+            self._partition(coord, epoch)
+            self._analyze(coord, epoch)
+        self.version += 1
+
+    def _ingest(self, events):
+        for e in events:
+            if "lat" not in e or "lon" not in e:
+                continue
+            coord, epoch = (e["lat"], e["lon"]), parse_epoch(e.get("timestamp"))
+            self.events.append(e)
+            self.coords.append(coord)
+            self.epochs.append(epoch)
+            self._partition(coord, epoch)
+            self._analyze(coord, epoch)
+        if events:
+            self.version += 1
+
+    def refresh(self, flight_info):
+        """Reads newly appended records from the trip's event log."""
+        with self._lock:
+            if not os.path.exists(self.log.path):
+                # The trip was archived and its log removed; the archive keeps the log's cursors
+                self.log = open_event_log(self.events_path)
+            self._set_schedule(flight_info)
+            events, cursor = self.log.read_from(self.cursor)
+            if cursor < self.cursor:
+                # The log was reset; start over
+                self._reset()
+                self._set_schedule(flight_info)
+            self.cursor = cursor
+            self._ingest(events)
+            return self.version
+
+    def refresh_from_stream(self, follower, flight_info):
+        """Pulls events the stream follower received since the last refresh."""
+        with self._lock:
+            self._set_schedule(flight_info)
+            generation, events = follower.events_since(self.cursor)
+            if self._source_key != generation:
+                # First sync, or the follower started over after a reset
+                self._source_key = generation
+                self._reset()
+                generation, events = follower.events_since(0)
+            self.cursor += len(events)
+            self._ingest(events)
+            return self.version
@@ -0,0 +1,246 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from math import atan2, cos, degrees, radians, sin
+
+from jules.utils import check_airport_proximity, haversine_distance
+
+# --- Thresholds ---
+STOP_RADIUS_M = 75             # Points within this distance of a cluster's centre belong to it
+STOP_MIN_SECONDS = 180         # A cluster must last this long to count as a stop
+WALKING_MAX_KMH = 7
+DRIVING_MAX_KMH = 200
+FLIGHT_MIN_KMH = 250
+AIRPORT_DWELL_MAX_KMH = 30
+SPEED_SMOOTHING = 0.4          # EMA weight of the newest segment speed
+MODE_CONFIRM_POINTS = 3        # Consecutive points needed before switching segment mode
+
+MODES = ("stationary", "walking", "driving", "airport_dwell", "flight")
+
+def _epoch(ts):
+    return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+
+def initial_bearing(lat1, lon1, lat2, lon2):
+    """Compass bearing in degrees from the first point towards the second."""
+    phi1, phi2 = radians(lat1), radians(lat2)
+    dlon = radians(lon2 - lon1)
+    x = sin(dlon) * cos(phi2)
+    y = cos(phi1) * sin(phi2) - sin(phi1) * cos(phi2) * cos(dlon)
+    return (degrees(atan2(x, y)) + 360) % 360
+
+class TripAnalyzer:
+    """
+    Incremental ground-track analytics for one trip.
+
+    Feed points in time order with `update()`; each call does a constant
+    amount of work (one haversine, one bearing, one airport-index lookup) and
+    maintains:
+
+    - speed and heading profiles (raw and smoothed speed per point)
+    - dwell/stop clusters, detected with a running centroid
+    - a segmentation into stationary / walking / driving / airport_dwell /
+      flight, with a short confirmation window so GPS jitter doesn't split
+      segments
+
+    `flight_window` (departure, arrival) in epoch seconds, when known, marks
+    points logged during the scheduled flight as flight regardless of speed.
+    """
+
+    def __init__(self, flight_window=None, airport_lookup=check_airport_proximity):
+        self.flight_window = flight_window
+        self.airport_lookup = airport_lookup
+        self.count = 0
+        self.total_km = 0.0
+        self.speeds_kmh = []
+        self.headings = []
+        self.stops = []
+        self.segments = []
+        self._prev = None            # (lat, lon, epoch)
+        self._smoothed = 0.0
+        self._cluster = None         # Open dwell cluster
+        self._pending = None         # [mode, first point, count] awaiting confirmation
+
+    @classmethod
+    def for_flight(cls, flight_info, **kwargs):
+        """Builds an analyzer using a trip's `flight_info` schedule."""
+        try:
+            window = (_epoch(flight_info["scheduled_departure"]), _epoch(flight_info["scheduled_arrival"]))
+        except (KeyError, TypeError, AttributeError, ValueError):
+            window = None
+        return cls(flight_window=window, **kwargs)
+
+    # --- Feeding Points ---
+
+    def update_event(self, event):
+        return self.update(event["lat"], event["lon"], _epoch(event["timestamp"]))
+
+    def update(self, lat, lon, epoch):
+        """Consumes one point and returns the mode it was classified as."""
+        speed = heading = 0.0
+        if self._prev is not None:
+            plat, plon, pepoch = self._prev
+            step_km = haversine_distance(plat, plon, lat, lon)
+            self.total_km += step_km
+            dt = epoch - pepoch
+            if dt > 0:
+                speed = step_km / (dt / 3600.0)
+            heading = initial_bearing(plat, plon, lat, lon) if step_km > 0 else (self.headings[-1] if self.headings else 0.0)
+            self._smoothed = SPEED_SMOOTHING * speed + (1 - SPEED_SMOOTHING) * self._smoothed
+        self._prev = (lat, lon, epoch)
+        self.speeds_kmh.append((speed, self._smoothed))
+        self.headings.append(heading)
+        self.count += 1
+
+        airport = self.airport_lookup(lat, lon) if self.airport_lookup else None
+        self._update_cluster(lat, lon, epoch, airport)
+        mode = self._classify(epoch, self._smoothed, airport)
+        self._update_segments(mode, lat, lon, epoch, airport)
+        return mode
+
+    # --- Stop Detection ---
+
+    def _update_cluster(self, lat, lon, epoch, airport):
+        c = self._cluster
+        if c is not None and haversine_distance(c["lat"], c["lon"], lat, lon) * 1000 <= STOP_RADIUS_M:
+            n = c["points"] + 1
+            c["lat"] += (lat - c["lat"]) / n
+            c["lon"] += (lon - c["lon"]) / n
+            c["points"], c["end"] = n, epoch
+            c["airport"] = c["airport"] or (airport or {}).get("iata")
+            return
+        self._close_cluster()
+        self._cluster = {"lat": lat, "lon": lon, "start": epoch, "end": epoch, "points": 1,
+                         "airport": (airport or {}).get("iata")}
+
+    def _close_cluster(self):
+        c = self._cluster
+        if c is not None and c["end"] - c["start"] >= STOP_MIN_SECONDS:
+            self.stops.append({**c, "duration_s": c["end"] - c["start"]})
+        self._cluster = None
+
+    def in_stop(self):
+        c = self._cluster
+        return c is not None and c["end"] - c["start"] >= STOP_MIN_SECONDS
+
+    # --- Segmentation ---
+
+    def _classify(self, epoch, speed, airport):
+        if self.flight_window and self.flight_window[0] <= epoch <= self.flight_window[1]:
+            return "flight"
+        if speed >= FLIGHT_MIN_KMH:
+            return "flight"
+        if airport is not None and speed <= AIRPORT_DWELL_MAX_KMH:
+            return "airport_dwell"
+        if self.in_stop():
+            return "stationary"
+        if speed <= WALKING_MAX_KMH:
+            return "walking"
+        return "driving"
+
+    def _update_segments(self, mode, lat, lon, epoch, airport):
+        point = (lat, lon, epoch, self.count - 1, self.total_km)
+        if not self.segments:
+            self._open_segment(mode, point, airport)
+            return
+        current = self.segments[-1]
+        if mode == current["mode"]:
+            # Jitter that never got confirmed is absorbed by the current segment
+            self._pending = None
+            self._extend(current, point)
+            return
+        if self._pending is None or self._pending[0] != mode:
+            self._pending = [mode, point, 0]
+        self._pending[2] += 1
+        if self._pending[2] >= MODE_CONFIRM_POINTS:
+            start = self._pending[1]
+            self._pending = None
+            self._extend(self._open_segment(mode, start, airport), point)
+
+    def _open_segment(self, mode, point, airport):
+        lat, lon, epoch, index, km = point
+        segment = {
+            "mode": mode, "start": epoch, "start_index": index, "start_lat": lat, "start_lon": lon,
+            "airport": (airport or {}).get("iata") if mode == "airport_dwell" else None,
+            "_start_km": km,
+        }
+        self._extend(segment, point)
+        self.segments.append(segment)
+        return segment
+
+    @staticmethod
+    def _extend(segment, point):
+        lat, lon, epoch, index, km = point
+        segment.update(end=epoch, end_index=index, end_lat=lat, end_lon=lon,
+                       distance_km=round(km - segment["_start_km"], 3))
+
+    # --- Results ---
+
+    @property
+    def current_mode(self):
+        return self.segments[-1]["mode"] if self.segments else None
+
+    def segment_summaries(self):
+        return [
+            {k: v for k, v in s.items() if not k.startswith("_")} | {"duration_s": s["end"] - s["start"]}
+            for s in self.segments
+        ]
+
+    def summary(self, profile=False):
+        """Results so far; the per-point speed and heading profiles are included only with `profile`."""
+        stops = list(self.stops)
+        if self.in_stop():
+            stops.append({**self._cluster, "duration_s": self._cluster["end"] - self._cluster["start"], "ongoing": True})
+        summary = {
+            "points": self.count,
+            "total_km": round(self.total_km, 3),
+            "current_mode": self.current_mode,
+            "current_speed_kmh": round(self._smoothed, 1),
+            "current_heading": round(self.headings[-1], 1) if self.headings else None,
+            "segments": self.segment_summaries(),
+            "stops": stops,
+        }
+        if profile:
+            summary["speed_profile"] = [[round(raw, 1), round(smooth, 1)] for raw, smooth in self.speeds_kmh]
+            summary["heading_profile"] = [round(h, 1) for h in self.headings]
+        return summary
+
+# --- Per-Trip Cache ---
+
+class AnalyticsCache:
+    """
+    Keeps one `TripAnalyzer` per trip and advances it from the trip's event log
+    cursor, so each logged point is analysed once no matter how often the
+    results are requested. The analyzer is rebuilt only if the log is reset or
+    the flight schedule changes. Each trip has its own lock, so reading one
+    trip's log never holds up requests for another. The least recently used
+    trips are dropped beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()  # Guards `_entries` only
+        self._entries = OrderedDict()  # trip_id -> [lock, analyzer, cursor, schedule key]
+
+    def summary(self, trip_id, event_log, flight_info, profile=False):
+        schedule = (flight_info or {}).get("scheduled_departure"), (flight_info or {}).get("scheduled_arrival")
+        with self._lock:
+            entry = self._entries.get(trip_id)
+            if entry is None:
+                entry = self._entries[trip_id] = [threading.Lock(), None, 0, None]
+            self._entries.move_to_end(trip_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        with entry[0]:
+            if entry[1] is None or entry[3] != schedule or entry[2] > event_log.size():
+                entry[1:] = [TripAnalyzer.for_flight(flight_info or {}), 0, schedule]
+            events, entry[2] = event_log.read_from(entry[2])
+            for event in events:
+                try:
+                    entry[1].update_event(event)
+                except (KeyError, TypeError, AttributeError, ValueError):
+                    continue
+            return entry[1].summary(profile)
+
+    def discard(self, trip_id):
+        with self._lock:
+            self._entries.pop(trip_id, None)
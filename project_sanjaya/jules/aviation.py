@@ -0,0 +1,310 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+from jules.utils import atomic_write_json
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+except ImportError:
+    pass
+
+AVIATIONSTACK_URL = os.environ.get("AVIATIONSTACK_URL", "http://api.aviationstack.com/v1/flights")
+AVIATIONSTACK_KEY = os.environ.get("AVIATIONSTACK_KEY")
+MONTHLY_CALL_LIMIT = int(os.environ.get("AVIATIONSTACK_MONTHLY_LIMIT", "100"))
+QUOTA_RESERVE = 5          # Calls kept in hand so the monthly limit is never hit
+CACHE_TTL_SECONDS = 600
+NEGATIVE_TTL_SECONDS = 1800   # How long a flight the API has no records for is remembered
+CACHE_MAX_ENTRIES = 256
+REQUEST_TIMEOUT = (5, 10)
+ERROR_BACKOFF_SECONDS = (30, 600)  # First and maximum delay after upstream failures
+
+USAGE_FILE = os.path.join(os.path.dirname(__file__), '..', 'logs', 'api_usage.json')
+FALLBACK_FLIGHT_FILE = os.path.join(os.path.dirname(__file__), 'fallback_flight.json')
+QUOTA_BUSY_TIMEOUT_SECONDS = 30
+
+log = logging.getLogger(__name__)
+
+# --- Quota Accounting ---
+
+class QuotaCounter:
+    """
+    Monthly API call counter persisted in `logs/api_usage.json`.
+    Increments are serialized by a lock and written atomically (temp file +
+    rename), and the count resets when the calendar month changes.
+    """
+
+    def __init__(self, path=USAGE_FILE, limit=MONTHLY_CALL_LIMIT, reserve=QUOTA_RESERVE, key="aviationstack_calls"):
+        self.path = path
+        self.limit = limit
+        self.reserve = reserve
+        self.key = key
+        self._lock = threading.Lock()
+
+    def _read(self):
+        month = datetime.now(timezone.utc).strftime("%Y-%m")
+        usage = {}
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            try:
+                with open(self.path, "r") as f:
+                    usage = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                usage = {}
+        if usage.get("month") != month:
+            usage = {**usage, "month": month, self.key: 0}
+        return usage
+
+    def used(self):
+        with self._lock:
+            return self._read()[self.key]
+
+    def try_acquire(self):
+        """Records one call if the budget allows it; returns False once the reserve is reached."""
+        with self._lock:
+            usage = self._read()
+            if usage[self.key] >= self.limit - self.reserve:
+                return False
+            usage[self.key] += 1
+            atomic_write_json(self.path, usage)
+            return True
+
+class SharedQuotaCounter:
+    """
+    `QuotaCounter` kept in a SQLite database, normally the shared trip store's
+    `trips.db`, so every backend worker process draws from one monthly budget.
+    Each check-and-increment is a `BEGIN IMMEDIATE` transaction. Calls are
+    rare, so each one opens its own short-lived connection.
+    """
+
+    def __init__(self, db_path, limit=MONTHLY_CALL_LIMIT, reserve=QUOTA_RESERVE, key="aviationstack_calls"):
+        self.db_path = db_path
+        self.limit = limit
+        self.reserve = reserve
+        self.key = key
+        with self._transaction() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS api_usage (
+                name TEXT PRIMARY KEY, month TEXT NOT NULL, calls INTEGER NOT NULL)""")
+
+    def _transaction(self):
+        db = sqlite3.connect(self.db_path, timeout=QUOTA_BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        return _ImmediateTransaction(db)
+
+    def _calls(self, db, month):
+        row = db.execute("SELECT month, calls FROM api_usage WHERE name = ?", (self.key,)).fetchone()
+        return row[1] if row is not None and row[0] == month else 0
+
+    def used(self):
+        with self._transaction() as db:
+            return self._calls(db, datetime.now(timezone.utc).strftime("%Y-%m"))
+
+    def try_acquire(self):
+        """Records one call if the budget allows it; returns False once the reserve is reached."""
+        month = datetime.now(timezone.utc).strftime("%Y-%m")
+        with self._transaction() as db:
+            calls = self._calls(db, month)
+            if calls >= self.limit - self.reserve:
+                return False
+            db.execute("INSERT OR REPLACE INTO api_usage VALUES (?, ?, ?)", (self.key, month, calls + 1))
+            return True
+
+class _ImmediateTransaction:
+    """Runs the block in a `BEGIN IMMEDIATE` transaction and closes the connection afterwards."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.db.close()
+
+# --- Response Normalization ---
+
+# aviationstack `flight_status` values mapped onto the statuses the tracker uses
+STATUS_MAP = {"scheduled": "scheduled", "active": "in_flight", "landed": "landed"}
+
+def normalize_aviationstack(record):
+    """Converts one aviationstack `data` record to the trip `flight_info` shape."""
+    departure, arrival = record.get("departure") or {}, record.get("arrival") or {}
+    return {
+        "status": STATUS_MAP.get(record.get("flight_status") or "scheduled", record.get("flight_status")),
+        "scheduled_departure": departure.get("scheduled"),
+        "scheduled_arrival": arrival.get("scheduled"),
+        "departure_airport": departure.get("airport"),
+        "arrival_airport": arrival.get("airport"),
+        "departure_iata": departure.get("iata"),
+        "arrival_iata": arrival.get("iata"),
+        "source": "aviationstack",
+    }
+
+def unknown_flight():
+    """`flight_info` for a flight with no live data: no schedule, so no status timers are armed."""
+    return {
+        "status": "unknown",
+        "scheduled_departure": None,
+        "scheduled_arrival": None,
+        "departure_airport": None,
+        "arrival_airport": None,
+        "departure_iata": None,
+        "arrival_iata": None,
+        "source": "unavailable",
+    }
+
+def fallback_flight(path=FALLBACK_FLIGHT_FILE):
+    """
+    `flight_info` used when live data is unavailable: `fallback_flight.json`
+    (in the same shape) over the `unknown_flight()` fields. The shipped file
+    has no schedule; fill it in to pin every unresolved flight to one.
+    """
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        log.warning("Fallback flight file unreadable", extra={"path": path})
+        data = {}
+    return {**unknown_flight(), **(data if isinstance(data, dict) else {})}
+
+# --- Provider Client ---
+
+class FlightDataClient:
+    """
+    Cached, coalescing client for the aviationstack flights API.
+
+    - one pooled `requests.Session` for all calls
+    - TTL + LRU cache keyed by (flight number, date); flights the API has no
+      records for are cached too, for `negative_ttl`
+    - single-flight: concurrent lookups of the same key share one upstream call
+    - quota accounting that stops calling upstream before the monthly limit
+    - exponential backoff after upstream errors
+    - answers `fallback_flight()` whenever live data is unavailable
+    """
+
+    def __init__(self, base_url=AVIATIONSTACK_URL, api_key=AVIATIONSTACK_KEY, quota=None,
+                 ttl=CACHE_TTL_SECONDS, negative_ttl=NEGATIVE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES,
+                 fallback_path=FALLBACK_FLIGHT_FILE):
+        self.base_url = base_url
+        self.fallback_path = fallback_path
+        self.api_key = api_key
+        self.quota = quota or QuotaCounter()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        import requests  # Deferred with the client itself (see get_client), off the backend's import path
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()   # key -> (expires_at, flight_info)
+        self._inflight = {}           # key -> Future
+        self._backoff_until = 0.0  # Both backoff fields are guarded by `_lock`
+        self._backoff = ERROR_BACKOFF_SECONDS[0]
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key, flight_info, ttl):
+        self._cache[key] = (time.monotonic() + ttl, flight_info)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def get(self, flight_number, date=None):
+        """Returns `flight_info` for a flight on `date` (YYYY-MM-DD, default today UTC)."""
+        date = date or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        key = (str(flight_number).strip().upper(), date)
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return dict(cached)
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            return dict(future.result())
+
+        try:
+            flight_info, ttl = self._fetch(*key)
+            if ttl:
+                with self._lock:
+                    self._store(key, flight_info, ttl)
+            future.set_result(flight_info)
+            return dict(flight_info)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _fetch(self, flight_number, date):
+        """
+        One upstream call. Returns (flight_info, seconds to cache it for); the
+        time is None when the call was skipped or failed, so nothing is cached.
+        """
+        with self._lock:
+            backing_off = time.monotonic() < self._backoff_until
+        if not self.api_key or backing_off:
+            return fallback_flight(self.fallback_path), None
+        if not self.quota.try_acquire():
+            log.warning("Aviationstack monthly quota reserve reached; flight data unavailable")
+            return fallback_flight(self.fallback_path), None
+        import requests
+        params = {"access_key": self.api_key, "flight_iata": flight_number, "flight_date": date}
+        try:
+            resp = self.session.get(self.base_url, params=params, timeout=REQUEST_TIMEOUT)
+            resp.raise_for_status()
+            records = resp.json().get("data") or []
+        except (requests.RequestException, ValueError) as e:
+            # The exception text contains the request URL (and so the API key); log only its type
+            log.warning("Flight lookup failed", extra={"flight_number": flight_number, "error": type(e).__name__})
+            with self._lock:
+                self._backoff_until = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, ERROR_BACKOFF_SECONDS[1])
+            return fallback_flight(self.fallback_path), None
+        with self._lock:
+            self._backoff = ERROR_BACKOFF_SECONDS[0]
+        if not records:
+            log.info("No flight records found", extra={"flight_number": flight_number, "flight_date": date})
+            return fallback_flight(self.fallback_path), self.negative_ttl
+        return normalize_aviationstack(records[0]), self.ttl
+
+_client = None
+_client_options = {}
+_client_lock = threading.Lock()
+
+def configure_client(**options):
+    """Sets `FlightDataClient` options, e.g. a `SharedQuotaCounter`, for the client created on first use."""
+    global _client
+    with _client_lock:
+        _client_options.update(options)
+        _client = None
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = FlightDataClient(**_client_options)
+        return _client
+
+def get_flight_data(flight_number, date=None):
+    """Looks up a flight's schedule and status; `fallback_flight()` when no live data is available."""
+    return get_client().get(flight_number, date)
@@ -0,0 +1,256 @@
+"""
+Multi-process backend: several Waitress worker processes behind one port.
+
+    python -m jules.cluster serve --workers 4 --port 5000 main:app
+
+The supervisor binds the listening socket once. Each worker inherits it and
+serves it with its own thread pool, so the workers share a single accept
+queue and the GIL stops being the ceiling. Workers run with
+`SANJAYA_TRIP_STORE=sqlite`, which shares trip state between them through
+`jules.tripdb.SharedTripStore`. Exactly one of them at a time runs the
+flight-status scheduler, chosen through a lease in that database (see
+`SchedulerLeader`). The supervisor restarts workers that exit.
+
+Everything else a worker keeps in memory is a per-process cache or limit,
+built so that a worker which missed another's change still answers
+correctly:
+
+- `AnalyticsCache` follows the shared event log by byte cursor and rebuilds
+  when the log is shorter than its cursor. `/reset_trip` only discards the
+  entry in the worker that served it. Elsewhere the deleted trip is no
+  longer found, so its entry is never read, and the LRU bound evicts it.
+- `polyline_cache` restarts a simplifier whenever the path it is given is
+  not an extension of the last one, and is LRU-bounded.
+- The flight lookup cache in `jules.aviation` is per worker, so each
+  worker may look a flight up once per TTL. The API quota is shared
+  through `SharedQuotaCounter`, so the monthly budget still holds.
+- Metrics, the SSE stream limit (`MAX_STREAMS`) and the map renderer are
+  per worker.
+
+Inheriting the socket needs a POSIX system; on Windows run a single worker.
+"""
+import argparse
+import importlib
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+LEASE_NAME = "status-scheduler"
+LEASE_SECONDS = 10.0         # A dead leader is replaced within this long
+LEADER_TICK_SECONDS = 1.0    # Lease renewal and schedule sync interval
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_THREADS = 8
+LISTEN_BACKLOG = 1024
+RESTART_DELAY_SECONDS = (1, 30)
+HEALTHY_UPTIME_SECONDS = 60  # A worker up this long has its restart backoff reset
+
+log = logging.getLogger(__name__)
+
+# --- Scheduler Leader Election ---
+
+class SchedulerLeader:
+    """
+    Runs `scheduler` in at most one process at a time.
+
+    Every worker starts one of these. Each tick, it tries to take or renew the
+    lease in the shared store. The holder arms timers for every active trip,
+    then keeps them in sync with trip changes made by any worker. The others
+    drop whatever timers their own requests armed. If a leader dies, its lease
+    expires and another worker takes over within `ttl` seconds. A stalled
+    leader could overlap briefly with its successor. That is harmless: a
+    status update only moves a trip to the status its schedule implies.
+    """
+
+    def __init__(self, store, scheduler, ttl=LEASE_SECONDS, tick=LEADER_TICK_SECONDS):
+        self.store = store
+        self.scheduler = scheduler
+        self.ttl = ttl
+        self.tick = tick
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._armed = {}          # trip_id -> flight_info the timer was armed from
+        self._seen_version = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sync(self):
+        """Re-arms timers for trips that are new or whose flight info changed since the last sync."""
+        version = self.store.change_version()
+        if version == self._seen_version:
+            return
+        self._seen_version = version
+        active = {t["trip_id"]: t.get("flight_info", {}) for t in self.store.active_trips()}
+        for trip_id, flight_info in active.items():
+            if self._armed.get(trip_id) != flight_info:
+                self.scheduler.schedule(trip_id, flight_info)
+                self._armed[trip_id] = flight_info
+        for trip_id in set(self._armed) - set(active):
+            self.scheduler.cancel(trip_id)
+            del self._armed[trip_id]
+
+    def step(self):
+        """One election round; returns whether this process is the leader."""
+        leader = self.store.acquire_lease(LEASE_NAME, self.holder, self.ttl)
+        if leader and not self.is_leader:
+            log.info("Acquired the status scheduler lease", extra={"holder": self.holder})
+            self._armed, self._seen_version = {}, None
+            self.scheduler.start()
+        elif self.is_leader and not leader:
+            log.warning("Lost the status scheduler lease", extra={"holder": self.holder})
+        self.is_leader = leader
+        if leader:
+            self._sync()
+        else:
+            self.scheduler.clear()
+        return leader
+
+    def _run(self):
+        while True:
+            try:
+                self.step()
+            except Exception:
+                log.exception("Scheduler leader election failed")
+            if self._stop.wait(self.tick):
+                return
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="scheduler-leader")
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops campaigning and gives up the lease so another worker can take over at once."""
+        self._stop.set()
+        if self.is_leader:
+            self.is_leader = False
+            self.scheduler.clear()
+            self.store.release_lease(LEASE_NAME, self.holder)
+
+# --- Workers ---
+
+def load_app(spec):
+    """Imports a `module:attribute` WSGI app spec."""
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr or "app")
+
+def run_worker(fd, app_spec, threads):
+    """Serves `app_spec` on the inherited listening socket `fd` until terminated."""
+    from waitress import serve
+    sock = socket.socket(fileno=fd)
+    app = load_app(app_spec)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    serve(app, sockets=[sock], threads=threads)
+
+def bind_listener(host, port, backlog=LISTEN_BACKLOG):
+    sock = socket.create_server((host, port), backlog=backlog)
+    sock.set_inheritable(True)
+    return sock
+
+class Supervisor:
+    """Starts `workers` worker processes on one listening socket and restarts any that exit."""
+
+    def __init__(self, app_spec, workers=DEFAULT_WORKERS, host="0.0.0.0", port=5000, threads=DEFAULT_THREADS):
+        if os.name != "posix":
+            raise RuntimeError("Multi-process mode needs a POSIX system; run a single worker instead.")
+        self.app_spec = app_spec
+        self.workers = workers
+        self.threads = threads
+        self.sock = bind_listener(host, port)
+        self.processes = [None] * workers
+        self._started = [0.0] * workers
+        self._failures = [0] * workers
+        self._restart_at = {}
+        self._stopping = False
+
+    def _spawn(self, slot):
+        fd = self.sock.fileno()
+        env = dict(os.environ, SANJAYA_TRIP_STORE="sqlite", SANJAYA_WORKER=str(slot))
+        self.processes[slot] = subprocess.Popen(
+            [sys.executable, "-m", "jules.cluster", "worker", "--fd", str(fd), "--threads", str(self.threads), self.app_spec],
+            pass_fds=(fd,), env=env)
+        self._started[slot] = time.monotonic()
+        log.info("Worker started", extra={"worker": slot, "pid": self.processes[slot].pid})
+
+    def start(self):
+        for slot in range(self.workers):
+            self._spawn(slot)
+        return self
+
+    def check(self, now=None):
+        """
+        One supervision round: restarts exited workers with a delay that grows
+        with each crash in a row, and resets that delay once a worker has
+        stayed up for `HEALTHY_UPTIME_SECONDS`.
+        """
+        now = time.monotonic() if now is None else now
+        for slot, process in enumerate(self.processes):
+            if slot in self._restart_at:
+                if now >= self._restart_at[slot]:
+                    del self._restart_at[slot]
+                    self._spawn(slot)
+            elif process.poll() is not None:
+                delay = min(RESTART_DELAY_SECONDS[0] * 2 ** self._failures[slot], RESTART_DELAY_SECONDS[1])
+                self._failures[slot] += 1
+                log.error("Worker exited; restarting", extra={"worker": slot, "pid": process.pid,
+                                                              "returncode": process.returncode, "restart_in_s": delay})
+                self._restart_at[slot] = now + delay
+            elif self._failures[slot] and now - self._started[slot] >= HEALTHY_UPTIME_SECONDS:
+                self._failures[slot] = 0
+
+    def supervise(self, poll_seconds=0.5):
+        """Blocks, restarting workers that exit, until `stop()` is called."""
+        while not self._stopping:
+            self.check()
+            time.sleep(poll_seconds)
+
+    def stop(self):
+        self._stopping = True
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.wait()
+        self.sock.close()
+
+def main(argv=None):
+    from jules.logs import setup_logging
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Run the backend as several worker processes on one port.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve")
+    serve.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    serve.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="Waitress threads per worker")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=5000)
+    serve.add_argument("app", nargs="?", default="main:app")
+    worker = sub.add_parser("worker", help="Internal: one worker process started by `serve`")
+    worker.add_argument("--fd", type=int, required=True)
+    worker.add_argument("--threads", type=int, default=DEFAULT_THREADS)
+    worker.add_argument("app")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        run_worker(args.fd, args.app, args.threads)
+        return 0
+
+    supervisor = Supervisor(args.app, args.workers, args.host, args.port, args.threads).start()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    log.info("Serving with worker processes", extra={"workers": args.workers, "host": args.host, "port": args.port})
+    try:
+        supervisor.supervise()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        supervisor.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
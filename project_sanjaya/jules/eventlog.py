@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+import time
+import weakref
+
+from jules.metrics import EVENT_LOG_APPENDED_BYTES, IO_SECONDS, timed_lock
+
+# One lock per log file so every EventLog pointing at the same path shares it.
+# Entries go away with the last EventLog using them.
+_locks = weakref.WeakValueDictionary()
+_locks_guard = threading.Lock()
+
+def _lock_for(path):
+    with _locks_guard:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = threading.Lock()
+        return lock
+
+class EventLog:
+    """
+    Append-only, newline-delimited JSON store for trip events.
+
+    Each append is a single write to a file opened in append mode, so it costs
+    O(1) regardless of trip length and concurrent writers never interleave
+    partial records. Readers address the log by byte offset ("cursor") and can
+    resume from where they last stopped.
+    """
+
+    def __init__(self, path, fsync_interval=1.0):
+        self.path = os.path.abspath(path)
+        self.fsync_interval = fsync_interval
+        self._lock = _lock_for(self.path)
+        self._fh = None
+        self._last_fsync = 0.0
+        self._fsync_timer = None
+        self._unsynced = False
+
+    # --- Writing ---
+
+    def _handle(self):
+        if self._fh is None or self._fh.closed:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fh = open(self.path, "ab", buffering=0)
+        return self._fh
+
+    def append(self, event):
+        """Appends one event and returns the cursor just past it."""
+        return self.append_many([event])
+
+    def append_many(self, events):
+        """Appends several events in a single write and returns the new cursor."""
+        payload = b"".join(
+            json.dumps(e, separators=(",", ":")).encode("utf-8") + b"\n" for e in events
+        )
+        with timed_lock(self._lock, "event_log"):
+            fh = self._handle()
+            if payload:
+                with IO_SECONDS.time(op="event_log_append"):
+                    fh.write(payload)
+                EVENT_LOG_APPENDED_BYTES.inc(len(payload))
+                self._unsynced = True
+                self._maybe_fsync(fh)
+            return fh.tell()
+
+    def _maybe_fsync(self, fh):
+        """
+        Batches fsyncs so a burst of pings costs at most one per interval. A
+        write inside the interval arms a timer, so the end of a burst is
+        synced too. Caller holds the lock.
+        """
+        now = time.monotonic()
+        if now - self._last_fsync >= self.fsync_interval:
+            self._fsync(fh)
+        elif self._fsync_timer is None:
+            self._fsync_timer = threading.Timer(self.fsync_interval - (now - self._last_fsync), self.flush)
+            self._fsync_timer.daemon = True
+            self._fsync_timer.start()
+
+    def _fsync(self, fh):
+        with IO_SECONDS.time(op="event_log_fsync"):
+            os.fsync(fh.fileno())
+        self._last_fsync = time.monotonic()
+        self._unsynced = False
+
+    def _cancel_timer(self):
+        if self._fsync_timer is not None:
+            self._fsync_timer.cancel()
+            self._fsync_timer = None
+
+    def flush(self):
+        with self._lock:
+            self._cancel_timer()
+            if self._fh is not None and not self._fh.closed:
+                self._fsync(self._fh)
+
+    def reset(self):
+        """Deletes all events."""
+        with self._lock:
+            self._cancel_timer()
+            self._close_handle()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _close_handle(self):
+        if self._fh is not None and not self._fh.closed:
+            self._fh.close()
+        self._fh = None
+
+    def close(self):
+        """Syncs anything not yet on disk and closes the file."""
+        with self._lock:
+            self._cancel_timer()
+            if self._unsynced and self._fh is not None and not self._fh.closed:
+                self._fsync(self._fh)
+            self._close_handle()
+
+    # --- Reading ---
+
+    def size(self):
+        """Current cursor at the end of the log."""
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def read_from(self, cursor=0, limit=None):
+        """
+        Returns (events, new_cursor) for complete records after `cursor`.
+        A trailing record that is still being written is left for the next call.
+        """
+        events = []
+        if not os.path.exists(self.path):
+            return events, 0
+        with open(self.path, "rb") as f:
+            if cursor > os.fstat(f.fileno()).st_size:
+                cursor = 0  # The log was reset underneath the reader
+            f.seek(cursor)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                cursor += len(line)
+                if line.strip():
+                    events.append(json.loads(line))
+                if limit is not None and len(events) >= limit:
+                    break
+        return events, cursor
+
+    def iter_events(self, cursor=0):
+        """Streams events one at a time without loading the whole log."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(cursor)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                if line.strip():
+                    yield json.loads(line)
+
+    def last_event(self, tail_bytes=4096):
+        """
+        Returns the most recent complete event by reading only the end of the
+        file, doubling the tail until it holds a whole record.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            while True:
+                start = max(size - tail_bytes, 0)
+                f.seek(start)
+                lines = f.read(size - start).split(b"\n")
+                # The last element is either empty (complete log) or a partial record;
+                # unless the tail starts the file, the first may be cut off
+                for line in reversed(lines[1 if start else 0:-1]):
+                    if line.strip():
+                        try:
+                            return json.loads(line)
+                        except ValueError:
+                            return None
+                if start == 0:
+                    return None
+                tail_bytes *= 2
+
+    def __iter__(self):
+        return self.iter_events()
+
+def load_events(path):
+    """Streams events from either an event log or a legacy {"events": [...]} JSON file."""
+    if path.endswith(".json"):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return iter(())
+        with open(path, "r") as f:
+            return iter(json.load(f).get("events", []))
+    return EventLog(path).iter_events()
@@ -0,0 +1,443 @@
+"""
+Trip exports that need no browser: GeoJSON, GPX, SVG and PNG.
+
+Every exporter is a generator of output chunks that reads events one at a
+time, so memory stays bounded however long the trip is. GeoJSON and GPX need
+a single pass. The images take two: one for the bounding box, and one to
+draw. Their memory depends on the image size, not the trip length.
+
+Each run of consecutive events with the same `source` (ground `web`
+points, `flight` points, ...) becomes its own line or track segment, styled
+like the Folium maps in `jules.maps`. Many trips can be exported at once in
+a process pool:
+
+    python -m jules.export <trip_id> --formats geojson gpx png
+    python -m jules.export --all --workers 4 --out exports/
+"""
+import json
+import os
+import struct
+import sys
+import zlib
+from html import escape
+from math import log, pi, radians, tan
+
+from jules.eventlog import load_events
+from jules.trips import TRIPS_DIR, _TRIP_ID_RE, open_trip_log, trip_dir
+
+FORMATS = {"geojson": "application/geo+json", "gpx": "application/gpx+xml", "svg": "image/svg+xml", "png": "image/png"}
+IMAGE_SIZE = (1024, 768)
+IMAGE_PADDING = 40
+MIN_SPAN_KM = 0.5          # Don't zoom in further than this, so a stationary trip isn't a blur of pixels
+EARTH_CIRCUMFERENCE_KM = 40075.0
+SVG_POINTS_PER_CHUNK = 512
+
+BACKGROUND = (248, 249, 250)
+START_COLOR = (46, 204, 113)
+END_COLOR = (231, 76, 60)
+# Matches the Folium map colours; flight legs are dashed
+SOURCE_STYLES = {
+    "web": {"color": (52, 152, 219), "width": 5, "dash": None},
+    "flight": {"color": (243, 156, 18), "width": 4, "dash": (10, 5)},
+}
+DEFAULT_STYLE = {"color": (127, 140, 141), "width": 3, "dash": None}
+
+# --- Sources ---
+
+def trip_event_source(trip_id, root=TRIPS_DIR):
+    """
+    A callable that opens a fresh iterator over the trip's events: the event
+    log, or the archive once it has replaced the log (which stores the same
+    events losslessly).
+    """
+    return lambda: open_trip_log(trip_id, root).iter_events()
+
+def as_source(events):
+    """
+    Normalizes a path, a re-iterable collection (such as a list) or a callable
+    into a callable returning a fresh iterator. One-shot iterators are refused
+    rather than copied into memory; pass a callable that reopens them.
+    """
+    if callable(events):
+        return events
+    if isinstance(events, str):
+        if events.endswith(".sja"):
+            def open_archive():
+                from jules.archive import TripArchive
+                return TripArchive(events).iter_events()
+            return open_archive
+        return lambda: load_events(events)
+    if iter(events) is events:
+        raise TypeError("Events can only be read once; pass a path, a list or a callable returning an iterator.")
+    return lambda: iter(events)
+
+def _one_pass(events):
+    """An iterator over `events` for exporters that read them once, including one-shot iterators."""
+    if callable(events) or isinstance(events, str):
+        return as_source(events)()
+    return iter(events)
+
+def _runs(events):
+    """Yields (source, lat, lon, timestamp) per valid event, and `None` between runs of different sources."""
+    current = None
+    for e in events:
+        try:
+            lat, lon = float(e["lat"]), float(e["lon"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        source = e.get("source") or ""
+        if current is not None and source != current:
+            yield None
+        current = source
+        yield source, lat, lon, e.get("timestamp")
+
+# --- GeoJSON ---
+
+def _coord(lat, lon):
+    return f"[{round(lon, 6)},{round(lat, 6)}]"
+
+def geojson_chunks(events, trip_info=None):
+    """
+    Streams a FeatureCollection with one LineString feature per source run
+    (a Point for runs of one event). Each feature's properties (source,
+    first and last timestamp, point count) follow its geometry, so they can
+    be written without buffering the run. The trip's info goes in a `trip`
+    foreign member (RFC 7946, section 6.1), since a FeatureCollection has
+    no `properties`.
+    """
+    meta = {k: v for k, v in (trip_info or {}).items() if k != "token"}
+    yield '{"type":"FeatureCollection","trip":' + json.dumps(meta, default=str) + ',"features":['
+    separator = ""
+    run = None   # [source, first coordinate, first timestamp, last timestamp, count]
+    for item in _runs(events):
+        if item is None:
+            if run is not None:
+                # Point features are written whole when their run ends, so they need the separator here
+                yield (separator if run[4] == 1 else "") + _close_feature(run)
+                separator, run = ",", None
+            continue
+        source, lat, lon, ts = item
+        if run is None:
+            run = [source, _coord(lat, lon), ts, ts, 1]
+            continue
+        if run[4] == 1:
+            # A run becomes a LineString once it has a second point
+            yield separator + '{"type":"Feature","geometry":{"type":"LineString","coordinates":[' + run[1]
+            separator = ","
+        yield "," + _coord(lat, lon)
+        run[3], run[4] = ts, run[4] + 1
+    if run is not None:
+        yield (separator if run[4] == 1 else "") + _close_feature(run)
+    yield "]}"
+
+def _close_feature(run):
+    source, first, start, end, count = run
+    props = json.dumps({"source": source, "start": start, "end": end, "points": count})
+    if count == 1:
+        return '{"type":"Feature","geometry":{"type":"Point","coordinates":' + first + '},"properties":' + props + "}"
+    return ']},"properties":' + props + "}"
+
+# --- GPX ---
+
+def gpx_chunks(events, trip_info=None):
+    """Streams GPX 1.1 with one track per source run and the source as the track type."""
+    trip_info = trip_info or {}
+    name = trip_info.get("user_name") or "Trip"
+    if trip_info.get("flight_number"):
+        name = f"{name} ({trip_info['flight_number']})"
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<gpx version="1.1" creator="Project Sanjaya" xmlns="http://www.topografix.com/GPX/1/1">\n'
+           f'<metadata><name>{escape(name, quote=False)}</name></metadata>\n')
+    open_track = False
+    for item in _runs(events):
+        if item is None:
+            if open_track:
+                yield "</trkseg></trk>\n"
+                open_track = False
+            continue
+        source, lat, lon, ts = item
+        if not open_track:
+            yield f"<trk><name>{escape(source or 'track', quote=False)}</name><type>{escape(source, quote=False)}</type><trkseg>\n"
+            open_track = True
+        time_tag = f"<time>{escape(str(ts), quote=False)}</time>" if ts else ""
+        yield f'<trkpt lat="{round(lat, 6)}" lon="{round(lon, 6)}">{time_tag}</trkpt>\n'
+    if open_track:
+        yield "</trkseg></trk>\n"
+    yield "</gpx>\n"
+
+# --- Projection ---
+
+def _mercator(lat, lon):
+    """Web Mercator in [0, 1] x [0, 1], y pointing down like image rows."""
+    lat = max(min(lat, 85.0511), -85.0511)
+    return (lon + 180.0) / 360.0, (1.0 - log(tan(pi / 4 + radians(lat) / 2)) / pi) / 2.0
+
+class _Viewport:
+    """Fits a Mercator bounding box into an image, preserving the aspect ratio."""
+
+    def __init__(self, events, width, height, padding=IMAGE_PADDING):
+        x0 = y0 = float("inf")
+        x1 = y1 = float("-inf")
+        self.count = 0
+        for item in _runs(events):
+            if item is None:
+                continue
+            x, y = _mercator(item[1], item[2])
+            x0, y0, x1, y1 = min(x0, x), min(y0, y), max(x1, x), max(y1, y)
+            self.count += 1
+        self.width, self.height = width, height
+        if not self.count:
+            return
+        min_span = MIN_SPAN_KM / EARTH_CIRCUMFERENCE_KM
+        self.scale = min((width - 2 * padding) / max(x1 - x0, min_span),
+                         (height - 2 * padding) / max(y1 - y0, min_span))
+        self.cx, self.cy = (x0 + x1) / 2, (y0 + y1) / 2
+
+    def project(self, lat, lon):
+        x, y = _mercator(lat, lon)
+        return (self.width / 2 + (x - self.cx) * self.scale,
+                self.height / 2 + (y - self.cy) * self.scale)
+
+def _hex(color):
+    return "#%02x%02x%02x" % color
+
+# --- SVG ---
+
+def svg_chunks(events, width=IMAGE_SIZE[0], height=IMAGE_SIZE[1]):
+    """
+    Streams an SVG of the trip. `events` is read twice (see `as_source`).
+    Consecutive points that land on the same pixel are dropped, so the path
+    is never longer than the image is detailed.
+    """
+    source = as_source(events)
+    view = _Viewport(source(), width, height)
+    yield (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">\n'
+           f'<rect width="100%" height="100%" fill="{_hex(BACKGROUND)}"/>\n')
+    if not view.count:
+        yield "</svg>\n"
+        return
+
+    def path_end(style):
+        dash = f' stroke-dasharray="{style["dash"][0]},{style["dash"][1]}"' if style["dash"] else ""
+        return (f'" fill="none" stroke="{_hex(style["color"])}" stroke-width="{style["width"]}" '
+                f'stroke-linecap="round" stroke-linejoin="round" stroke-opacity="0.9"{dash}/>\n')
+
+    style = first = last = None
+    pending, previous = [], None
+    for item in _runs(source()):
+        if item is None:
+            if style is not None:
+                yield "".join(pending) + path_end(style)
+                pending, style, previous = [], None, None
+            continue
+        src, lat, lon, _ = item
+        point = view.project(lat, lon)
+        first = first or point
+        last = point
+        pixel = (round(point[0], 1), round(point[1], 1))
+        if style is None:
+            style = SOURCE_STYLES.get(src, DEFAULT_STYLE)
+            pending.append(f'<path d="M{pixel[0]},{pixel[1]}')
+        elif pixel != previous:
+            pending.append(f" L{pixel[0]},{pixel[1]}")
+        previous = pixel
+        if len(pending) >= SVG_POINTS_PER_CHUNK:
+            yield "".join(pending)
+            pending = []
+    if style is not None:
+        yield "".join(pending) + path_end(style)
+    for (x, y), color in ((first, START_COLOR), (last, END_COLOR)):
+        yield f'<circle cx="{x:.1f}" cy="{y:.1f}" r="7" fill="{_hex(color)}" stroke="#ffffff" stroke-width="2"/>\n'
+    yield "</svg>\n"
+
+# --- PNG ---
+
+class Canvas:
+    """An RGB framebuffer with thick-line and disc drawing, encoded as PNG with zlib only."""
+
+    def __init__(self, width, height, background=BACKGROUND):
+        self.width, self.height = width, height
+        self.pixels = bytearray(bytes(background) * (width * height))
+
+    def fill_rect(self, x0, y0, x1, y1, color):
+        x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, self.width - 1), min(y1, self.height - 1)
+        if x0 > x1:
+            return
+        span = bytes(color) * (x1 - x0 + 1)
+        for y in range(y0, y1 + 1):
+            start = (y * self.width + x0) * 3
+            self.pixels[start:start + len(span)] = span
+
+    def line(self, x0, y0, x1, y1, color, width=1, dash=None, phase=0):
+        """
+        Bresenham line drawn with a square brush `width` pixels wide. `dash` is
+        (on, off) in pixels, continued from `phase`. Returns the phase at the
+        end of the line, so a dashed polyline keeps its rhythm.
+        """
+        r = max(width // 2, 0)
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+        err = dx + dy
+        period = sum(dash) if dash else 0
+        while True:
+            if not dash or phase % period < dash[0]:
+                self.fill_rect(x0 - r, y0 - r, x0 + r, y0 + r, color)
+            phase += 1
+            if x0 == x1 and y0 == y1:
+                return phase
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+    def disc(self, cx, cy, radius, color):
+        for dy in range(-radius, radius + 1):
+            half = int((radius * radius - dy * dy) ** 0.5)
+            self.fill_rect(cx - half, cy + dy, cx + half, cy + dy, color)
+
+    def png_chunks(self, level=6):
+        """Streams the PNG file: header chunks, then scanlines compressed row by row."""
+        def chunk(kind, data):
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+        yield b"\x89PNG\r\n\x1a\n"
+        yield chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0))
+        compressor = zlib.compressobj(level)
+        stride = self.width * 3
+        for y in range(self.height):
+            # Filter type 0 (none) per scanline
+            data = compressor.compress(b"\x00" + bytes(self.pixels[y * stride:(y + 1) * stride]))
+            if data:
+                yield chunk(b"IDAT", data)
+        yield chunk(b"IDAT", compressor.flush())
+        yield chunk(b"IEND", b"")
+
+def draw_trip(events, width=IMAGE_SIZE[0], height=IMAGE_SIZE[1]):
+    """Draws the trip onto a new `Canvas`. `events` is read twice (see `as_source`)."""
+    source = as_source(events)
+    view = _Viewport(source(), width, height)
+    canvas = Canvas(width, height)
+    if not view.count:
+        return canvas
+    first = last = previous = None
+    style, phase = None, 0
+    for item in _runs(source()):
+        if item is None:
+            previous, phase = None, 0
+            continue
+        src, lat, lon, _ = item
+        x, y = view.project(lat, lon)
+        point = (int(round(x)), int(round(y)))
+        first = first or point
+        last = point
+        if previous is None:
+            style = SOURCE_STYLES.get(src, DEFAULT_STYLE)
+            canvas.fill_rect(point[0], point[1], point[0], point[1], style["color"])
+        elif point != previous:
+            phase = canvas.line(*previous, *point, style["color"], style["width"], style["dash"], phase)
+        previous = point
+    canvas.disc(*first, 8, (255, 255, 255))
+    canvas.disc(*first, 6, START_COLOR)
+    canvas.disc(*last, 8, (255, 255, 255))
+    canvas.disc(*last, 6, END_COLOR)
+    return canvas
+
+def png_chunks(events, width=IMAGE_SIZE[0], height=IMAGE_SIZE[1]):
+    return draw_trip(events, width, height).png_chunks()
+
+# --- Files and Batches ---
+
+def export_chunks(fmt, events, trip_info=None, **kwargs):
+    """Chunks (str, or bytes for PNG) for one format."""
+    if fmt == "geojson":
+        return geojson_chunks(_one_pass(events), trip_info)
+    if fmt == "gpx":
+        return gpx_chunks(_one_pass(events), trip_info)
+    if fmt == "svg":
+        return svg_chunks(events, **kwargs)
+    if fmt == "png":
+        return png_chunks(events, **kwargs)
+    raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+def encode_chunks(chunks):
+    """Chunks as UTF-8 bytes."""
+    for chunk in chunks:
+        yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+def write_chunks(path, chunks):
+    """Writes chunks to a temp file and renames it into place; returns the bytes written."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    written = 0
+    with open(tmp_path, "wb") as f:
+        for data in encode_chunks(chunks):
+            f.write(data)
+            written += len(data)
+    os.replace(tmp_path, path)
+    return written
+
+def export_trip(trip_id, fmt, root=TRIPS_DIR, out_dir=None):
+    """Exports one trip to `<out_dir or trip dir>/<trip_id>.<fmt>` and returns the path."""
+    from jules.trips import trip_info_path
+    if not os.path.isdir(trip_dir(trip_id, root)):
+        raise FileNotFoundError(f"No trip {trip_id!r} under {root}")
+    trip_info = None
+    try:
+        with open(trip_info_path(trip_id, root), "r") as f:
+            trip_info = json.load(f)
+    except (OSError, ValueError):
+        pass
+    path = os.path.join(out_dir or trip_dir(trip_id, root), f"{trip_id}.{fmt}")
+    write_chunks(path, export_chunks(fmt, trip_event_source(trip_id, root), trip_info))
+    return path
+
+def export_many(trip_ids, formats=tuple(FORMATS), root=TRIPS_DIR, out_dir=None, workers=None):
+    """
+    Exports every (trip, format) pair in a process pool, since rasterizing is
+    CPU-bound. Returns {(trip_id, fmt): path or exception}; one failed export
+    doesn't stop the others.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(export_trip, trip_id, fmt, root, out_dir): (trip_id, fmt)
+                   for trip_id in trip_ids for fmt in formats}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+    return results
+
+def list_trip_ids(root=TRIPS_DIR):
+    if not os.path.isdir(root):
+        return []
+    return sorted(t for t in os.listdir(root) if _TRIP_ID_RE.match(t) and os.path.isdir(os.path.join(root, t)))
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Export trips as GeoJSON, GPX, SVG or PNG without a browser.")
+    parser.add_argument("trip_ids", nargs="*")
+    parser.add_argument("--all", action="store_true", help="Export every trip under --root")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=list(FORMATS))
+    parser.add_argument("--root", default=TRIPS_DIR)
+    parser.add_argument("--out", help="Output directory (default: each trip's own directory)")
+    parser.add_argument("--workers", type=int, help="Export processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    trip_ids = list_trip_ids(args.root) if args.all else args.trip_ids
+    if not trip_ids:
+        parser.error("give trip IDs or --all")
+    failures = 0
+    for (trip_id, fmt), result in sorted(export_many(trip_ids, args.formats, args.root, args.out, args.workers).items()):
+        if isinstance(result, Exception):
+            failures += 1
+            print(f"FAILED {trip_id} {fmt}: {result}")
+        else:
+            print(f"{trip_id} {fmt}: {result}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
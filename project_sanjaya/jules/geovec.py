@@ -0,0 +1,91 @@
+"""
+Vectorized NumPy counterparts of the distance helpers in `jules.utils`.
+
+`jules.utils.haversine_distance` remains the scalar reference implementation;
+every function here agrees with it to floating-point tolerance but operates on
+whole arrays of coordinates at once.
+"""
+from datetime import datetime
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371  # Same radius as jules.utils.haversine_distance
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """Element-wise (broadcasting) haversine distance in kilometers."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def pairwise_distances(lats, lons, other_lats=None, other_lons=None):
+    """
+    Returns an (N, M) matrix of distances between two point sets, or (N, N)
+    between every pair of points in one set.
+    """
+    lats, lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+    if other_lats is None:
+        other_lats, other_lons = lats, lons
+    other_lats, other_lons = np.asarray(other_lats, dtype=np.float64), np.asarray(other_lons, dtype=np.float64)
+    return haversine_np(lats[:, None], lons[:, None], other_lats[None, :], other_lons[None, :])
+
+def segment_distances(lats, lons):
+    """Distances between consecutive points; length N-1."""
+    lats, lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+    if lats.size < 2:
+        return np.zeros(0)
+    return haversine_np(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+def to_epoch_seconds(timestamps):
+    """
+    Converts ISO-8601 strings (or numbers) to a float64 array of epoch
+    seconds. Missing or unparseable timestamps become NaN, so the segments
+    next to them get a NaN speed.
+    """
+    out = np.empty(len(timestamps), dtype=np.float64)
+    for i, ts in enumerate(timestamps):
+        try:
+            if isinstance(ts, str):
+                out[i] = datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+            else:
+                out[i] = np.nan if ts is None else ts
+        except (TypeError, ValueError):
+            out[i] = np.nan
+    return out
+
+def segment_speeds(lats, lons, timestamps, distances=None):
+    """
+    Per-segment speed in km/h. Segments with a non-positive or unknown time
+    delta get NaN.
+    """
+    if distances is None:
+        distances = segment_distances(lats, lons)
+    seconds = to_epoch_seconds(timestamps)
+    dt = np.diff(seconds)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(dt > 0, distances / (dt / 3600.0), np.nan)
+
+def trip_metrics(lats, lons, timestamps=None):
+    """
+    Computes segment distances, cumulative distance, total length and (if
+    timestamps are given) per-segment speeds in a single pass over the arrays.
+    """
+    distances = segment_distances(lats, lons)
+    metrics = {
+        "segment_km": distances,
+        "cumulative_km": np.concatenate(([0.0], np.cumsum(distances))) if len(lats) else np.zeros(0),
+        "total_km": float(distances.sum()),
+    }
+    if timestamps is not None:
+        metrics["speed_kmh"] = segment_speeds(lats, lons, timestamps, distances=distances)
+    return metrics
+
+def events_to_arrays(events):
+    """Splits an iterable of event dicts into (lats, lons, timestamps) arrays."""
+    lats, lons, timestamps = [], [], []
+    for e in events:
+        lats.append(e["lat"])
+        lons.append(e["lon"])
+        timestamps.append(e.get("timestamp"))
+    return np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64), timestamps
@@ -0,0 +1,59 @@
+"""
+Structured logging for the tracker processes.
+
+`setup_logging()` routes the root logger through a `QueueHandler`, so a log
+call only enqueues a record; a `QueueListener` thread formats each record as
+one JSON line and writes it out. Request threads never block on a slow or
+full stdout.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.environ.get("SANJAYA_LOG_LEVEL", "INFO")
+
+# Attributes every LogRecord has; anything else was passed with `extra=` and is emitted as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+_listener = None
+
+def setup_logging(level=LOG_LEVEL, stream=None):
+    """Installs the queued JSON handler on the root logger (once per process)."""
+    global _listener
+    if _listener is not None:
+        return _listener
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+    return _listener
@@ -1,23 +1,50 @@
-import folium
 import os
-from playwright.sync_api import sync_playwright
+
+from jules.metrics import MAP_RENDER_SECONDS
+from jules.trajectory import fit_zoom, polyline_cache, simplify_path
 
 MAP_HTML_PATH = "logs/temp_trip_map.html"
 MAP_IMAGE_PATH = "logs/final_trip_map.png"
 
-def generate_trip_map(events):
+def generate_trip_map(events, trip_id=None, html_path=MAP_HTML_PATH, tiles=None, attr=None):
     """
     Generates a Folium map from trip events and saves it as an HTML file.
+    `events` may be any iterable, e.g. `EventLog.iter_events()`; it is consumed in one pass.
+    Paths are simplified for the fitted zoom level (and cached per `trip_id` when given).
+    `tiles`/`attr` override the default OpenStreetMap tile layer, e.g. with a local tile server.
     """
-    if not events:
-        return None
+    with MAP_RENDER_SECONDS.time(stage="build"):
+        return _build_trip_map(events, trip_id, html_path, tiles, attr)
 
+def _build_trip_map(events, trip_id, html_path, tiles, attr):
     # Separate ground and flight coordinates
-    ground_coords = [(e['lat'], e['lon']) for e in events if e.get('source') == 'web']
-    flight_coords = [(e['lat'], e['lon']) for e in events if e.get('source') == 'flight']
+    ground_coords, flight_coords = [], []
+    first = last = None
+    for e in events:
+        if first is None:
+            first = e
+        last = e
+        if e.get('source') == 'web':
+            ground_coords.append((e['lat'], e['lon']))
+        elif e.get('source') == 'flight':
+            flight_coords.append((e['lat'], e['lon']))
+
+    if first is None:
+        return None
+
+    zoom = fit_zoom(ground_coords + flight_coords)
+    if trip_id is not None:
+        ground_coords = polyline_cache.get(trip_id, "ground", ground_coords, zoom)
+        flight_coords = polyline_cache.get(trip_id, "flight", flight_coords, zoom)
+    else:
+        ground_coords = simplify_path(ground_coords, zoom)
+        flight_coords = simplify_path(flight_coords, zoom)
+
+    # folium pulls in pandas; import it on first render so the backend starts quickly
+    import folium
 
     # Create map centered on the last known point
-    m = folium.Map(location=(events[-1]['lat'], events[-1]['lon']), zoom_start=6)
+    m = folium.Map(location=(last['lat'], last['lon']), zoom_start=6, tiles=tiles or "OpenStreetMap", attr=attr)
 
     # Add ground path
     if ground_coords:
@@ -28,35 +55,24 @@ def generate_trip_map(events):
         folium.PolyLine(flight_coords, color="#f39c12", weight=4, opacity=0.9, dash_array='10, 5', popup="Flight Path").add_to(m)
 
     # Add markers for start and end
-    folium.Marker(location=(events[0]['lat'], events[0]['lon']), popup="Trip Start", icon=folium.Icon(color='green', icon='play')).add_to(m)
-    folium.Marker(location=(events[-1]['lat'], events[-1]['lon']), popup="Trip End", icon=folium.Icon(color='red', icon='stop')).add_to(m)
+    folium.Marker(location=(first['lat'], first['lon']), popup="Trip Start", icon=folium.Icon(color='green', icon='play')).add_to(m)
+    folium.Marker(location=(last['lat'], last['lon']), popup="Trip End", icon=folium.Icon(color='red', icon='stop')).add_to(m)
 
     # Auto-fit map bounds
     bounds = m.get_bounds()
     m.fit_bounds(bounds, padding=(50, 50))
 
-    m.save(MAP_HTML_PATH)
-    return MAP_HTML_PATH
+    m.save(html_path)
+    return html_path
 
-def capture_map_screenshot(html_path):
+def capture_map_screenshot(html_path, image_path=MAP_IMAGE_PATH):
     """
-    Uses Playwright to take a screenshot of the generated map HTML file.
+    Takes a screenshot of the generated map HTML file using the shared, warm
+    browser pool in `jules.renderer`. Blocks until the image is written; use
+    `render_service.submit()` directly to render in the background.
     """
     if not html_path or not os.path.exists(html_path):
         return None
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        page = browser.new_page()
-        # The path must be converted to a file URI
-        page.goto(f"file://{os.path.abspath(html_path)}")
-        # Wait for the map tiles to load
-        page.wait_for_timeout(5000)
-        page.screenshot(path=MAP_IMAGE_PATH, full_page=True)
-        browser.close()
-
-    # Clean up the temporary HTML file
-    os.remove(html_path)
-
-    print(f"Map image saved to {MAP_IMAGE_PATH}")
-    return MAP_IMAGE_PATH
\ No newline at end of file
+    from jules.renderer import render_service
+    return render_service.submit(html_path, image_path).result()
@@ -0,0 +1,227 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are plain Python objects guarded by one small
+lock each, so recording a sample costs a dict lookup and a few additions. The
+backend exposes everything registered here on `/metrics`.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Request latencies are mostly sub-millisecond, map renders take seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if not labels and not self.label_names:
+            return ()
+        try:
+            key = tuple([labels[n] for n in self.label_names])
+        except KeyError:
+            key = None
+        if key is None or len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return key
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, label_values, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.label_names, label_values, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """Monotonically increasing count. By convention the name ends in `_total`."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def labels(self, **labels):
+        """A pre-bound child for hot paths, skipping label lookup on every increment."""
+        return _BoundCounter(self, self._key(labels))
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [("", key, (), value) for key, value in items]
+
+class _BoundCounter:
+    def __init__(self, parent, key):
+        self._parent = parent
+        self._key = key
+
+    def inc(self, amount=1):
+        parent = self._parent
+        with parent._lock:
+            parent._values[self._key] = parent._values.get(self._key, 0) + amount
+
+class Gauge(_Metric):
+    """
+    A value that can go up and down. `set_function()` makes the gauge read its
+    value when scraped instead, for things like file sizes that are cheaper to
+    measure on demand than to track.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """`function()` returns a number, or a dict of label-value tuples to numbers for labelled gauges."""
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            result = self._function()
+            items = sorted(result.items()) if isinstance(result, dict) else [((), result)]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [("", key, (), value) for key, value in items]
+
+class Histogram(_Metric):
+    """Cumulative bucketed distribution of observed values (seconds, by convention)."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[2] if entry else 0
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(e[0]), e[1], e[2])) for key, e in self._values.items())
+        samples = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                samples.append(("_bucket", key, (("le", _format_value(bound)),), cumulative))
+            samples.append(("_sum", key, (), total))
+            samples.append(("_count", key, (), count))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labels, buckets)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+registry = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Shared Metrics ---
+
+REQUEST_SECONDS = registry.histogram("sanjaya_http_request_duration_seconds", "Time spent handling HTTP requests.",
+                                     labels=("method", "route", "status"))
+REQUESTS_IN_PROGRESS = registry.gauge("sanjaya_http_requests_in_progress", "HTTP requests currently being handled.")
+LOCK_WAIT_SECONDS = registry.histogram("sanjaya_lock_wait_seconds", "Time spent waiting to acquire shared locks.",
+                                       labels=("lock",))
+IO_SECONDS = registry.histogram("sanjaya_io_seconds", "Time spent in file writes and fsyncs.", labels=("op",))
+EVENT_LOG_APPENDED_BYTES = registry.counter("sanjaya_event_log_appended_bytes_total", "Bytes appended to trip event logs.")
+EVENT_LOG_BYTES = registry.gauge("sanjaya_event_log_bytes", "Current size of active trips' event logs.")
+MAP_RENDER_SECONDS = registry.histogram("sanjaya_map_render_seconds", "Final map rendering time by stage.",
+                                        labels=("stage",))
+AIRPORT_LOOKUPS = registry.counter("sanjaya_airport_lookups_total", "Airport geofence lookups.", labels=("result",))
+AIRPORT_RELOAD_SECONDS = registry.histogram("sanjaya_airport_registry_reload_seconds", "Time to reload airports.json.")
+
+@contextmanager
+def timed_lock(lock, name):
+    """Acquires `lock`, recording how long the acquisition waited."""
+    start = time.perf_counter()
+    with lock:
+        LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, lock=name)
+        yield
@@ -0,0 +1,40 @@
+"""
+Readiness probes for the launcher and the startup benchmark.
+
+A service counts as ready once its health URL answers 200. Probing stops
+early if the service's process has already exited, so a crash at startup is
+reported straight away instead of after the full timeout.
+"""
+import time
+import urllib.error
+import urllib.request
+
+PROBE_INTERVAL = 0.05
+PROBE_REQUEST_TIMEOUT = 1.0
+READY_TIMEOUT = 60.0
+
+class ServiceNotReady(RuntimeError):
+    pass
+
+def probe(url, timeout=PROBE_REQUEST_TIMEOUT):
+    """True if `url` answers 200 right now."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return resp.status == 200
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+
+def wait_until_ready(url, process=None, timeout=READY_TIMEOUT, interval=PROBE_INTERVAL):
+    """
+    Polls `url` until it answers 200 and returns the seconds waited. Raises
+    `ServiceNotReady` if `process` (a `Popen`) exits first or `timeout` passes.
+    """
+    start = time.monotonic()
+    while True:
+        if probe(url):
+            return time.monotonic() - start
+        if process is not None and process.poll() is not None:
+            raise ServiceNotReady(f"process exited with code {process.returncode} before {url} was ready")
+        if time.monotonic() - start > timeout:
+            raise ServiceNotReady(f"{url} not ready after {timeout:.0f}s")
+        time.sleep(interval)
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import os
+import threading
+import uuid
+from urllib.parse import urlsplit
+
+from jules.eventlog import EventLog
+from jules.metrics import MAP_RENDER_SECONDS
+
+PAGE_POOL_SIZE = 2
+VIEWPORT = {"width": 1280, "height": 800}
+TILE_TIMEOUT_MS = 10000
+# Folium's Leaflet, Bootstrap and icon assets (and the fonts their CSS pulls in) come from these CDNs
+ASSET_HOSTS = ("cdn.jsdelivr.net", "code.jquery.com", "cdnjs.cloudflare.com", "netdna.bootstrapcdn.com")
+MAP_ASSETS_DIR = os.path.join(os.path.dirname(__file__), '..', 'logs', 'map_assets')
+
+log = logging.getLogger(__name__)
+
+# Resolves once the map has a tile layer and every tile image in it has finished loading
+TILES_LOADED_JS = """() => {
+    if (!document.querySelector('.leaflet-tile-container')) return false;
+    const tiles = Array.from(document.querySelectorAll('img.leaflet-tile'));
+    return tiles.length > 0 && tiles.every(t => t.complete);
+}"""
+
+def asset_path(url, root=MAP_ASSETS_DIR):
+    """Where a CDN asset is kept locally, e.g. `<root>/cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js`."""
+    parts = urlsplit(url)
+    segments = [s for s in parts.path.split("/") if s not in ("", ".", "..")]
+    return os.path.join(root, parts.hostname or "", *segments)
+
+class MapRenderService:
+    """
+    Renders map HTML files to PNG using a warm headless Chromium.
+
+    A dedicated thread runs an asyncio loop that owns one browser and a pool
+    of reusable pages, so each render only navigates an existing page instead
+    of launching a browser. Screenshots are taken as soon as the map's tiles
+    have loaded rather than after a fixed delay. Jobs are queued with
+    `submit()`/`submit_trip()`, which return immediately with a
+    `concurrent.futures.Future`.
+
+    Requests for Folium's CDN assets are answered from `assets_dir`. Missing
+    files are downloaded once and kept there, so after the first render (or
+    with a copied `logs/map_assets`) maps render without reaching the CDNs.
+    """
+
+    def __init__(self, pool_size=PAGE_POOL_SIZE, tile_timeout_ms=TILE_TIMEOUT_MS, assets_dir=MAP_ASSETS_DIR):
+        self.pool_size = pool_size
+        self.tile_timeout_ms = tile_timeout_ms
+        self.assets_dir = assets_dir
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._start_lock = threading.Lock()
+        self._playwright = None
+        self._browser = None
+        self._idle = []           # (browser, page) pairs ready for reuse
+        self._slots = None        # Bounds the pages in use to `pool_size`
+        self._browser_lock = None
+
+    # --- Lifecycle ---
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run_loop, daemon=True, name="map-renderer")
+                self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _ensure_browser(self):
+        if self._browser_lock is None:
+            self._browser_lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(self.pool_size)
+        async with self._browser_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            from playwright.async_api import async_playwright
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch()
+            # Pages of a previous browser are dropped when they come back, see _release_page()
+            self._idle = []
+
+    def stop(self):
+        if self._loop is None:
+            return
+        async def shutdown():
+            self._idle = []
+            if self._browser is not None:
+                await self._browser.close()
+            if self._playwright is not None:
+                await self._playwright.stop()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # --- Page Pool ---
+
+    async def _acquire_page(self):
+        """Waits for a free slot and returns a (browser, page) pair for the current browser."""
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                browser, page = self._idle.pop()
+                if self._usable(browser, page):
+                    return browser, page
+                await self._discard(page)
+            browser = self._browser
+            page = await browser.new_page(viewport=VIEWPORT)
+            await page.route(lambda url: urlsplit(url).hostname in ASSET_HOSTS, self._serve_asset)
+            return browser, page
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _release_page(self, browser, page, healthy):
+        """Pools a page that rendered cleanly; closes any other (failed, or from a replaced browser)."""
+        try:
+            if healthy and self._usable(browser, page):
+                self._idle.append((browser, page))
+            else:
+                await self._discard(page)
+        finally:
+            self._slots.release()
+
+    def _usable(self, browser, page):
+        return browser is self._browser and browser.is_connected() and not page.is_closed()
+
+    @staticmethod
+    async def _discard(page):
+        try:
+            await page.close()
+        except Exception:
+            log.debug("Closing a render page failed", exc_info=True)
+
+    async def _serve_asset(self, route):
+        """Answers a CDN asset request from the local copy, downloading it the first time."""
+        url = route.request.url
+        path = asset_path(url, self.assets_dir)
+        if os.path.isfile(path):
+            await route.fulfill(path=path)
+            return
+        try:
+            response = await route.fetch()
+            body = await response.body()
+        except Exception:
+            log.warning("Map asset unavailable", extra={"url": url})
+            await route.abort()
+            return
+        if response.ok:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        await route.fulfill(response=response, body=body)
+
+    # --- Jobs ---
+
+    async def _screenshot(self, html_path, image_path):
+        with MAP_RENDER_SECONDS.time(stage="browser_start"):
+            await self._ensure_browser()
+        browser, page = await self._acquire_page()
+        healthy = False
+        try:
+            await page.goto(f"file://{os.path.abspath(html_path)}", wait_until="domcontentloaded")
+            try:
+                with MAP_RENDER_SECONDS.time(stage="tiles"):
+                    await page.wait_for_function(TILES_LOADED_JS, timeout=self.tile_timeout_ms)
+            except Exception:
+                log.warning("Tiles did not finish loading; capturing anyway", extra={"html_path": html_path})
+            with MAP_RENDER_SECONDS.time(stage="screenshot"):
+                await page.screenshot(path=image_path, full_page=True)
+            healthy = True
+        finally:
+            # A page that failed mid-render is in an unknown state; the next job opens a fresh one
+            await self._release_page(browser, page, healthy)
+        return image_path
+
+    def submit(self, html_path, image_path, remove_html=True):
+        """Queues a screenshot of `html_path`; the future resolves to `image_path`."""
+        async def job():
+            try:
+                return await self._screenshot(html_path, image_path)
+            finally:
+                if remove_html and os.path.exists(html_path):
+                    os.remove(html_path)
+        self.start()
+        return asyncio.run_coroutine_threadsafe(job(), self._loop)
+
+    def submit_trip(self, trip_id, events_path, image_path, tiles=None, attr=None):
+        """Queues building and capturing the final map for a trip from its event log."""
+        # Unique per job so overlapping renders of the same trip don't share a file
+        html_path = f"{os.path.splitext(image_path)[0]}.{uuid.uuid4().hex[:8]}.html"
+        # Map building needs folium and numpy; load them with the first render, not with the backend
+        from jules.maps import generate_trip_map
+        async def job():
+            loop = asyncio.get_running_loop()
+            built = await loop.run_in_executor(
+                None, lambda: generate_trip_map(EventLog(events_path).iter_events(), trip_id, html_path=html_path, tiles=tiles, attr=attr)
+            )
+            if built is None:
+                return None
+            try:
+                path = await self._screenshot(built, image_path)
+                log.info("Map image saved", extra={"trip_id": trip_id, "image_path": path})
+                return path
+            finally:
+                if os.path.exists(built):
+                    os.remove(built)
+        self.start()
+        return asyncio.run_coroutine_threadsafe(job(), self._loop)
+
+render_service = MapRenderService()
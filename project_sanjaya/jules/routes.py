@@ -0,0 +1,142 @@
+"""
+Great-circle flight routes and estimated in-flight positions.
+
+Routes are computed by spherical linear interpolation (slerp) between the two
+airports' unit vectors, so the polyline follows the shortest path over the
+globe rather than a straight line on the Mercator map. Geometry is cached per
+airport pair; position estimates are vectorized over any number of flights.
+"""
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+from jules.geovec import haversine_np
+from jules.utils import get_airport_coords
+
+ROUTE_STEP_KM = 25        # Target spacing between route vertices
+ROUTE_MAX_POINTS = 256
+ROUTE_CACHE_SIZE = 512
+
+# --- Geometry ---
+
+def _unit_vectors(lats, lons):
+    lats, lons = np.radians(lats), np.radians(lons)
+    cos_lat = np.cos(lats)
+    return np.stack([cos_lat * np.cos(lons), cos_lat * np.sin(lons), np.sin(lats)], axis=-1)
+
+def _to_latlon(vectors):
+    x, y, z = vectors[..., 0], vectors[..., 1], vectors[..., 2]
+    return np.degrees(np.arctan2(z, np.hypot(x, y))), np.degrees(np.arctan2(y, x))
+
+def interpolate_great_circle(lat1, lon1, lat2, lon2, fractions):
+    """
+    Points at `fractions` (0 = start, 1 = end) of the way along the great
+    circles from (lat1, lon1) to (lat2, lon2). All arguments broadcast, so one
+    call can place many flights at once or sample many points on one route.
+    Returns (lats, lons) arrays.
+    """
+    start = _unit_vectors(np.asarray(lat1, dtype=np.float64), np.asarray(lon1, dtype=np.float64))
+    end = _unit_vectors(np.asarray(lat2, dtype=np.float64), np.asarray(lon2, dtype=np.float64))
+    t = np.asarray(fractions, dtype=np.float64)[..., None]
+    omega = np.arccos(np.clip(np.sum(start * end, axis=-1, keepdims=True), -1.0, 1.0))
+    sin_omega = np.sin(omega)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = np.where(sin_omega > 1e-12, np.sin((1 - t) * omega) / sin_omega, 1 - t)
+        b = np.where(sin_omega > 1e-12, np.sin(t * omega) / sin_omega, t)
+    return _to_latlon(a * start + b * end)
+
+def great_circle(lat1, lon1, lat2, lon2, points=None):
+    """Polyline [(lat, lon), ...] along the great circle between two points."""
+    if points is None:
+        distance = float(haversine_np(lat1, lon1, lat2, lon2))
+        points = int(min(max(distance // ROUTE_STEP_KM + 1, 2), ROUTE_MAX_POINTS))
+    lats, lons = interpolate_great_circle(lat1, lon1, lat2, lon2, np.linspace(0.0, 1.0, points))
+    return list(zip(lats.tolist(), lons.tolist()))
+
+def split_at_antimeridian(polyline):
+    """
+    Splits a [(lat, lon), ...] polyline wherever it crosses ±180°, so Leaflet
+    doesn't draw the crossing as a line across the whole map. Returns a list of
+    polylines; both sides of each break end on the antimeridian.
+    """
+    polyline = [tuple(p) for p in polyline]
+    lons = np.array([lon for _, lon in polyline], dtype=np.float64)
+    segments, start = [], 0
+    for i in np.flatnonzero(np.abs(np.diff(lons)) > 180).tolist():
+        (lat1, lon1), (lat2, lon2) = polyline[i], polyline[i + 1]
+        edge = 180.0 if lon1 > 0 else -180.0
+        lon2 += 2 * edge  # Unwrap so the crossing is a short step
+        lat = lat1 + (lat2 - lat1) * (edge - lon1) / (lon2 - lon1)
+        segments.append(polyline[start:i + 1] + [(lat, edge)])
+        polyline[i] = (lat, -edge)  # Start of the next piece
+        start = i
+    segments.append(polyline[start:])
+    return segments
+
+# --- Route Cache ---
+
+@lru_cache(maxsize=ROUTE_CACHE_SIZE)
+def _cached_route(lat1, lon1, lat2, lon2):
+    return tuple(great_circle(lat1, lon1, lat2, lon2))
+
+def route_between(departure_iata, arrival_iata):
+    """
+    Cached great-circle polyline between two airports, or None if either code
+    is unknown. The cache is keyed on coordinates, so edits to `airports.json`
+    are picked up without serving stale geometry.
+    """
+    start = get_airport_coords(departure_iata) if departure_iata else None
+    end = get_airport_coords(arrival_iata) if arrival_iata else None
+    if start is None or end is None:
+        return None
+    return list(_cached_route(*start, *end))
+
+def flight_route(flight_info):
+    return route_between((flight_info or {}).get("departure_iata"), (flight_info or {}).get("arrival_iata"))
+
+# --- Position Estimates ---
+
+def _epoch(ts):
+    try:
+        return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return np.nan
+
+def flight_progress(departures, arrivals, now):
+    """Fraction of each flight elapsed at `now` (epoch seconds), clipped to [0, 1]; NaN if unknown."""
+    departures, arrivals = np.asarray(departures, dtype=np.float64), np.asarray(arrivals, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        progress = (now - departures) / (arrivals - departures)
+    return np.where(arrivals > departures, np.clip(progress, 0.0, 1.0), np.nan)
+
+def estimate_positions(flights, now):
+    """
+    Estimated positions for many flights at once. `flights` is a sequence of
+    `flight_info` dicts and `now` a datetime or epoch seconds. Returns a list
+    with (lat, lon, progress) per flight, or None where the airports or
+    schedule are unknown.
+    """
+    now = now.timestamp() if isinstance(now, datetime) else float(now)
+    n = len(flights)
+    ends = np.full((n, 4), np.nan)
+    departures, arrivals = np.full(n, np.nan), np.full(n, np.nan)
+    for i, info in enumerate(flights):
+        start = get_airport_coords(info.get("departure_iata")) if info.get("departure_iata") else None
+        end = get_airport_coords(info.get("arrival_iata")) if info.get("arrival_iata") else None
+        if start is not None and end is not None:
+            ends[i] = (*start, *end)
+        departures[i] = _epoch(info.get("scheduled_departure"))
+        arrivals[i] = _epoch(info.get("scheduled_arrival"))
+
+    progress = flight_progress(departures, arrivals, now)
+    lats, lons = interpolate_great_circle(ends[:, 0], ends[:, 1], ends[:, 2], ends[:, 3], np.nan_to_num(progress))
+    valid = ~(np.isnan(progress) | np.isnan(ends).any(axis=1))
+    return [
+        (lat, lon, p) if ok else None
+        for lat, lon, p, ok in zip(lats.tolist(), lons.tolist(), progress.tolist(), valid.tolist())
+    ]
+
+def estimate_position(flight_info, now):
+    """Estimated (lat, lon, progress) for one flight, or None."""
+    return estimate_positions([flight_info or {}], now)[0]
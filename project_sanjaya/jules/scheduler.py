@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+BOARDING_OFFSET = timedelta(minutes=45)
+MAX_SLEEP_SECONDS = 3600  # Re-check at least hourly in case the wall clock jumps
+COMPACT_MIN_ENTRIES = 64  # The heap is rebuilt once dead entries outnumber live ones past this size
+
+log = logging.getLogger(__name__)
+
+def _transition_times(flight_info):
+    dep_time = datetime.fromisoformat(flight_info['scheduled_departure'])
+    arr_time = datetime.fromisoformat(flight_info['scheduled_arrival'])
+    return dep_time - BOARDING_OFFSET, dep_time, arr_time
+
+def flight_status_at(flight_info, now):
+    """Returns the flight status implied by the schedule at `now`."""
+    boarding_time, dep_time, arr_time = _transition_times(flight_info)
+    if boarding_time <= now < dep_time:
+        return 'boarding'
+    if dep_time <= now < arr_time:
+        return 'in_flight'
+    if now >= arr_time:
+        return 'landed'
+    return flight_info.get('status', 'scheduled')
+
+def next_transition(flight_info, now):
+    """Returns the next boarding/departure/arrival time after `now`, or None once landed."""
+    for when in _transition_times(flight_info):
+        if when > now:
+            return when
+    return None
+
+class StatusScheduler:
+    """
+    Single-thread timer wheel for schedule-driven flight status changes.
+
+    Each trip has at most one pending timer in a heap, set to its next
+    transition time. The thread sleeps until the earliest timer is due, calls
+    `apply(trip_id)` (which updates the status and returns the trip's current
+    `flight_info`, or None if it no longer needs tracking) and re-arms the
+    trip's timer for the following transition. Replaced and cancelled timers
+    stay in the heap as dead entries until they surface or the heap is
+    compacted, and only trips with a live timer are tracked.
+    """
+
+    def __init__(self, apply):
+        self.apply = apply
+        self._cond = threading.Condition()
+        self._heap = []             # (due epoch seconds, seq, trip_id, generation)
+        self._generations = {}      # trip_id -> generation of its live timer (trips with one only)
+        self._seq = itertools.count()  # Also numbers generations, so a stale entry never matches again
+        self._thread = None
+
+    def schedule(self, trip_id, flight_info, now=None):
+        """(Re)arms the trip's timer from its flight schedule; replaces any pending timer."""
+        now = now or datetime.now(timezone.utc)
+        try:
+            # A transition already passed (e.g. after a restart) fires immediately
+            due = now if flight_status_at(flight_info, now) != flight_info.get('status') else next_transition(flight_info, now)
+        except (KeyError, TypeError, ValueError):
+            due = None
+        with self._cond:
+            if due is None:
+                self._generations.pop(trip_id, None)
+            else:
+                seq = next(self._seq)
+                self._generations[trip_id] = seq
+                heapq.heappush(self._heap, (due.timestamp(), seq, trip_id, seq))
+                self._cond.notify()
+            self._maybe_compact()
+
+    def cancel(self, trip_id):
+        with self._cond:
+            # Without a generation to match, any queued timer is a no-op
+            self._generations.pop(trip_id, None)
+            self._maybe_compact()
+
+    def clear(self):
+        """Drops every timer, e.g. when another process has taken over scheduling."""
+        with self._cond:
+            self._generations.clear()
+            self._heap.clear()
+
+    def _maybe_compact(self):
+        """Rebuilds the heap from live timers once most entries are dead. Must be called with the lock held."""
+        if len(self._heap) > max(COMPACT_MIN_ENTRIES, 2 * len(self._generations)):
+            self._heap = [e for e in self._heap if self._generations.get(e[2]) == e[3]]
+            heapq.heapify(self._heap)
+
+    def pending(self):
+        """Number of trips with a live timer."""
+        with self._cond:
+            return len(self._generations)
+
+    def _next_due(self):
+        """Blocks until a live timer is due and returns its trip ID."""
+        with self._cond:
+            while True:
+                while self._heap and self._generations.get(self._heap[0][2]) != self._heap[0][3]:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay <= 0:
+                    _, _, trip_id, _ = heapq.heappop(self._heap)
+                    # run() re-arms the trip if it still needs tracking
+                    del self._generations[trip_id]
+                    return trip_id
+                self._cond.wait(timeout=min(delay, MAX_SLEEP_SECONDS))
+
+    def run(self):
+        while True:
+            trip_id = self._next_due()
+            try:
+                flight_info = self.apply(trip_id)
+            except Exception:
+                log.exception("Status update failed", extra={"trip_id": trip_id})
+                continue
+            if flight_info is not None:
+                self.schedule(trip_id, flight_info)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, daemon=True, name="status-scheduler")
+            self._thread.start()
+        return self
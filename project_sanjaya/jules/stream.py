@@ -0,0 +1,166 @@
+import json
+import logging
+import threading
+import time
+
+KEEPALIVE_SECONDS = 15
+POLL_SECONDS = 0.25  # How often SharedChangeNotifier checks for writes from other processes
+
+log = logging.getLogger(__name__)
+
+# --- Server Side ---
+
+class ChangeNotifier:
+    """
+    Wakes streaming responses when new data is available.
+    Every call to `notify()` bumps a version number; waiters block until the
+    version moves past the one they last saw, or the timeout expires.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.version = 0
+
+    def notify(self):
+        with self._cond:
+            self.version += 1
+            self._cond.notify_all()
+
+    def wait(self, seen_version, timeout=KEEPALIVE_SECONDS):
+        """Returns the current version once it differs from `seen_version` (or on timeout)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != seen_version, timeout=timeout)
+            return self.version
+
+class SharedChangeNotifier(ChangeNotifier):
+    """
+    `ChangeNotifier` for worker processes sharing one store. The version is
+    the store's change counter (`read_version()`), so writes from any process
+    wake every stream: writes in this process at once, others' within
+    `poll_interval` seconds.
+    """
+
+    def __init__(self, read_version, poll_interval=POLL_SECONDS):
+        super().__init__()
+        self.read_version = read_version
+        self.poll_interval = poll_interval
+        self.version = read_version()
+
+    def notify(self):
+        # The write has already bumped the shared counter; just wake local waiters to re-read it
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, seen_version, timeout=KEEPALIVE_SECONDS):
+        deadline = time.monotonic() + timeout
+        while True:
+            self.version = self.read_version()
+            remaining = deadline - time.monotonic()
+            if self.version != seen_version or remaining <= 0:
+                return self.version
+            with self._cond:
+                self._cond.wait(timeout=min(self.poll_interval, remaining))
+
+def format_sse(data, event=None, event_id=None):
+    """Serializes one Server-Sent Events message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+# --- Client Side ---
+
+class StreamFollower:
+    """
+    Background consumer of the backend's `/stream` endpoint.
+
+    Keeps an in-memory copy of the trip's events and latest status, reconnects
+    with the last cursor after a dropped connection, and bumps `version` only
+    when something actually changed so callers can skip redundant redraws.
+    Once the server closes the stream of an ended or deleted trip, the
+    follower stops and sets `finished`.
+    """
+
+    def __init__(self, url, retry_seconds=3):
+        self.url = url
+        self.retry_seconds = retry_seconds
+        self.events = []
+        self.status = {}
+        self.cursor = 0
+        self.version = 0
+        self.generation = 0  # Bumped whenever the event list is cleared
+        self.connected = False
+        self.finished = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def snapshot(self):
+        """Returns (version, events, status) consistently."""
+        with self._lock:
+            return self.version, list(self.events), dict(self.status)
+
+    def events_since(self, count):
+        """Returns (generation, events received after the first `count`) without copying the rest."""
+        with self._lock:
+            return self.generation, self.events[count:]
+
+    def _apply(self, event, data):
+        with self._lock:
+            if event == "locations":
+                if data.get("reset"):
+                    self.events = []
+                    self.generation += 1
+                self.events.extend(data.get("events", []))
+                self.cursor = data.get("cursor", self.cursor)
+            elif event == "status":
+                if data.get("trip_status") == "none":
+                    self.events = []
+                    self.generation += 1
+                    self.cursor = 0
+                self.status = data
+            else:
+                return
+            self.version += 1
+
+    def _run(self):
+        import requests
+        while True:
+            try:
+                headers = {"Accept": "text/event-stream", "Last-Event-ID": str(self.cursor)}
+                with requests.get(self.url, headers=headers, stream=True, timeout=(5, KEEPALIVE_SECONDS * 2)) as resp:
+                    if resp.status_code == 503:
+                        # The backend is at its stream limit; come back when it says to
+                        log.warning("Stream refused: server busy")
+                        time.sleep(float(resp.headers.get("Retry-After", self.retry_seconds)))
+                        continue
+                    resp.raise_for_status()
+                    self.connected = True
+                    event, data_lines = None, []
+                    for line in resp.iter_lines(decode_unicode=True):
+                        if line is None:
+                            continue
+                        if line == "":
+                            if data_lines:
+                                self._apply(event, json.loads("\n".join(data_lines)))
+                            event, data_lines = None, []
+                        elif line.startswith("event:"):
+                            event = line[6:].strip()
+                        elif line.startswith("data:"):
+                            data_lines.append(line[5:].strip())
+                if self.status.get("trip_status") in ("ended", "none"):
+                    # The server closed the stream because the trip is over
+                    self.connected, self.finished = False, True
+                    return
+            except (requests.RequestException, ValueError) as e:
+                log.warning("Stream connection lost: %s", e)
+            self.connected = False
+            time.sleep(self.retry_seconds)
@@ -0,0 +1,386 @@
+"""
+Offline map tile cache and local tile server.
+
+Tiles are kept in an MBTiles-compatible SQLite file with a size cap and
+least-recently-used eviction. `TileServer` serves them over HTTP as a
+`{z}/{x}/{y}.png` template that Folium/Leaflet can use directly, fetching
+misses from the upstream server once (read-through). There is no default
+upstream: set `SANJAYA_TILES_UPSTREAM` to a tile server whose usage policy
+allows caching and bulk downloads, otherwise only cached tiles are served.
+Regions can be prefetched ahead of time: the corridor along a trip's path,
+a bounding box, or every airport in `airports.json`. Usage:
+
+    export SANJAYA_TILES_UPSTREAM='https://tiles.example.com/{z}/{x}/{y}.png'
+    python -m jules.tiles serve --port 8765 --prefetch-airports
+    python -m jules.tiles prefetch-trip <trip_id>
+    SANJAYA_TILES_URL=http://127.0.0.1:8765/tiles/{z}/{x}/{y}.png python run_app.py
+"""
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import asinh, ceil, cos, floor, pi, radians, tan
+
+import requests
+
+from jules.utils import haversine_distance
+
+TILE_DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'logs', 'tiles.mbtiles')
+UPSTREAM_URL = os.environ.get("SANJAYA_TILES_UPSTREAM")   # No default: bulk use needs a server that allows it
+UPSTREAM_ATTR = os.environ.get("SANJAYA_TILES_UPSTREAM_ATTR", "Map tiles")
+USER_AGENT = "ProjectSanjaya-TileCache/1.0"
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+EVICT_TO_FRACTION = 0.9          # Evict down to this share of the cap so eviction isn't triggered on every insert
+ACCESS_UPDATE_SECONDS = 300      # Coarsen LRU timestamps so cache hits rarely need a write
+FETCH_TIMEOUT = (5, 15)
+PREFETCH_WORKERS = 4             # Keep this low; public tile servers throttle bulk downloads
+MAX_PREFETCH_TILES = 5000
+DEFAULT_PORT = 8765
+KM_PER_DEG_LAT = 111.32
+
+log = logging.getLogger(__name__)
+
+# --- Tile Math ---
+
+def tile_for(lat, lon, zoom):
+    """Slippy-map (XYZ) tile containing a point."""
+    lat = max(min(lat, 85.0511), -85.0511)
+    n = 2 ** zoom
+    x = int(floor((lon + 180.0) / 360.0 * n))
+    y = int(floor((1.0 - asinh(tan(radians(lat))) / pi) / 2.0 * n))
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tiles_in_bbox(south, west, north, east, zooms):
+    """Yields (z, x, y) for every tile covering the box at each zoom level."""
+    for z in zooms:
+        x0, y0 = tile_for(north, west, z)
+        x1, y1 = tile_for(south, east, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+def count_tiles(south, west, north, east, zooms):
+    total = 0
+    for z in zooms:
+        x0, y0 = tile_for(north, west, z)
+        x1, y1 = tile_for(south, east, z)
+        total += (x1 - x0 + 1) * (y1 - y0 + 1)
+    return total
+
+def bbox_around(lat, lon, radius_km):
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlon = radius_km / (KM_PER_DEG_LAT * max(cos(radians(lat)), 0.01))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+def _along(coords, step_km):
+    """The path's points, plus interpolated ones so no two in a row are more than `step_km` apart."""
+    previous = None
+    for lat, lon in coords:
+        if previous is not None:
+            steps = ceil(haversine_distance(previous[0], previous[1], lat, lon) / step_km)
+            for i in range(1, steps):
+                yield previous[0] + (lat - previous[0]) * i / steps, previous[1] + (lon - previous[1]) * i / steps
+        yield lat, lon
+        previous = (lat, lon)
+
+def tiles_along(coords, zooms, padding_km):
+    """{zoom: set of (z, x, y)} covering a corridor `padding_km` either side of a (lat, lon) path."""
+    corridor = {z: set() for z in zooms}
+    for lat, lon in _along(coords, padding_km):
+        box = bbox_around(lat, lon, padding_km)
+        for z in zooms:
+            corridor[z].update(tiles_in_bbox(*box, [z]))
+    return corridor
+
+# --- Tile Store ---
+
+class TileCache:
+    """
+    Read-through tile cache backed by an MBTiles file.
+
+    The `tiles` table follows the MBTiles layout (TMS row numbering) with two
+    extra columns for LRU bookkeeping, so the file also opens in standard
+    MBTiles viewers. Each thread gets its own SQLite connection; writes are
+    serialized with a lock and the database runs in WAL mode so readers
+    aren't blocked by them.
+    """
+
+    def __init__(self, path=TILE_DB_PATH, max_bytes=MAX_CACHE_BYTES, upstream=UPSTREAM_URL, offline=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.upstream = upstream
+        self.offline = offline
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._session = requests.Session()
+        self._session.headers["User-Agent"] = USER_AGENT
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._db()
+        with self._write_lock, db:
+            db.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+            db.execute("""CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,
+                last_access INTEGER, size INTEGER,
+                PRIMARY KEY (zoom_level, tile_column, tile_row))""")
+            db.execute("CREATE INDEX IF NOT EXISTS tiles_lru ON tiles (last_access)")
+            for name, value in (("name", "sanjaya-tiles"), ("format", "png"), ("type", "baselayer"),
+                                ("attribution", UPSTREAM_ATTR)):
+                db.execute("INSERT OR IGNORE INTO metadata VALUES (?, ?)", (name, value))
+        self.total_bytes = db.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+        self.stats = {"hits": 0, "misses": 0, "fetched": 0, "failed": 0, "evicted": 0}
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def _row(z, y):
+        return (2 ** z - 1) - y  # MBTiles stores TMS rows
+
+    def get(self, z, x, y):
+        """Cached tile bytes, or None."""
+        db = self._db()
+        row = db.execute(
+            "SELECT tile_data, last_access FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+            (z, x, self._row(z, y))).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        now = int(time.time())
+        if now - row[1] > ACCESS_UPDATE_SECONDS:
+            with self._write_lock, db:
+                db.execute("UPDATE tiles SET last_access=? WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                           (now, z, x, self._row(z, y)))
+        return row[0]
+
+    def contains(self, z, x, y):
+        return self._db().execute(
+            "SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+            (z, x, self._row(z, y))).fetchone() is not None
+
+    def put(self, z, x, y, data):
+        db = self._db()
+        with self._write_lock:
+            with db:
+                old = db.execute("SELECT size FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                                 (z, x, self._row(z, y))).fetchone()
+                db.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?)",
+                           (z, x, self._row(z, y), sqlite3.Binary(data), int(time.time()), len(data)))
+            self.total_bytes += len(data) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict(db)
+
+    def _evict(self, db):
+        """Drops least-recently-used tiles until the cache is under its target size. Caller holds the write lock."""
+        target = self.max_bytes * EVICT_TO_FRACTION
+        freed, victims = 0, []
+        for z, col, row, size in db.execute("SELECT zoom_level, tile_column, tile_row, size FROM tiles ORDER BY last_access"):
+            if self.total_bytes - freed <= target:
+                break
+            victims.append((z, col, row))
+            freed += size
+        with db:
+            db.executemany("DELETE FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?", victims)
+        self.total_bytes -= freed
+        self.stats["evicted"] += len(victims)
+
+    def fetch(self, z, x, y):
+        """Returns the tile from the cache, downloading and storing it on a miss. None if unavailable."""
+        data = self.get(z, x, y)
+        if data is not None or self.offline or not self.upstream:
+            return data
+        try:
+            resp = self._session.get(self.upstream.format(z=z, x=x, y=y, s="a"), timeout=FETCH_TIMEOUT)
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            self.stats["failed"] += 1
+            log.warning("Tile download failed", extra={"tile": f"{z}/{x}/{y}", "error": type(e).__name__})
+            return None
+        self.stats["fetched"] += 1
+        self.put(z, x, y, resp.content)
+        return resp.content
+
+    # --- Prefetching ---
+
+    def _prefetch(self, tiles, workers):
+        """Downloads the missing ones of `tiles`. Returns the number of them now cached."""
+        if not self.upstream and not self.offline:
+            raise ValueError("No tile source configured; set SANJAYA_TILES_UPSTREAM (or --upstream) to prefetch.")
+        missing = [t for t in tiles if not self.contains(*t)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fetched = sum(1 for data in pool.map(lambda t: self.fetch(*t), missing) if data is not None)
+        return len(tiles) - len(missing) + fetched
+
+    def prefetch_bbox(self, south, west, north, east, zooms, workers=PREFETCH_WORKERS, limit=MAX_PREFETCH_TILES):
+        """Downloads every missing tile covering a box. Returns the number of tiles now cached."""
+        zooms = list(zooms)
+        total = count_tiles(south, west, north, east, zooms)
+        if total > limit:
+            raise ValueError(f"Prefetch would cover {total} tiles (limit {limit}); use fewer zoom levels or a smaller area.")
+        return self._prefetch(list(tiles_in_bbox(south, west, north, east, zooms)), workers)
+
+    def prefetch_trip(self, coords, zooms=range(4, 14), padding_km=2.0, workers=PREFETCH_WORKERS, limit=MAX_PREFETCH_TILES):
+        """
+        Prefetches a corridor `padding_km` either side of a trip's (lat, lon)
+        path. If every zoom level would go over `limit` tiles, the closest
+        zoom levels are left out; it is an error only if none fit.
+        """
+        coords = list(coords)
+        if not coords:
+            return 0
+        corridor = tiles_along(coords, sorted(zooms), padding_km)
+        tiles = []
+        for z, zoom_tiles in corridor.items():
+            if len(tiles) + len(zoom_tiles) > limit:
+                if not tiles:
+                    raise ValueError(f"Prefetch would cover {len(zoom_tiles)} tiles at zoom {z} alone (limit {limit}); "
+                                     "use lower zoom levels or a smaller padding.")
+                log.warning("Trip prefetch stops below the requested zoom levels",
+                            extra={"max_zoom": z - 1, "tiles": len(tiles), "limit": limit})
+                break
+            tiles.extend(zoom_tiles)
+        return self._prefetch(tiles, workers)
+
+    def prefetch_airports(self, zooms=range(10, 15), radius_km=None, airports=None, **kwargs):
+        """Prefetches the region around each airport (its geofence radius by default)."""
+        if airports is None:
+            from jules.utils import airport_registry
+            airport_registry.refresh()
+            airports = airport_registry.airports
+        cached = 0
+        for airport in airports:
+            s, w, n, e = bbox_around(airport["lat"], airport["lon"], radius_km or airport.get("radius_km", 5))
+            cached += self.prefetch_bbox(s, w, n, e, zooms, **kwargs)
+        return cached
+
+# --- Tile Server ---
+
+class _TileHandler(BaseHTTPRequestHandler):
+    cache = None
+
+    def do_GET(self):
+        parts = self.path.split("?", 1)[0].strip("/").split("/")
+        if parts == ["healthz"]:
+            self._send(200, "application/json", b'{"status": "ok"}')
+            return
+        try:
+            if len(parts) != 4 or parts[0] != "tiles":
+                raise ValueError
+            z, x, y = int(parts[1]), int(parts[2]), int(parts[3].split(".", 1)[0])
+            if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+                raise ValueError
+        except ValueError:
+            self.send_error(404)
+            return
+        data = self.cache.fetch(z, x, y)
+        if data is None:
+            self.send_error(404)
+            return
+        self._send(200, "image/png", data, {"Cache-Control": "public, max-age=86400"})
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+class TileServer:
+    """Serves a `TileCache` at `http://host:port/tiles/{z}/{x}/{y}.png` from a background thread."""
+
+    def __init__(self, cache=None, host="127.0.0.1", port=DEFAULT_PORT):
+        self.cache = cache or TileCache()
+        handler = type("TileHandler", (_TileHandler,), {"cache": self.cache})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url_template(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/tiles/{{z}}/{{x}}/{{y}}.png"
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="tile-server")
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main(argv=None):
+    import argparse
+    from jules.logs import setup_logging
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Offline map tile cache and server.")
+    parser.add_argument("--db", default=TILE_DB_PATH)
+    parser.add_argument("--max-mb", type=int, default=MAX_CACHE_BYTES // (1024 * 1024))
+    parser.add_argument("--offline", action="store_true", help="Never download; serve cached tiles only")
+    parser.add_argument("--upstream", default=UPSTREAM_URL,
+                        help="Tile server URL template to fill the cache from (default $SANJAYA_TILES_UPSTREAM)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--prefetch-airports", action="store_true")
+    airports = sub.add_parser("prefetch-airports")
+    airports.add_argument("--zooms", default="10-14")
+    bbox = sub.add_parser("prefetch-bbox")
+    bbox.add_argument("south", type=float)
+    bbox.add_argument("west", type=float)
+    bbox.add_argument("north", type=float)
+    bbox.add_argument("east", type=float)
+    bbox.add_argument("--zooms", default="4-13")
+    trip = sub.add_parser("prefetch-trip")
+    trip.add_argument("trip_id")
+    trip.add_argument("--root", default="logs/trips")
+    trip.add_argument("--zooms", default="4-13")
+    args = parser.parse_args(argv)
+
+    cache = TileCache(args.db, max_bytes=args.max_mb * 1024 * 1024, upstream=args.upstream, offline=args.offline)
+    zooms = lambda spec: range(int(spec.split("-")[0]), int(spec.split("-")[-1]) + 1)
+    if args.command == "serve":
+        if not cache.upstream:
+            log.warning("No tile source configured; serving cached tiles only")
+        server = TileServer(cache, args.host, args.port).start()
+        log.info("Tile server listening", extra={"url": server.url_template})
+        if args.prefetch_airports and cache.upstream:
+            threading.Thread(target=cache.prefetch_airports, daemon=True, name="airport-prefetch").start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
+        return
+    try:
+        if args.command == "prefetch-airports":
+            print(f"{cache.prefetch_airports(zooms(args.zooms))} airport tiles cached")
+        elif args.command == "prefetch-bbox":
+            print(f"{cache.prefetch_bbox(args.south, args.west, args.north, args.east, zooms(args.zooms))} tiles cached")
+        else:
+            from jules.trips import open_trip_log
+            coords = [(e["lat"], e["lon"]) for e in open_trip_log(args.trip_id, args.root).iter_events()]
+            print(f"{cache.prefetch_trip(coords, zooms(args.zooms))} trip tiles cached")
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,44 +1,330 @@
-import geocoder, time, json, os
-from datetime import datetime
+"""
+Asyncio location tracker.
 
-LOG_PATH = "logs/session_log.json"
+A `Tracker` runs any number of location sources concurrently on one event
+loop and writes their fixes to an event log in batches:
 
-def get_location():
-    g = geocoder.ip('me')
-    return {"lat": g.latlng[0], "lon": g.latlng[1]}
+- `IPSource` polls IP geolocation with a timeout and jittered backoff
+- `QueueSource` accepts points pushed from other threads (e.g. a GPS feed
+  read from stdin, see `read_points`)
+- `ReplaySource` plays back a recorded log, archive or list of events
 
-def start_tracking(interval=300):
-    # Adjust the log path to be relative to the project root
-    log_file_path = os.path.join(os.path.dirname(__file__), '..', LOG_PATH)
+Fixes that haven't moved more than `min_move_m` from the last stored fix of
+the same source are dropped, apart from an occasional keepalive, so a
+stationary device doesn't grow the log. Any object with an async
+`fixes()` generator works as a source, which makes the tracker easy to
+drive with a fake one. Usage:
 
-    # Create logs directory if it doesn't exist
-    os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+    python -m jules.tracker
+    gpspipe -w | jq -c 'select(.class == "TPV") | {lat, lon}' | python -m jules.tracker --stdin --no-ip
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+from datetime import datetime, timezone
 
-    session_data = {"events": []}
-    # Load existing data if the file is not empty
-    if os.path.exists(log_file_path) and os.path.getsize(log_file_path) > 0:
-        try:
-            with open(log_file_path, "r") as f:
-                session_data = json.load(f)
-        except json.JSONDecodeError:
-            # Handle case where file is corrupt or empty
-            session_data = {"events": []}
+from jules.eventlog import EventLog, load_events
+from jules.utils import haversine_distance
+
+LOG_PATH = "logs/session_log.jsonl"
+
+IP_POLL_INTERVAL = 300
+IP_LOOKUP_TIMEOUT = 10
+BACKOFF_SECONDS = (5, 300)      # Base and cap of the jittered retry delay
+MIN_MOVE_METERS = 25
+KEEPALIVE_SECONDS = 900         # Store a fix this often even if it hasn't moved
+BATCH_SIZE = 20
+FLUSH_INTERVAL = 5.0
+FLUSH_RETRIES = 5               # Failed writes of a batch before it is dropped
+
+log = logging.getLogger(__name__)
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def _epoch(ts):
+    return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+
+def backoff_delay(failures, base=BACKOFF_SECONDS[0], cap=BACKOFF_SECONDS[1]):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**failures)]."""
+    return random.uniform(0, min(cap, base * 2 ** failures))
+
+# --- Sources ---
+
+class IPSource:
+    """Polls IP geolocation (`geocoder.ip('me')`) without blocking the event loop."""
+
+    name = "ip"
+
+    def __init__(self, interval=IP_POLL_INTERVAL, timeout=IP_LOOKUP_TIMEOUT, backoff=BACKOFF_SECONDS, lookup=None):
+        self.interval = interval
+        self.timeout = timeout
+        self.backoff = backoff
+        self.lookup = lookup or self._geocoder_lookup
+
+    @staticmethod
+    def _geocoder_lookup():
+        import geocoder
+        g = geocoder.ip('me')
+        return g.latlng
+
+    async def fixes(self):
+        failures = 0
+        while True:
+            try:
+                latlng = await asyncio.wait_for(asyncio.to_thread(self.lookup), self.timeout)
+                if not latlng or latlng[0] is None:
+                    raise ValueError("no location in response")
+            except Exception as e:
+                delay = backoff_delay(failures, *self.backoff)
+                failures += 1
+                log.warning("IP location lookup failed; retrying", extra={"error": type(e).__name__, "retry_in_s": round(delay, 1)})
+                await asyncio.sleep(delay)
+                continue
+            failures = 0
+            yield {"lat": latlng[0], "lon": latlng[1], "timestamp": _now_iso(), "source": self.name}
+            await asyncio.sleep(self.interval)
+
+class QueueSource:
+    """
+    Points pushed from any thread with `push()`. `close()` ends the source
+    once the queued points have been consumed.
+    """
+
+    _CLOSED = object()
+
+    def __init__(self, name="web"):
+        self.name = name
+        self._queue = None
+        self._loop = None
+        self._ready = threading.Event()
+
+    def _bind(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._ready.set()
 
-    while True:
+    def push(self, point):
+        """Thread-safe; blocks only until the tracker has started."""
+        self._ready.wait()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, point)
+
+    def close(self):
+        self.push(self._CLOSED)
+
+    async def fixes(self):
+        self._bind()
+        while True:
+            point = await self._queue.get()
+            if point is self._CLOSED:
+                return
+            yield {**point, "timestamp": point.get("timestamp") or _now_iso(), "source": point.get("source") or self.name}
+
+class ReplaySource:
+    """
+    Replays recorded events: a list, an event log / legacy JSON file, or a
+    `.sja` archive. `speed` multiplies real time; None replays without pauses.
+    """
+
+    name = "replay"
+
+    def __init__(self, events, speed=None):
+        self.events = events
+        self.speed = speed
+
+    def _iter_events(self):
+        if not isinstance(self.events, str):
+            return iter(self.events)
+        if self.events.endswith(".sja"):
+            from jules.archive import TripArchive
+            return TripArchive(self.events).iter_events()
+        return load_events(self.events)
+
+    async def fixes(self):
+        previous = None
+        for event in self._iter_events():
+            if self.speed and previous is not None:
+                gap = (_epoch(event["timestamp"]) - previous) / self.speed
+                if gap > 0:
+                    await asyncio.sleep(gap)
+            previous = _epoch(event["timestamp"])
+            yield dict(event)
+            await asyncio.sleep(0)  # Let other sources and the flusher run between points
+
+# --- Tracker ---
+
+class Tracker:
+    """
+    Collects fixes from `sources` and appends them to `storage` (anything with
+    `append_many(events)`, such as an `EventLog`) in batches of `batch_size`
+    or every `flush_interval` seconds, whichever comes first. A batch that
+    fails to store is retried with jittered backoff and dropped after
+    `flush_retries` failures in a row. `run()` returns once every source has
+    finished, after a final flush.
+    """
+
+    def __init__(self, storage, sources, min_move_m=MIN_MOVE_METERS, keepalive_s=KEEPALIVE_SECONDS,
+                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, flush_retries=FLUSH_RETRIES,
+                 retry_backoff=BACKOFF_SECONDS):
+        self.storage = storage
+        self.sources = list(sources)
+        self.min_move_m = min_move_m
+        self.keepalive_s = keepalive_s
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flush_retries = flush_retries
+        self.retry_backoff = retry_backoff
+        self.stats = {"received": 0, "suppressed": 0, "written": 0, "flushes": 0, "failed_flushes": 0, "dropped": 0}
+        self._pending = []
+        self._last_kept = {}     # source name -> (lat, lon, epoch seconds)
+        self._failures = 0       # Failed flushes in a row
+        self._flush_lock = None
+        self._wake = None
+        self._stop = None
+
+    def _should_keep(self, fix):
+        key = fix.get("source")
+        last = self._last_kept.get(key)
+        # Fix time rather than wall time, so replays suppress the same points a live run would
+        now = _epoch(fix["timestamp"])
+        if last is not None:
+            moved_m = haversine_distance(last[0], last[1], fix["lat"], fix["lon"]) * 1000
+            if moved_m < self.min_move_m and now - last[2] < self.keepalive_s:
+                return False
+        self._last_kept[key] = (fix["lat"], fix["lon"], now)
+        return True
+
+    async def _consume(self, source):
+        async for fix in source.fixes():
+            self.stats["received"] += 1
+            if not self._should_keep(fix):
+                self.stats["suppressed"] += 1
+                continue
+            self._pending.append(fix)
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+
+    async def flush(self):
+        """
+        Writes pending fixes in one append, off the event loop. If the write
+        fails, the batch goes back in front of newer fixes for the next flush.
+        Returns False while a failed batch is waiting to be retried.
+        """
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return True
+            try:
+                await asyncio.to_thread(self.storage.append_many, batch)
+            except Exception as e:
+                self._failures += 1
+                self.stats["failed_flushes"] += 1
+                if self._failures > self.flush_retries:
+                    log.error("Dropping fixes after repeated storage failures",
+                              extra={"points": len(batch), "attempts": self._failures, "error": type(e).__name__})
+                    self.stats["dropped"] += len(batch)
+                    self._failures = 0
+                    return True
+                log.warning("Storing fixes failed; will retry",
+                            extra={"points": len(batch), "attempt": self._failures, "error": type(e).__name__})
+                self._pending[:0] = batch
+                return False
+            self._failures = 0
+            self.stats["written"] += len(batch)
+            self.stats["flushes"] += 1
+            return True
+
+    def _retry_delay(self):
+        return backoff_delay(self._failures - 1, *self.retry_backoff)
+
+    async def _flusher(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not await self.flush():
+                # Full batches keep setting `_wake`, so back off on the stop event instead
+                try:
+                    await asyncio.wait_for(self._stop.wait(), self._retry_delay())
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run(self):
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._stop = asyncio.Event()
+        flusher = asyncio.create_task(self._flusher())
         try:
-            loc = get_location()
-            if loc and loc.get("lat") is not None:
-                loc["timestamp"] = datetime.utcnow().isoformat() + "Z"
-                session_data["events"].append(loc)
+            results = await asyncio.gather(*(self._consume(s) for s in self.sources), return_exceptions=True)
+            for source, result in zip(self.sources, results):
+                if isinstance(result, Exception):
+                    log.error("Location source %s stopped: %r", getattr(source, "name", source), result)
+        finally:
+            # Let an in-progress write finish rather than cancelling it halfway
+            self._stop.set()
+            self._wake.set()
+            await flusher
+            while not await self.flush():
+                await asyncio.sleep(self._retry_delay())
+        return self.stats
 
-                with open(log_file_path, "w") as f:
-                    json.dump(session_data, f, indent=2)
+def read_points(stream, source):
+    """
+    Pushes JSON-lines points (`{"lat": ..., "lon": ...}` plus optional
+    fields) from `stream` into a `QueueSource`, closing it at end of input.
+    Lines that aren't a point are skipped.
+    """
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            point = json.loads(line)
+            point.update(lat=float(point["lat"]), lon=float(point["lon"]))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            log.warning("Skipping an unreadable point", extra={"line": line.strip()[:200]})
+            continue
+        source.push(point)
+    source.close()
 
-                print(f"Logged: {loc}")
-            else:
-                print("Failed to fetch location.")
+def start_tracking(interval=IP_POLL_INTERVAL, log_path=None, ip=True, stream=None):
+    """
+    Blocking entry point: tracks IP location, and points read from `stream`
+    (see `read_points`), into the session event log.
+    """
+    # Adjust the log path to be relative to the project root
+    log_path = log_path or os.path.join(os.path.dirname(__file__), '..', LOG_PATH)
+    sources = [IPSource(interval=interval)] if ip else []
+    if stream is not None:
+        queue = QueueSource(name="device")
+        threading.Thread(target=read_points, args=(stream, queue), daemon=True, name="point-reader").start()
+        sources.append(queue)
+    if not sources:
+        raise ValueError("Nothing to track: enable IP lookups or pass a stream of points.")
+    # A 1 Hz device feed is written every FLUSH_INTERVAL seconds rather than once per fix
+    tracker = Tracker(EventLog(log_path), sources)
+    return asyncio.run(tracker.run())
 
-        except Exception as e:
-            print(f"An error occurred: {e}")
+def main(argv=None):
+    import argparse
+    from jules.logs import setup_logging
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Track location into the session event log.")
+    parser.add_argument("--log", help=f"Event log to append to (default {LOG_PATH})")
+    parser.add_argument("--interval", type=int, default=IP_POLL_INTERVAL, help="Seconds between IP lookups")
+    parser.add_argument("--stdin", action="store_true", help="Also read JSON-lines points from stdin")
+    parser.add_argument("--no-ip", action="store_true", help="Don't look up location by IP")
+    args = parser.parse_args(argv)
+    try:
+        stats = start_tracking(args.interval, args.log, ip=not args.no_ip, stream=sys.stdin if args.stdin else None)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{stats['written']} fixes written, {stats['suppressed']} suppressed, {stats['dropped']} dropped")
 
-        time.sleep(interval)
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import threading
+from collections import OrderedDict
+from math import cos, radians, log2
+
+import numpy as np
+
+METERS_PER_DEG_LAT = 110540.0
+METERS_PER_DEG_LON = 111320.0
+WEB_MERCATOR_M_PER_PX = 156543.03392  # Ground resolution at zoom 0 on the equator
+STATIONARY_THRESHOLD_M = 5.0
+TOLERANCE_PX = 1.0        # Simplification error budget, in screen pixels
+MAX_POLYLINE_POINTS = 2000
+
+# --- Projection Helpers ---
+
+def _project(coords):
+    """Projects (lat, lon) pairs to local equirectangular meters around their mean latitude."""
+    pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    lat0 = radians(float(pts[:, 0].mean())) if len(pts) else 0.0
+    return np.column_stack((pts[:, 1] * METERS_PER_DEG_LON * cos(lat0), pts[:, 0] * METERS_PER_DEG_LAT))
+
+def tolerance_for_zoom(zoom, lat=0.0, tolerance_px=TOLERANCE_PX):
+    """Ground distance in meters covered by `tolerance_px` screen pixels at a zoom level."""
+    return tolerance_px * WEB_MERCATOR_M_PER_PX * cos(radians(lat)) / (2 ** zoom)
+
+def fit_zoom(coords, width_px=800, height_px=500, max_zoom=18):
+    """Approximates the zoom level Leaflet picks when fitting the map to `coords`."""
+    pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(pts) < 2:
+        return max_zoom
+    lat = float(pts[:, 0].mean())
+    xy = _project(pts)
+    span_x, span_y = np.ptp(xy[:, 0]), np.ptp(xy[:, 1])
+    m_per_px = max(span_x / width_px, span_y / height_px)
+    if m_per_px <= 0:
+        return max_zoom
+    zoom = log2(WEB_MERCATOR_M_PER_PX * cos(radians(lat)) / m_per_px)
+    return int(max(0, min(max_zoom, zoom)))
+
+# --- Simplification ---
+
+def drop_stationary(coords, threshold_m=STATIONARY_THRESHOLD_M):
+    """Drops points closer than `threshold_m` to the previously kept point (always keeps the last one)."""
+    if len(coords) < 3:
+        return list(coords)
+    xy = _project(coords)
+    xs, ys = xy[:, 0].tolist(), xy[:, 1].tolist()
+    threshold2 = threshold_m * threshold_m
+    kept = [0]
+    last_x, last_y = xs[0], ys[0]
+    for i in range(1, len(coords) - 1):
+        dx, dy = xs[i] - last_x, ys[i] - last_y
+        if dx * dx + dy * dy >= threshold2:
+            kept.append(i)
+            last_x, last_y = xs[i], ys[i]
+    kept.append(len(coords) - 1)
+    return [coords[i] for i in kept]
+
+def douglas_peucker(coords, tolerance_m):
+    """Iterative Douglas-Peucker simplification with a tolerance in meters."""
+    return [coords[i] for i in douglas_peucker_indices(coords, tolerance_m)]
+
+def douglas_peucker_indices(coords, tolerance_m):
+    """Indexes of the points Douglas-Peucker keeps, in order."""
+    n = len(coords)
+    if n < 3:
+        return list(range(n))
+    xy = _project(coords)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = xy[start], xy[end]
+        seg = b - a
+        seg_len2 = float(seg @ seg)
+        pts = xy[start + 1:end]
+        if seg_len2 == 0.0:
+            dists = np.hypot(*(pts - a).T)
+        else:
+            t = np.clip(((pts - a) @ seg) / seg_len2, 0.0, 1.0)
+            dists = np.hypot(*(pts - (a + t[:, None] * seg)).T)
+        i = int(np.argmax(dists))
+        if dists[i] > tolerance_m:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep).tolist()
+
+def simplify_path(coords, zoom, max_points=MAX_POLYLINE_POINTS):
+    """
+    Produces a polyline suitable for rendering at `zoom`: stationary duplicates
+    are removed, then Douglas-Peucker runs with a one-pixel tolerance, doubling
+    the tolerance until the result fits in `max_points`.
+    """
+    coords = drop_stationary(coords)
+    if len(coords) < 3:
+        return coords
+    lat = float(np.mean([c[0] for c in coords]))
+    tolerance = tolerance_for_zoom(zoom, lat)
+    simplified = douglas_peucker(coords, tolerance)
+    while len(simplified) > max_points:
+        tolerance *= 2
+        simplified = douglas_peucker(simplified, tolerance)
+    return simplified
+
+class StreamingSimplifier:
+    """
+    `simplify_path` for a path that only grows, doing work only for new points.
+
+    Vertices up to the third-to-last one kept are frozen, and the last frozen
+    vertex anchors the rest. Each update runs the stationary filter over the
+    new points and Douglas-Peucker over the unfrozen tail only, so its cost
+    scales with the tail rather than the whole path. Every output segment
+    still stays within the tolerance of the points it replaces. The result
+    can differ slightly from simplifying the whole path in one go, because
+    frozen vertices are never revisited. If the path is rewritten rather
+    than extended, the simplifier starts over.
+    """
+
+    def __init__(self, zoom, max_points=MAX_POLYLINE_POINTS):
+        self.zoom = zoom
+        self.max_points = max_points
+        self._lock = threading.Lock()
+        self._restart()
+
+    def _restart(self):
+        self.count = 0            # Source points consumed
+        self.last_source = None   # Last source point seen, to detect a rewritten path
+        self.tolerance = None
+        self.frozen = []          # Final vertices; the last one anchors the tail
+        self.tail = []            # Points after the anchor that passed the stationary filter
+        self.result = []
+        self._scale = None        # Equirectangular scale, fixed at the first point's latitude
+        self._last_xy = None      # Last point kept by the stationary filter
+
+    def _xy(self, point):
+        return point[1] * self._scale, point[0] * METERS_PER_DEG_LAT
+
+    def update(self, coords):
+        """Returns the simplified polyline for `coords`, an extension of the previous call's path."""
+        with self._lock:
+            if len(coords) < self.count or (self.count and tuple(coords[self.count - 1]) != self.last_source):
+                self._restart()
+            if len(coords) == self.count:
+                return self.result
+            if self._scale is None:
+                self._scale = METERS_PER_DEG_LON * cos(radians(coords[0][0]))
+                self.tolerance = tolerance_for_zoom(self.zoom, coords[0][0])
+            threshold2 = STATIONARY_THRESHOLD_M * STATIONARY_THRESHOLD_M
+            for point in coords[self.count:]:
+                x, y = self._xy(point)
+                if self._last_xy is None or (x - self._last_xy[0]) ** 2 + (y - self._last_xy[1]) ** 2 >= threshold2:
+                    self.tail.append(point)
+                    self._last_xy = (x, y)
+            self.count = len(coords)
+            self.last_source = tuple(coords[-1])
+            self._simplify_tail(coords[-1])
+            return self.result
+
+    def _simplify_tail(self, last):
+        head = self.frozen[-1:]
+        # Like drop_stationary, always end at the newest point
+        extra = [last] if not self.tail or tuple(self.tail[-1]) != tuple(last) else []
+        working = head + self.tail + extra
+        kept = douglas_peucker_indices(working, self.tolerance)
+        self.result = self.frozen[:-1] + [working[i] for i in kept]
+        if len(self.result) > self.max_points:
+            # Too many vertices at this tolerance: coarsen everything and freeze it
+            while len(self.result) > self.max_points:
+                self.tolerance *= 2
+                self.result = douglas_peucker(self.result, self.tolerance)
+            self.frozen, self.tail = list(self.result), []
+            return
+        if len(kept) >= 4:
+            anchor = kept[-3]
+            self.frozen.extend(working[i] for i in kept[len(head):-2])
+            self.tail = self.tail[anchor + 1 - len(head):]
+
+# --- Per-Trip Cache ---
+
+class PolylineCache:
+    """
+    LRU cache of simplified polylines keyed by (trip_id, name, zoom). Each
+    entry is a `StreamingSimplifier`, so as an append-only trip grows, only
+    the new points are processed.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, trip_id, name, coords, zoom):
+        key = (trip_id, name, zoom)
+        with self._lock:
+            simplifier = self._entries.get(key)
+            if simplifier is None:
+                simplifier = self._entries[key] = StreamingSimplifier(zoom)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return simplifier.update(coords)
+
+    def invalidate(self, trip_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == trip_id]:
+                del self._entries[key]
+
+polyline_cache = PolylineCache()
@@ -0,0 +1,281 @@
+"""
+SQLite trip store shared by several backend worker processes.
+
+`SharedTripStore` has the same interface as `jules.trips.TripStore`. It is
+used when the backend runs as multiple processes (see `jules/cluster.py`).
+
+- **Trip state** lives in one SQLite database in WAL mode instead of each
+  process's memory. Every worker sees the same trips, and read-modify-write
+  updates are database transactions rather than in-process locks.
+- **Events** stay in each trip's `events.jsonl` event log, because streams,
+  the dashboard, the renderer and the archiver all read it by byte cursor.
+  Appends take the database's write lock, so the file and the
+  de-duplication index (`event_keys`) stay consistent across workers.
+- **Files for other readers**: `trip_info.json` and the `LATEST` pointer are
+  still written, so file readers such as the dashboard work unchanged.
+
+The database also keeps a change counter, which every write bumps and
+streams poll, and named leases used for leader election.
+"""
+import copy
+import json
+import os
+import secrets
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from jules.metrics import IO_SECONDS, LOCK_WAIT_SECONDS
+from jules.trips import (LATEST_POINTER_FILE, TRIPS_DIR, _TRIP_ID_RE, event_epoch, event_key,
+                         open_trip_log, read_latest_trip_id, trip_dir, trip_info_path)
+from jules.utils import atomic_write_json
+
+TRIP_DB_FILE = "trips.db"
+BUSY_TIMEOUT_SECONDS = 30
+MAX_OPEN_LOGS = 256   # Per process; the least recently used log is closed beyond this
+
+class SharedTripStore:
+    """
+    `TripStore` backed by `<root>/trips.db`. Each thread opens its own
+    connection. Writes are `BEGIN IMMEDIATE` transactions, so concurrent
+    writers queue on SQLite's lock whether they're in the same process or
+    not. Trips found on disk are imported the first time the database is
+    created, so switching an existing install to multi-process mode keeps
+    its trips.
+    """
+
+    def __init__(self, root=TRIPS_DIR):
+        self.root = root
+        self.path = os.path.join(root, TRIP_DB_FILE)
+        self._local = threading.local()
+        self._logs_lock = threading.Lock()
+        self._logs = OrderedDict()   # trip_id -> EventLog (file handles are per process)
+        os.makedirs(root, exist_ok=True)
+        with self._transaction() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS trips (
+                trip_id TEXT PRIMARY KEY, token TEXT UNIQUE, status TEXT, info TEXT NOT NULL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS trips_status ON trips (status)")
+            # Keys of the events stored for each active trip; dropped when the trip ends
+            db.execute("""CREATE TABLE IF NOT EXISTS event_keys (
+                trip_id TEXT, ts TEXT, lat REAL, lon REAL, PRIMARY KEY (trip_id, ts, lat, lon)) WITHOUT ROWID""")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)")
+            db.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT, expires REAL)")
+            if db.execute("INSERT OR IGNORE INTO meta VALUES ('change_version', 0)").rowcount:
+                self._import_files(db)
+
+    # --- Connections ---
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # Autocommit mode; transactions are opened explicitly below
+            db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None,
+                                 check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        """A write transaction; waiting for the database lock is recorded like any other lock wait."""
+        db = self._db()
+        start = time.perf_counter()
+        db.execute("BEGIN IMMEDIATE")
+        LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, lock="trip_db")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        with IO_SECONDS.time(op="trip_db_commit"):
+            db.execute("COMMIT")
+
+    def _import_files(self, db):
+        """Copies trips written by the single-process `TripStore` into a new database."""
+        for trip_id in os.listdir(self.root):
+            if not _TRIP_ID_RE.match(trip_id):
+                continue
+            try:
+                with open(trip_info_path(trip_id, self.root), "r") as f:
+                    trip_info = json.load(f)
+            except (OSError, ValueError):
+                continue
+            trip_info.setdefault("token", secrets.token_urlsafe(16))
+            db.execute("INSERT OR IGNORE INTO trips (trip_id, token, status, info) VALUES (?, ?, ?, ?)",
+                       (trip_id, trip_info["token"], trip_info.get("trip_status"), json.dumps(trip_info)))
+        latest = read_latest_trip_id(self.root)
+        if latest:
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('latest', ?)", (latest,))
+
+    @staticmethod
+    def _bump(db):
+        db.execute("UPDATE meta SET value = value + 1 WHERE name = 'change_version'")
+
+    # --- Files for readers outside the backend ---
+
+    def _write_info(self, trip_info):
+        with IO_SECONDS.time(op="trip_info_write"):
+            atomic_write_json(trip_info_path(trip_info["trip_id"], self.root), trip_info)
+
+    def _write_latest(self, trip_id):
+        pointer = os.path.join(self.root, LATEST_POINTER_FILE)
+        if trip_id is None:
+            if os.path.exists(pointer):
+                os.remove(pointer)
+            return
+        with open(pointer, "w") as f:
+            f.write(trip_id)
+
+    # --- Public API (see TripStore) ---
+
+    def create(self, trip_info):
+        """Persists a new trip and makes it the latest one."""
+        trip_info = copy.deepcopy(trip_info)
+        trip_info.setdefault("token", secrets.token_urlsafe(16))
+        trip_id = trip_info["trip_id"]
+        trip_dir(trip_id, self.root)  # Validates the ID
+        with self._transaction() as db:
+            db.execute("INSERT INTO trips (trip_id, token, status, info) VALUES (?, ?, ?, ?)",
+                       (trip_id, trip_info["token"], trip_info.get("trip_status"), json.dumps(trip_info)))
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('latest', ?)", (trip_id,))
+            self._bump(db)
+            # Written inside the transaction so concurrent writers' files land in commit order
+            self._write_info(trip_info)
+            self._write_latest(trip_id)
+        return trip_info
+
+    def get(self, trip_id):
+        """Returns the trip's info dict, or None if the trip doesn't exist."""
+        row = self._db().execute("SELECT info FROM trips WHERE trip_id = ?", (trip_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def resolve(self, trip_id=None, token=None):
+        """Maps a token (or else a trip ID) to the ID of an existing trip, or None."""
+        db = self._db()
+        if token:
+            row = db.execute("SELECT trip_id FROM trips WHERE token = ?", (token,)).fetchone()
+            return row[0] if row else None
+        if trip_id:
+            return trip_id if db.execute("SELECT 1 FROM trips WHERE trip_id = ?", (trip_id,)).fetchone() else None
+        return None
+
+    def update(self, trip_id, mutate):
+        """
+        Applies `mutate(trip_info)` in a transaction and returns the updated
+        info, or None if the trip doesn't exist.
+        """
+        with self._transaction() as db:
+            row = db.execute("SELECT info FROM trips WHERE trip_id = ?", (trip_id,)).fetchone()
+            if row is None:
+                return None
+            trip_info = json.loads(row[0])
+            mutate(trip_info)
+            db.execute("UPDATE trips SET status = ?, info = ? WHERE trip_id = ?",
+                       (trip_info.get("trip_status"), json.dumps(trip_info), trip_id))
+            if trip_info.get("trip_status") != "active":
+                db.execute("DELETE FROM event_keys WHERE trip_id = ?", (trip_id,))
+            self._bump(db)
+            self._write_info(trip_info)
+        if trip_info.get("trip_status") != "active":
+            self._close_log(trip_id)
+        return copy.deepcopy(trip_info)
+
+    def events(self, trip_id):
+        """Returns the trip's EventLog, keeping at most `MAX_OPEN_LOGS` per process."""
+        with self._logs_lock:
+            log = self._logs.get(trip_id)
+            if log is None or not os.path.exists(log.path):
+                # Also reopened once an archive replaces the log (see jules.archive.archive_trip)
+                if log is not None:
+                    log.close()
+                log = self._logs[trip_id] = open_trip_log(trip_id, self.root)
+                if len(self._logs) > MAX_OPEN_LOGS:
+                    self._logs.popitem(last=False)[1].close()
+            self._logs.move_to_end(trip_id)
+            return log
+
+    def _index_log(self, db, trip_id):
+        """Adds the keys of events already in the log when the trip has none yet (e.g. imported trips)."""
+        if db.execute("SELECT 1 FROM event_keys WHERE trip_id = ? LIMIT 1", (trip_id,)).fetchone():
+            return
+        db.executemany("INSERT OR IGNORE INTO event_keys VALUES (?, ?, ?, ?)",
+                       ((trip_id, *event_key(e)) for e in self.events(trip_id).iter_events()))
+
+    def append_events(self, trip_id, events):
+        """
+        Appends a batch of events in a single write, skipping any already
+        stored with the same timestamp and position. Out-of-order points are
+        kept. Returns (accepted_count, cursor).
+        """
+        with self._transaction() as db:
+            self._index_log(db, trip_id)
+            fresh = [e for e in events
+                     if db.execute("INSERT OR IGNORE INTO event_keys VALUES (?, ?, ?, ?)", (trip_id, *event_key(e))).rowcount]
+            # If the write fails, the transaction rolls the keys back too
+            cursor = self.events(trip_id).append_many(sorted(fresh, key=event_epoch))
+            if fresh:
+                self._bump(db)
+        return len(fresh), cursor
+
+    def _close_log(self, trip_id):
+        with self._logs_lock:
+            log = self._logs.pop(trip_id, None)
+        if log is not None:
+            log.close()
+
+    def active_trips(self):
+        rows = self._db().execute("SELECT info FROM trips WHERE status = 'active'").fetchall()
+        return [json.loads(info) for (info,) in rows]
+
+    @contextmanager
+    def locked(self, trip_id):
+        """Holds the database write lock for the block, so no worker can delete the trip; yields whether it exists."""
+        with self._transaction() as db:
+            yield db.execute("SELECT 1 FROM trips WHERE trip_id = ?", (trip_id,)).fetchone() is not None
+
+    def delete(self, trip_id):
+        with self._transaction() as db:
+            db.execute("DELETE FROM trips WHERE trip_id = ?", (trip_id,))
+            db.execute("DELETE FROM event_keys WHERE trip_id = ?", (trip_id,))
+            cleared = db.execute("DELETE FROM meta WHERE name = 'latest' AND value = ?", (trip_id,)).rowcount
+            self._bump(db)
+            self._close_log(trip_id)
+            path = trip_dir(trip_id, self.root)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            if cleared:
+                self._write_latest(None)
+
+    def latest_trip_id(self):
+        row = self._db().execute("SELECT value FROM meta WHERE name = 'latest'").fetchone()
+        return row[0] if row else None
+
+    def flush(self):
+        """Writes are committed as they happen; kept for parity with `TripStore`."""
+
+    # --- Cross-process coordination ---
+
+    def change_version(self):
+        """Counter bumped by every write from any process."""
+        return self._db().execute("SELECT value FROM meta WHERE name = 'change_version'").fetchone()[0]
+
+    def acquire_lease(self, name, holder, ttl):
+        """
+        Takes or renews the lease `name` for `ttl` seconds. Returns True if
+        `holder` now holds it, False while another holder's lease is current.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT holder, expires FROM leases WHERE name = ?", (name,)).fetchone()
+            if row and row[0] != holder and row[1] > now:
+                return False
+            db.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (name, holder, now + ttl))
+            return True
+
+    def release_lease(self, name, holder):
+        with self._transaction() as db:
+            db.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
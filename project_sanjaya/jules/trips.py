@@ -0,0 +1,344 @@
+import atexit
+import copy
+import json
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from jules.eventlog import EventLog
+from jules.metrics import IO_SECONDS, timed_lock
+from jules.utils import atomic_write_json
+
+TRIPS_DIR = "logs/trips"
+TRIP_INFO_FILE = "trip_info.json"
+TRIP_EVENTS_FILE = "events.jsonl"
+TRIP_ARCHIVE_FILE = "events.sja"
+TRIP_MAP_IMAGE_FILE = "final_trip_map.png"
+LATEST_POINTER_FILE = "LATEST"
+FLUSH_DELAY_SECONDS = 0.25  # Mutations within this window are written out together
+
+_TRIP_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def trip_dir(trip_id, root=TRIPS_DIR):
+    if not trip_id or not _TRIP_ID_RE.match(trip_id):
+        raise ValueError(f"Invalid trip id: {trip_id!r}")
+    return os.path.join(root, trip_id)
+
+def trip_info_path(trip_id, root=TRIPS_DIR):
+    return os.path.join(trip_dir(trip_id, root), TRIP_INFO_FILE)
+
+def trip_events_path(trip_id, root=TRIPS_DIR):
+    return os.path.join(trip_dir(trip_id, root), TRIP_EVENTS_FILE)
+
+def trip_archive_path(trip_id, root=TRIPS_DIR):
+    return os.path.join(trip_dir(trip_id, root), TRIP_ARCHIVE_FILE)
+
+def open_trip_log(trip_id, root=TRIPS_DIR):
+    """The trip's EventLog or, once an archive has replaced the log, a read-only `ArchivedEventLog`."""
+    path = trip_events_path(trip_id, root)
+    if os.path.exists(path):
+        return EventLog(path)
+    from jules.archive import open_event_log  # Needs numpy; only archived trips get this far
+    return open_event_log(path)
+
+def trip_map_image_path(trip_id, root=TRIPS_DIR):
+    return os.path.join(trip_dir(trip_id, root), TRIP_MAP_IMAGE_FILE)
+
+class TripStore:
+    """
+    Trip-scoped storage sharded by trip ID:
+
+        logs/trips/<trip_id>/trip_info.json   # trip metadata and status
+        logs/trips/<trip_id>/events.jsonl     # append-only EventLog
+
+    The in-memory copy of each trip is authoritative: active trips are held in
+    a hot cache so status reads never touch disk, and ended trips are read
+    from disk on demand (and dropped from memory once their last change has
+    been written). Mutations mark a trip dirty and a background flusher persists dirty
+    trips with atomic write-and-rename, coalescing bursts of updates into one
+    write per trip. Callers always receive copies, never the cached dicts.
+    Every trip gets a random secret `token`; the backend only accepts
+    requests that present it.
+    """
+
+    def __init__(self, root=TRIPS_DIR):
+        self.root = root
+        self._lock = threading.RLock()
+        self._trips = {}   # trip_id -> trip_info (active trips + ended ones not yet flushed)
+        self._tokens = {}  # token -> trip_id (every trip)
+        self._logs = {}    # trip_id -> EventLog (active trips)
+        self._event_keys = {}  # trip_id -> keys of stored events (active trips, built lazily)
+        self._append_locks = {}  # trip_id -> lock serializing that trip's appends and key index
+        self._latest = None
+        self._dirty = set()
+        self._flush_cond = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._load_active()
+        atexit.register(self.flush)
+
+    # --- Paths ---
+
+    def _info_path(self, trip_id):
+        return trip_info_path(trip_id, self.root)
+
+    # --- Loading ---
+
+    def _load_active(self):
+        """Warms the hot cache with every active trip found on disk."""
+        if not os.path.isdir(self.root):
+            return
+        for trip_id in os.listdir(self.root):
+            if not _TRIP_ID_RE.match(trip_id):
+                continue
+            trip_info = self._read_info(trip_id)
+            if trip_info and trip_info.get("trip_status") == "active":
+                self._remember(trip_info)
+            elif trip_info and trip_info.get("token"):
+                # Ended trips stay on disk, but their tokens must still resolve
+                self._tokens[trip_info["token"]] = trip_id
+
+    def _read_info(self, trip_id):
+        path = self._info_path(trip_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return None
+
+    def _write_info(self, trip_info):
+        with IO_SECONDS.time(op="trip_info_write"):
+            atomic_write_json(self._info_path(trip_info["trip_id"]), trip_info)
+
+    # --- Coalesced Persistence ---
+
+    def _mark_dirty(self, trip_id):
+        """Queues a trip for the next flush. Must be called with the lock held."""
+        self._dirty.add(trip_id)
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="trip-flusher")
+            self._flusher.start()
+        self._flush_cond.notify()
+
+    def _take_dirty(self):
+        """Snapshots dirty trips and clears the set. Must be called with the lock held."""
+        snapshot = [copy.deepcopy(self._trips[t]) for t in self._dirty if t in self._trips]
+        self._dirty.clear()
+        return snapshot
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                self._flush_cond.wait_for(lambda: self._dirty)
+            time.sleep(FLUSH_DELAY_SECONDS)
+            self.flush()
+
+    def flush(self):
+        """Writes every dirty trip to disk now."""
+        # Flushes are serialized so an older snapshot never lands after a newer one,
+        # while the main lock is released so readers aren't blocked on disk I/O
+        with self._flush_lock:
+            with self._lock:
+                snapshot = self._take_dirty()
+            for trip_info in snapshot:
+                self._write_info(trip_info)
+            with self._lock:
+                for trip_info in snapshot:
+                    self._evict_if_ended(trip_info["trip_id"])
+
+    def _evict_if_ended(self, trip_id):
+        """Drops an ended trip from memory once it is on disk. Must be called with the lock held."""
+        cached = self._trips.get(trip_id)
+        if cached is not None and cached.get("trip_status") != "active" and trip_id not in self._dirty:
+            del self._trips[trip_id]
+
+    def _remember(self, trip_info):
+        self._trips[trip_info["trip_id"]] = trip_info
+        if trip_info.get("token"):
+            self._tokens[trip_info["token"]] = trip_info["trip_id"]
+
+    # --- Public API ---
+
+    def create(self, trip_info):
+        """Persists a new trip and makes it the latest one."""
+        trip_info = copy.deepcopy(trip_info)
+        trip_info.setdefault("token", secrets.token_urlsafe(16))
+        with self._lock:
+            # Written synchronously so the trip exists on disk before anyone can reference it
+            self._write_info(trip_info)
+            self._remember(trip_info)
+            self._set_latest(trip_info["trip_id"])
+            return copy.deepcopy(trip_info)
+
+    def get(self, trip_id):
+        """Returns a copy of the trip's info dict, or None if the trip doesn't exist."""
+        with timed_lock(self._lock, "trip_store"):
+            trip_info = self._get_cached(trip_id)
+            return copy.deepcopy(trip_info) if trip_info is not None else None
+
+    def _get_cached(self, trip_id, remember=False):
+        """
+        The authoritative copy of a trip. Ended trips read from disk are only
+        kept in memory when `remember` is set, i.e. when they are about to change.
+        """
+        with self._lock:
+            trip_info = self._trips.get(trip_id)
+            if trip_info is None:
+                try:
+                    trip_info = self._read_info(trip_id)
+                except ValueError:
+                    return None
+                if trip_info is not None and (remember or trip_info.get("trip_status") == "active"):
+                    self._remember(trip_info)
+            return trip_info
+
+    def resolve(self, trip_id=None, token=None):
+        """Maps a token (or else a trip ID) to the ID of an existing trip, or None."""
+        if token:
+            with self._lock:
+                return self._tokens.get(token)
+        if trip_id:
+            return trip_id if self._get_cached(trip_id) is not None else None
+        return None
+
+    def update(self, trip_id, mutate):
+        """
+        Applies `mutate(trip_info)` to the authoritative copy and schedules it to
+        be persisted. Returns the updated info, or None if the trip doesn't exist.
+        """
+        with timed_lock(self._lock, "trip_store"):
+            trip_info = self._get_cached(trip_id, remember=True)
+            if trip_info is None:
+                return None
+            mutate(trip_info)
+            self._mark_dirty(trip_id)
+            if trip_info.get("trip_status") != "active":
+                self._close_log(trip_id)
+            return copy.deepcopy(trip_info)
+
+    def events(self, trip_id):
+        """Returns the trip's EventLog. Only active trips' logs (and file handles) are kept open."""
+        with self._lock:
+            log = self._logs.get(trip_id)
+            replaced = log is not None and not os.path.exists(log.path) and os.path.exists(trip_archive_path(trip_id, self.root))
+            if log is None or replaced:
+                # Also reopened once an archive replaces the log (see jules.archive.archive_trip)
+                if log is not None:
+                    log.close()
+                log = open_trip_log(trip_id, self.root)
+                if self._trips.get(trip_id, {}).get("trip_status") == "active":
+                    self._logs[trip_id] = log
+            return log
+
+    def _stored_keys(self, trip_id, log):
+        """The trip's key index. Caller holds the trip's append lock, not the store lock."""
+        with self._lock:
+            keys = self._event_keys.get(trip_id)
+        if keys is None:
+            # First append since startup: index what is already in the log, once
+            keys = {event_key(e) for e in log.iter_events()}
+            with self._lock:
+                self._event_keys[trip_id] = keys
+        return keys
+
+    def append_events(self, trip_id, events):
+        """
+        Appends a batch of events in a single write, skipping any already
+        stored with the same timestamp and position (e.g. points re-sent by a
+        client retrying a batch). Points older than the last stored one are
+        kept, so a queued batch arriving after live points isn't lost.
+        Returns (accepted_count, cursor).
+
+        The store lock is only held to find the trip's log. The key index and
+        the write are guarded by a per-trip lock, so one trip's disk I/O never
+        holds up status reads or other trips' appends.
+        """
+        with timed_lock(self._lock, "trip_store"):
+            log = self.events(trip_id)
+            append_lock = self._append_locks.setdefault(trip_id, threading.Lock())
+        with timed_lock(append_lock, "trip_append"):
+            keys = self._stored_keys(trip_id, log)
+            fresh = {}
+            for event in events:
+                key = event_key(event)
+                if key not in keys:
+                    fresh.setdefault(key, event)
+            cursor = log.append_many(sorted(fresh.values(), key=event_epoch))
+            keys.update(fresh)  # Only once written, so a failed write can be retried
+            return len(fresh), cursor
+
+    def _close_log(self, trip_id):
+        self._event_keys.pop(trip_id, None)
+        self._append_locks.pop(trip_id, None)
+        log = self._logs.pop(trip_id, None)
+        if log is not None:
+            log.close()
+
+    def active_trips(self):
+        with self._lock:
+            return [copy.deepcopy(t) for t in self._trips.values() if t.get("trip_status") == "active"]
+
+    @contextmanager
+    def locked(self, trip_id):
+        """Holds off `delete()` (and flushes) for the block; yields whether the trip still exists."""
+        with self._flush_lock, self._lock:
+            yield self._get_cached(trip_id) is not None
+
+    def delete(self, trip_id):
+        # Holding the flush lock stops an in-progress flush from recreating the trip's files,
+        # and the append lock waits out a write in progress
+        with self._lock:
+            append_lock = self._append_locks.get(trip_id) or threading.Lock()
+        with self._flush_lock, append_lock, self._lock:
+            self._close_log(trip_id)
+            self._dirty.discard(trip_id)
+            # Ended trips may only be on disk, but their tokens are always indexed
+            trip_info = self._trips.pop(trip_id, None) or self._read_info(trip_id)
+            if trip_info and trip_info.get("token"):
+                self._tokens.pop(trip_info["token"], None)
+            path = trip_dir(trip_id, self.root)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            if self.latest_trip_id() == trip_id:
+                self._set_latest(None)
+
+    # --- Latest-trip pointer (used by single-traveller clients and the dashboard) ---
+
+    def _set_latest(self, trip_id):
+        self._latest = trip_id
+        pointer = os.path.join(self.root, LATEST_POINTER_FILE)
+        if trip_id is None:
+            if os.path.exists(pointer):
+                os.remove(pointer)
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with open(pointer, "w") as f:
+            f.write(trip_id)
+
+    def latest_trip_id(self):
+        if self._latest is None:
+            self._latest = read_latest_trip_id(self.root)
+        return self._latest
+
+def event_key(event):
+    """Identity of a stored event: a re-sent point has the same timestamp and position."""
+    return (event.get("timestamp"), event.get("lat"), event.get("lon"))
+
+def event_epoch(event):
+    """Epoch seconds of an event's ISO-8601 timestamp."""
+    return datetime.fromisoformat(event["timestamp"].replace("Z", "+00:00")).timestamp()
+
+def read_latest_trip_id(root=TRIPS_DIR):
+    """Reads the ID of the most recently started trip, or None."""
+    pointer = os.path.join(root, LATEST_POINTER_FILE)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r") as f:
+        return f.read().strip() or None
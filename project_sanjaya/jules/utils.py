@@ -1,9 +1,24 @@
 import json
 import os
-from math import radians, sin, cos, sqrt, atan2
+import threading
+import time
+from math import radians, sin, cos, sqrt, atan2, floor, ceil
+
+import numpy as np
+
+from jules.geovec import haversine_np
+from jules.metrics import AIRPORT_LOOKUPS, AIRPORT_RELOAD_SECONDS
 
 AIRPORTS_FILE = os.path.join(os.path.dirname(__file__), 'airports.json')
 
+def atomic_write_json(path, data, indent=2):
+    """Writes JSON to a temp file and renames it over `path`, so readers never see a torn file."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp_path, path)
+
 def haversine_distance(lat1, lon1, lat2, lon2):
     """Calculate the distance between two points on Earth in kilometers."""
     R = 6371  # Radius of Earth in kilometers
@@ -19,34 +34,165 @@ def haversine_distance(lat1, lon1, lat2, lon2):
 
     return R * c
 
-def check_airport_proximity(user_lat, user_lon):
+# --- Airport Registry ---
+
+GRID_CELL_DEG = 1.0  # Size of a spatial-index bucket in degrees
+RELOAD_CHECK_INTERVAL = 2.0  # Seconds between checks for an updated airports file
+KM_PER_DEG_LAT = 111.32
+
+class _AirportIndex:
     """
-    Check if a user's location is within the geofence of any airport.
-    Returns the airport information if a match is found, otherwise None.
+    One immutable load of the airports file: the airports, an IATA dict and
+    the grid. `AirportRegistry` swaps whole indexes, so a reader never sees
+    a mix of two loads.
     """
-    if not os.path.exists(AIRPORTS_FILE):
-        return None
 
-    with open(AIRPORTS_FILE, 'r') as f:
-        airports = json.load(f)
+    def __init__(self, airports, cell_deg):
+        self.airports = tuple(airports)
+        self.by_iata = {a['iata']: a for a in airports if a.get('iata')}
+        self.cell_deg = cell_deg
+        self.lon_cells = int(round(360.0 / cell_deg))
+        cells = {}
+        for airport in airports:
+            lat, lon, radius = airport['lat'], airport['lon'], airport.get('radius_km', 0)
+            dlat = radius / KM_PER_DEG_LAT
+            cos_lat = cos(radians(min(abs(lat) + dlat, 89.9)))
+            dlon = radius / (KM_PER_DEG_LAT * cos_lat)
+            row_lo, col_lo = self.cell(lat - dlat, lon - dlon)
+            row_hi, _ = self.cell(lat + dlat, lon + dlon)
+            col_span = int(ceil(2 * dlon / cell_deg)) + 1
+            if abs(lat) + dlat >= 90.0:
+                col_span = self.lon_cells  # The geofence covers a pole, and so every longitude
+            for row in range(row_lo, row_hi + 1):
+                for step in range(min(col_span, self.lon_cells)):
+                    cells.setdefault((row, (col_lo + step) % self.lon_cells), []).append(airport)
+        self.grid = {key: tuple(members) for key, members in cells.items()}
+        # Per-cell coordinate arrays for batch lookups, built on first use
+        self._arrays = {}
 
-    for airport in airports:
-        distance = haversine_distance(user_lat, user_lon, airport['lat'], airport['lon'])
-        if distance <= airport['radius_km']:
-            return airport
+    def cell(self, lat, lon):
+        return (int(floor(lat / self.cell_deg)), int(floor((lon % 360.0) / self.cell_deg)))
 
-    return None
+    def cell_arrays(self, key):
+        """(lats, lons, radii) of the airports in a cell, in file order."""
+        arrays = self._arrays.get(key)
+        if arrays is None:
+            members = self.grid.get(key, ())
+            arrays = self._arrays[key] = tuple(np.array([a[f] for a in members], dtype=np.float64)
+                                               for f in ('lat', 'lon', 'radius_km'))
+        return arrays
 
-def get_airport_coords(iata_code):
-    """Looks up an airport's coordinates by its IATA code."""
-    if not os.path.exists(AIRPORTS_FILE):
+class AirportRegistry:
+    """
+    In-memory airport index loaded once from `airports.json`.
+
+    Airports are bucketed on a lat/lon grid; each airport is registered in every
+    cell its `radius_km` geofence touches, so a lookup only runs haversine on the
+    handful of airports sharing the point's cell. The file is re-read only when
+    its mtime or size changes, and each load replaces the whole index at once.
+    """
+
+    def __init__(self, path, cell_deg=GRID_CELL_DEG):
+        self.path = path
+        self.cell_deg = cell_deg
+        self._lock = threading.Lock()
+        self._signature = None
+        self._last_check = 0.0
+        self._index = _AirportIndex([], cell_deg)
+
+    @property
+    def airports(self):
+        return self._index.airports
+
+    @property
+    def by_iata(self):
+        return self._index.by_iata
+
+    def refresh(self, force=False):
+        """Reloads the airports file if it changed on disk since the last load."""
+        now = time.monotonic()
+        if not force and now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._last_check = now
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                self._signature = None
+                self._index = _AirportIndex([], self.cell_deg)
+                return
+            signature = (st.st_mtime_ns, st.st_size)
+            if signature == self._signature and not force:
+                return
+            with AIRPORT_RELOAD_SECONDS.time(), open(self.path, 'r') as f:
+                self._index = _AirportIndex(json.load(f), self.cell_deg)
+            self._signature = signature
+
+    def get(self, iata_code):
+        self.refresh()
+        return self._index.by_iata.get(iata_code)
+
+    def find(self, lat, lon):
+        """Returns the first airport (in file order) whose geofence contains the point."""
+        self.refresh()
+        index = self._index
+        for airport in index.grid.get(index.cell(lat, lon), ()):
+            if haversine_distance(lat, lon, airport['lat'], airport['lon']) <= airport['radius_km']:
+                return airport
         return None
 
-    with open(AIRPORTS_FILE, 'r') as f:
-        airports = json.load(f)
+    def find_many(self, points):
+        """
+        `find` for a sequence of (lat, lon) pairs. Points are grouped by grid
+        cell and each cell's distances are computed as one NumPy array.
+        """
+        self.refresh()
+        index = self._index
+        coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        found = [None] * len(coords)
+        if not len(coords) or not index.grid:
+            return found
+        rows = np.floor(coords[:, 0] / index.cell_deg).astype(np.int64)
+        cols = np.floor(np.mod(coords[:, 1], 360.0) / index.cell_deg).astype(np.int64)
+        _, group = np.unique(rows * index.lon_cells + cols, return_inverse=True)
+        order = np.argsort(group, kind="stable")
+        for members in np.split(order, np.cumsum(np.bincount(group))[:-1]):
+            key = (int(rows[members[0]]), int(cols[members[0]]))
+            candidates = index.grid.get(key)
+            if not candidates:
+                continue
+            lats, lons, radii = index.cell_arrays(key)
+            inside = haversine_np(coords[members, :1], coords[members, 1:], lats, lons) <= radii
+            first = inside.argmax(axis=1)
+            for point, hit, i in zip(members, inside.any(axis=1), first):
+                if hit:
+                    found[point] = candidates[i]
+        return found
 
-    for airport in airports:
-        if airport['iata'] == iata_code:
-            return (airport['lat'], airport['lon'])
+airport_registry = AirportRegistry(AIRPORTS_FILE)
+_AIRPORT_HITS = AIRPORT_LOOKUPS.labels(result="hit")
+_AIRPORT_MISSES = AIRPORT_LOOKUPS.labels(result="miss")
 
-    return None
\ No newline at end of file
+def check_airport_proximity(user_lat, user_lon):
+    """
+    Check if a user's location is within the geofence of any airport.
+    Returns the airport information if a match is found, otherwise None.
+    """
+    airport = airport_registry.find(user_lat, user_lon)
+    (_AIRPORT_HITS if airport else _AIRPORT_MISSES).inc()
+    return airport
+
+def check_airport_proximity_many(points):
+    """Batch version of `check_airport_proximity` for an iterable of (lat, lon) pairs."""
+    airports = airport_registry.find_many(points)
+    hits = sum(1 for a in airports if a)
+    _AIRPORT_HITS.inc(hits)
+    _AIRPORT_MISSES.inc(len(airports) - hits)
+    return airports
+
+def get_airport_coords(iata_code):
+    """Looks up an airport's coordinates by its IATA code."""
+    airport = airport_registry.get(iata_code)
+    if airport is None:
+        return None
+    return (airport['lat'], airport['lon'])
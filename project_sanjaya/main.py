@@ -1,22 +1,128 @@
+import atexit
 import os
 import json
+import logging
 import sys
 import time
 import re
+import threading
 from datetime import datetime, timezone, timedelta
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify
 import uuid
 
 # Ensure the 'jules' module can be found
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from jules.utils import check_airport_proximity, haversine_distance
-from jules.aviation import get_flight_data
+from jules.trips import TripStore, trip_archive_path, trip_events_path, trip_map_image_path
+from jules.renderer import render_service
+from jules.archive import archive_trip
+from jules.stream import ChangeNotifier, SharedChangeNotifier, format_sse
+from jules.scheduler import StatusScheduler, flight_status_at
+from jules.aviation import SharedQuotaCounter, configure_client, get_flight_data
+from jules.analytics import AnalyticsCache
+from jules.export import FORMATS as EXPORT_FORMATS, export_chunks
+from jules.logs import setup_logging
+from jules import metrics
 
 # --- Constants & Configuration ---
+setup_logging()
+log = logging.getLogger("sanjaya.backend")
 app = Flask(__name__, template_folder='templates')
-TRIP_INFO_PATH = "logs/trip_info.json"
-TRIP_LOG_PATH = "logs/trip_log.json"
+# Resolved once, so background renders and archives never depend on the working directory
+TRIPS_DIR = os.path.abspath("logs/trips")
+# "files" keeps trip state in this process; "sqlite" shares it between the
+# worker processes started by `python -m jules.cluster serve`
+TRIP_STORE = os.environ.get("SANJAYA_TRIP_STORE", "files")
+if TRIP_STORE == "sqlite":
+    from jules.tripdb import SharedTripStore
+    trips = SharedTripStore(TRIPS_DIR)
+    changes = SharedChangeNotifier(trips.change_version)
+    # Every worker counts flight API calls against the same monthly budget
+    configure_client(quota=SharedQuotaCounter(trips.path))
+else:
+    trips = TripStore(TRIPS_DIR)
+    changes = ChangeNotifier()
+analytics = AnalyticsCache()
+
+MAX_BATCH_POINTS = 500
+# Every open /stream holds a Waitress thread until its client goes away. Past
+# this many, new streams get a 503 so /log and /log/batch always have threads.
+FINISHED_TRIP_STATUSES = ("ended", "none")  # Streams close once these have been sent
+MAX_STREAMS = int(os.environ.get("SANJAYA_MAX_STREAMS", "4"))
+STREAM_RETRY_SECONDS = 15
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+MAX_CLOCK_SKEW = timedelta(minutes=5)  # Reject client points stamped further in the future
+
+# Optional tile URL template for final map images, e.g. a local tile server for offline rendering
+MAP_TILES_URL = os.environ.get("SANJAYA_TILES_URL")
+MAP_TILES_ATTR = os.environ.get("SANJAYA_TILES_ATTR", "Map tiles")
+
+DEFAULT_USER_NAME = "Neelaksh Saxena"
+DEFAULT_FLIGHT_NUMBER = "6E451"
+DEFAULT_FLIGHT_INFO = {
+    "status": "scheduled",
+    "scheduled_departure": "2025-10-16T16:15:00+00:00", # Hardcoded BLR-LKO schedule
+    "scheduled_arrival": "2025-10-16T18:50:00+00:00",
+    "departure_iata": "BLR",
+    "arrival_iata": "LKO"
+}
+
+def request_trip_id():
+    """
+    Identifies the trip a request refers to by its secret `token`, taken from
+    the JSON body, the query string or an `X-Trip-Token` header. Trip IDs are
+    not secret (they show up in URLs, file names and exports), so they never
+    grant access, and there is no fallback to the latest trip.
+    """
+    data = request.get_json(silent=True) or {}
+    token = data.get("token") or request.args.get("token") or request.headers.get("X-Trip-Token")
+    return trips.resolve(token=token) if token else None
+
+def public_trip_info(trip_info):
+    """A trip's info as sent to clients: everything except its token."""
+    return {k: v for k, v in trip_info.items() if k != "token"}
+
+def trip_not_found():
+    return jsonify({"status": "error", "message": "Trip not found."}), 404
+
+# --- Instrumentation ---
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    metrics.REQUESTS_IN_PROGRESS.inc()
+
+@app.after_request
+def record_request(response):
+    # Route templates (not raw paths) keep label cardinality bounded.
+    # For /stream this times opening the stream, not its whole lifetime.
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    elapsed = time.perf_counter() - g.request_start
+    metrics.REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=str(response.status_code))
+    log.debug("Request handled", extra={"method": request.method, "route": route,
+                                        "status": response.status_code, "duration_ms": round(elapsed * 1000, 3)})
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    if "request_start" in g:
+        metrics.REQUESTS_IN_PROGRESS.dec()
+
+def event_log_bytes():
+    return sum(trips.events(t["trip_id"]).size() for t in trips.active_trips())
+
+metrics.EVENT_LOG_BYTES.set_function(event_log_bytes)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of the process's metrics."""
+    return Response(metrics.registry.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+@app.route('/healthz')
+def healthz():
+    """Readiness probe: answers as soon as the app has been imported and is serving."""
+    return jsonify({"status": "ok"})
 
 # --- Trip Management Endpoints ---
 
@@ -27,97 +133,332 @@ def index():
 
 @app.route('/start_trip', methods=['POST'])
 def start_trip():
-    """Starts a trip with hardcoded flight details."""
+    """
+    Starts a new trip. User and flight details may be passed as JSON; a bare
+    `flight_number` is looked up through `jules.aviation`. Otherwise defaults are used.
+    This is the only response that includes the trip's `token`, which every
+    later request about the trip must present.
+    """
+    data = request.get_json(silent=True) or {}
+    for field in ("flight_number", "flight_date", "user_name"):
+        if data.get(field) is not None and not isinstance(data[field], str):
+            return jsonify({"status": "error", "message": f"Expected {field} to be a string."}), 400
     trip_info = {
         "trip_id": str(uuid.uuid4()),
-        "user_name": "Neelaksh Saxena",
-        "flight_number": "6E451",
+        "user_name": data.get("user_name") or DEFAULT_USER_NAME,
+        "flight_number": data.get("flight_number") or DEFAULT_FLIGHT_NUMBER,
         "trip_start_time": datetime.now(timezone.utc).isoformat(),
         "trip_status": "active",
-        "flight_info": {
-            "status": "scheduled",
-            "scheduled_departure": "2025-10-16T16:15:00+00:00", # Hardcoded BLR-LKO schedule
-            "scheduled_arrival": "2025-10-16T18:50:00+00:00"
-        }
+        "flight_info": dict(data.get("flight_info") or DEFAULT_FLIGHT_INFO)
     }
+    if data.get("flight_number") and not data.get("flight_info"):
+        # Cached and coalesced, so many travellers on one flight cost a single upstream call
+        trip_info["flight_info"] = get_flight_data(data["flight_number"], data.get("flight_date"))
 
-    with open(TRIP_INFO_PATH, "w") as f: json.dump(trip_info, f, indent=2)
-    with open(TRIP_LOG_PATH, "w") as f: json.dump({"events": []}, f, indent=2)
+    trip_info = trips.create(trip_info)
+    status_scheduler.schedule(trip_info["trip_id"], trip_info["flight_info"])
+    changes.notify()
 
-    print(f"Trip started for {trip_info['user_name']}.")
+    log.info("Trip started", extra={"trip_id": trip_info["trip_id"], "user_name": trip_info["user_name"]})
     return jsonify(trip_info)
 
 @app.route('/log', methods=['POST'])
 def log_location():
     data = request.get_json()
-    with open(TRIP_INFO_PATH, "r+") as f_info:
-        trip_info = json.load(f_info)
-        log_entry = { "lat": data['lat'], "lon": data['lon'], "timestamp": datetime.now(timezone.utc).isoformat(), "source": "web" }
-        with open(TRIP_LOG_PATH, "r+") as f_log:
-            log_data = json.load(f_log)
-            log_data["events"].append(log_entry)
-            f_log.seek(0); json.dump(log_data, f_log, indent=2)
-    return jsonify({"status": "success"})
+    trip_id = request_trip_id()
+    trip_info = trips.get(trip_id) if trip_id else None
+    if trip_info is None:
+        return trip_not_found()
+    if trip_info.get("trip_status") != "active":
+        return jsonify({"status": "error", "message": "Trip is not active."}), 409
+    log_entry = { "lat": data['lat'], "lon": data['lon'], "timestamp": datetime.now(timezone.utc).isoformat(), "source": "web" }
+    accepted, cursor = trips.append_events(trip_id, [log_entry])
+    if accepted:
+        changes.notify()
+    return jsonify({"status": "success" if accepted else "duplicate", "accepted": accepted, "cursor": cursor})
+
+def parse_point(point, now):
+    """
+    Validates one client-side point and converts it into a log entry.
+    `timestamp` may be epoch milliseconds (as reported by the Geolocation API)
+    or an ISO-8601 string. Returns None for malformed or implausible points.
+    """
+    try:
+        lat, lon = float(point['lat']), float(point['lon'])
+        ts = point.get('timestamp')
+        if ts is None:
+            when = now
+        elif isinstance(ts, (int, float)):
+            when = datetime.fromtimestamp(ts / 1000.0, tz=timezone.utc)
+        else:
+            when = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+    except (KeyError, TypeError, ValueError, OverflowError, OSError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or when > now + MAX_CLOCK_SKEW:
+        return None
+    return { "lat": lat, "lon": lon, "timestamp": when.astimezone(timezone.utc).isoformat(), "source": "web" }
+
+@app.route('/log/batch', methods=['POST'])
+def log_location_batch():
+    """
+    Accepts `{"token": ..., "points": [{"lat", "lon", "timestamp"}, ...]}` from
+    clients that buffer points while offline. Points are validated, deduplicated
+    and written to the trip's event log in a single append. The response counts
+    `duplicates` (already stored) and lists the indexes of `rejected` points
+    (malformed or implausible), which will never be accepted.
+    """
+    data = request.get_json(silent=True) or {}
+    points = data.get('points')
+    if not isinstance(points, list) or len(points) > MAX_BATCH_POINTS:
+        return jsonify({"status": "error", "message": f"Expected a list of at most {MAX_BATCH_POINTS} points."}), 400
+    trip_id = request_trip_id()
+    trip_info = trips.get(trip_id) if trip_id else None
+    if trip_info is None:
+        return trip_not_found()
+    if trip_info.get("trip_status") != "active":
+        return jsonify({"status": "error", "message": "Trip is not active."}), 409
+
+    now = datetime.now(timezone.utc)
+    entries, rejected = [], []
+    for index, point in enumerate(points):
+        entry = parse_point(point, now) if isinstance(point, dict) else None
+        if entry is None:
+            rejected.append(index)
+        else:
+            entries.append(entry)
+    accepted, cursor = trips.append_events(trip_id, entries)
+    if accepted:
+        changes.notify()
+    return jsonify({"status": "success", "received": len(points), "accepted": accepted,
+                    "duplicates": len(entries) - accepted, "rejected": rejected, "cursor": cursor})
 
 @app.route('/end_trip', methods=['POST'])
 def end_trip():
-    with open(TRIP_INFO_PATH, "r+") as f:
-        trip_info = json.load(f)
+    trip_id = request_trip_id()
+    def mark_ended(trip_info):
         trip_info["trip_status"] = "ended"
         trip_info["trip_end_time"] = datetime.now(timezone.utc).isoformat()
-        f.seek(0); f.truncate(); json.dump(trip_info, f, indent=2)
-    return jsonify(trip_info)
+    trip_info = trips.update(trip_id, mark_ended) if trip_id else None
+    if trip_info is None:
+        return trip_not_found()
+    status_scheduler.cancel(trip_id)
+    changes.notify()
+    # Render the final map image in the background; the dashboard picks it up when ready
+    render = render_service.submit_trip(
+        trip_id, trip_events_path(trip_id, TRIPS_DIR), trip_map_image_path(trip_id, TRIPS_DIR),
+        tiles=MAP_TILES_URL, attr=MAP_TILES_ATTR if MAP_TILES_URL else None
+    )
+    def after_render(future):
+        log_render_failure(trip_id, future)
+        # The render reads the event log, which the archive replaces
+        threading.Thread(target=archive_ended_trip, args=(trip_info,), daemon=True, name="trip-archiver").start()
+    render.add_done_callback(after_render)
+    return jsonify(public_trip_info(trip_info))
+
+def log_render_failure(trip_id, future):
+    """Logs a final map render that failed; nothing else waits on its future."""
+    if not future.cancelled() and future.exception() is not None:
+        log.error("Rendering the final map failed", extra={"trip_id": trip_id}, exc_info=future.exception())
+
+def archive_ended_trip(trip_info):
+    """Replaces an ended trip's event log with its compact columnar archive."""
+    trip_id = trip_info["trip_id"]
+    try:
+        path = archive_trip(trip_id, TRIPS_DIR, trip_info=public_trip_info(trip_info), store=trips)
+        if path is None:
+            log.info("Trip not archived: it was deleted or has no points", extra={"trip_id": trip_id})
+            return
+        log.info("Trip archived", extra={"trip_id": trip_id, "path": path})
+    except (OSError, ValueError):
+        log.exception("Archiving trip failed", extra={"trip_id": trip_id})
+
+@app.route('/flight_info', methods=['POST'])
+def update_flight_info():
+    """
+    Updates a trip's flight details (e.g. a delayed `scheduled_departure`).
+    The status scheduler is re-armed from the new schedule.
+    """
+    data = request.get_json(silent=True) or {}
+    updates = data.get("flight_info")
+    if not isinstance(updates, dict):
+        return jsonify({"status": "error", "message": "Expected a flight_info object."}), 400
+    trip_id = request_trip_id()
+    def merge(trip_info):
+        trip_info.setdefault("flight_info", {}).update(updates)
+    trip_info = trips.update(trip_id, merge) if trip_id else None
+    if trip_info is None:
+        return trip_not_found()
+    if trip_info.get("trip_status") == "active":
+        status_scheduler.schedule(trip_id, trip_info["flight_info"])
+    changes.notify()
+    return jsonify(public_trip_info(trip_info))
 
 @app.route('/status')
 def get_status():
-    if not os.path.exists(TRIP_INFO_PATH):
-        return jsonify({"trip_status": "none"})
-    with open(TRIP_INFO_PATH, "r") as f:
-        trip_info = json.load(f)
-    return jsonify({
+    """Status of the trip whose token is given; `{"trip_status": "none"}` without a valid one."""
+    return jsonify(read_status(request_trip_id()))
+
+def read_status(trip_id, details=False):
+    """`details` adds the trip's public info, for stream clients that display it (e.g. the dashboard)."""
+    trip_info = trips.get(trip_id) if trip_id else None
+    if trip_info is None:
+        return {"trip_status": "none"}
+    status = {
+        "trip_id": trip_id,
         "trip_status": trip_info.get("trip_status"),
         "flight_status": trip_info.get("flight_info", {}).get("status")
-    })
+    }
+    if details:
+        status["trip_info"] = public_trip_info(trip_info)
+    return status
+
+@app.route('/analytics')
+def get_analytics():
+    """Stops, speed/heading profile and travel-mode segments for a trip."""
+    trip_id = request_trip_id()
+    trip_info = trips.get(trip_id) if trip_id else None
+    if trip_info is None:
+        return trip_not_found()
+    # The per-point profiles grow with the trip; they are only built when asked for
+    summary = analytics.summary(trip_id, trips.events(trip_id), trip_info.get("flight_info"),
+                                profile=request.args.get("profile") == "1")
+    return jsonify({"trip_id": trip_id, **summary})
+
+@app.route('/export/<fmt>')
+def export_trip(fmt):
+    """
+    Streams the trip as GeoJSON, GPX, SVG or PNG straight from its event log
+    (see `jules/export.py`). No browser is needed and memory stays bounded
+    for any trip length.
+    """
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"status": "error", "message": f"Unknown format; expected one of {', '.join(EXPORT_FORMATS)}."}), 404
+    trip_id = request_trip_id()
+    trip_info = trips.get(trip_id) if trip_id else None
+    if trip_info is None:
+        return trip_not_found()
+    chunks = export_chunks(fmt, trips.events(trip_id).iter_events, public_trip_info(trip_info))
+    headers = {"Content-Disposition": f'attachment; filename="{trip_id}.{fmt}"'}
+    return Response(chunks, mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+@app.route('/stream')
+def stream():
+    """
+    Server-Sent Events feed of a trip's new location events and status changes.
+    Clients resume with `?cursor=N` or the standard `Last-Event-ID` header; the
+    cursor is the event-log byte offset sent as each message's id. Status
+    events carry the trip's public info. The stream closes once the trip has
+    ended (or is gone) and everything has been sent. Each open stream occupies a Waitress
+    thread, so at most `MAX_STREAMS` are served at once; beyond that clients
+    get a 503 with `Retry-After` and can poll /status meanwhile.
+    """
+    trip_id = request_trip_id()
+    if trip_id is None:
+        return trip_not_found()
+    if not stream_slots.acquire(blocking=False):
+        response = jsonify({"status": "error", "message": "Too many open streams; retry later or poll /status."})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(STREAM_RETRY_SECONDS)
+        return response
+    cursor = request.args.get('cursor', request.headers.get('Last-Event-ID', 0))
+    try:
+        cursor = max(int(cursor), 0)
+    except ValueError:
+        cursor = 0
+
+    def generate(cursor):
+        last_status = None
+        version = changes.version
+        while True:
+            status = read_status(trip_id, details=True)
+            if status != last_status:
+                last_status = status
+                yield format_sse(status, event="status")
+
+            events, cursor, reset = read_trip_events(trip_id, cursor)
+            if events or reset:
+                yield format_sse({"events": events, "cursor": cursor, "reset": reset}, event="locations", event_id=cursor)
+            if status["trip_status"] in FINISHED_TRIP_STATUSES:
+                # Everything has been sent and no more points will come; free the slot
+                return
+
+            new_version = changes.wait(version)
+            if new_version == version:
+                yield ": keepalive\n\n"
+            version = new_version
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    response = Response(generate(cursor), mimetype="text/event-stream", headers=headers)
+    # Runs when the server closes the response, including after the client disconnects
+    response.call_on_close(stream_slots.release)
+    return response
+
+def read_trip_events(trip_id, cursor):
+    """
+    (events, new cursor, reset) for a stream at `cursor`. The log is looked up
+    on every read: once a trip ends, its archive replaces the log with the
+    same cursors, which must not look like a reset to followers.
+    """
+    for _ in range(2):
+        trip_log = trips.events(trip_id)
+        reset = cursor > trip_log.size()
+        events, end = trip_log.read_from(0 if reset else cursor)
+        if os.path.exists(trip_log.path) or not os.path.exists(trip_archive_path(trip_id, TRIPS_DIR)):
+            break
+        # The archive replaced the log while it was being read; read the archive instead
+    return events, end, reset
 
 @app.route('/reset_trip', methods=['POST'])
 def reset_trip():
-    if os.path.exists(TRIP_INFO_PATH):
-        os.remove(TRIP_INFO_PATH)
-    if os.path.exists(TRIP_LOG_PATH):
-        os.remove(TRIP_LOG_PATH)
-    print("Trip data has been reset.")
+    trip_id = request_trip_id()
+    if trip_id is None:
+        return trip_not_found()
+    status_scheduler.cancel(trip_id)
+    trips.delete(trip_id)
+    analytics.discard(trip_id)
+    changes.notify()
+    log.info("Trip data reset", extra={"trip_id": trip_id})
     return jsonify({"status": "success"})
 
 # --- Time-Based Status Updater ---
-def time_based_status_thread():
-    print("⏰ Time-based status updater thread started.")
-    while True:
-        time.sleep(60) # Check every minute
-        if not os.path.exists(TRIP_INFO_PATH):
-            continue
-
-        with open(TRIP_INFO_PATH, "r+") as f:
-            trip_info = json.load(f)
-            if trip_info.get("trip_status") != "active":
-                continue
-
-            flight_info = trip_info.get("flight_info", {})
-            now = datetime.now(timezone.utc)
-
-            dep_time = datetime.fromisoformat(flight_info['scheduled_departure'])
-            arr_time = datetime.fromisoformat(flight_info['scheduled_arrival'])
-            boarding_time = dep_time - timedelta(minutes=45)
-
-            new_status = flight_info['status']
-            if boarding_time <= now < dep_time:
-                new_status = 'boarding'
-            elif dep_time <= now < arr_time:
-                new_status = 'in_flight'
-            elif now >= arr_time:
-                new_status = 'landed'
-
-            if new_status != flight_info['status']:
-                flight_info['status'] = new_status
-                trip_info['flight_info'] = flight_info
-                f.seek(0); f.truncate(); json.dump(trip_info, f, indent=2)
-                print(f"Status updated to: {new_status}")
\ No newline at end of file
+def apply_scheduled_status(trip_id):
+    """Scheduler callback: moves a trip's flight status to match its schedule."""
+    trip_info = trips.get(trip_id)
+    if trip_info is None or trip_info.get("trip_status") != "active":
+        return None
+    new_status = flight_status_at(trip_info.get("flight_info", {}), datetime.now(timezone.utc))
+    if new_status != trip_info.get("flight_info", {}).get("status"):
+        def set_status(info):
+            info.setdefault("flight_info", {})["status"] = new_status
+        trip_info = trips.update(trip_id, set_status)
+        if trip_info is None:
+            return None  # Deleted while we were deciding
+        changes.notify()
+        log.info("Flight status updated", extra={"trip_id": trip_id, "flight_status": new_status})
+    return trip_info.get("flight_info", {})
+
+status_scheduler = StatusScheduler(apply_scheduled_status)
+scheduler_leader = None
+
+def start_background_services():
+    """
+    Arms timers for every active trip and starts the status scheduler. This runs
+    when the server process imports the app, so the scheduler shares the
+    server's in-memory trip state. With a shared store, the worker processes
+    elect one of themselves to run it instead.
+    """
+    global scheduler_leader
+    if TRIP_STORE == "sqlite":
+        from jules.cluster import SchedulerLeader
+        scheduler_leader = SchedulerLeader(trips, status_scheduler).start()
+        atexit.register(scheduler_leader.stop)
+        log.info("Status scheduler leader election started", extra={"holder": scheduler_leader.holder})
+        return
+    for trip_info in trips.active_trips():
+        status_scheduler.schedule(trip_info["trip_id"], trip_info.get("flight_info", {}))
+    status_scheduler.start()
+    log.info("Time-based status scheduler started")
+
+start_background_services()
@@ -3,97 +3,190 @@ import sys
 import time
 import atexit
 import os
+import json
+import logging
+import queue
 import threading
-from pyngrok import ngrok, conf
-
-# Import the background thread functions
-from main import time_based_status_thread
+from jules.logs import setup_logging
+from jules.probes import ServiceNotReady, wait_until_ready
 
 # --- Configuration ---
 FLASK_PORT = 5000
 STREAMLIT_PORT = 8501
 WAITRESS_THREADS = 8
+# More than one runs the backend as worker processes sharing a SQLite trip store (jules/cluster.py)
+BACKEND_WORKERS = int(os.environ.get("SANJAYA_WORKERS", "1"))
 FLASK_APP_MODULE = "main:app"
 STREAMLIT_APP_FILE = "dashboard/app.py"
 NGROK_CONFIG_FILE = "ngrok.yml"
+TILE_SERVER_PORT = 8765
+# Read by the dashboard once the tunnel is up
+PUBLIC_URL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "public_url.txt")
+SERVICE_READY_TIMEOUT = 60
+STARTUP_BUDGET_SECONDS = 15.0             # Warn when the whole stack takes longer than this to come up
+# Serve map tiles from the local cache (jules/tiles.py) instead of remote tile servers
+LOCAL_TILES = os.environ.get("SANJAYA_LOCAL_TILES", "0") == "1"
+
+setup_logging()
+log = logging.getLogger("sanjaya.launcher")
 
 # --- Global Process Management ---
 processes = []
 ngrok_tunnel = None
 
+# Fields of a child's JSON log line that map onto the LogRecord itself
+_CHILD_LOG_FIELDS = ("ts", "level", "logger", "msg")
+
+def pump_output(process, service, stream_name):
+    """
+    Drains one child pipe on a background thread, re-emitting each line through
+    the structured log, so a chatty child never blocks on a full pipe. Lines that
+    are already JSON log records keep their fields.
+    """
+    stream = getattr(process, stream_name)
+    child_log = logging.getLogger(f"sanjaya.{service}")
+    def pump():
+        for raw in iter(stream.readline, b""):
+            line = raw.decode("utf-8", errors="replace").rstrip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict) and "msg" in record:
+                level = logging.getLevelName(str(record.get("level", "info")).upper())
+                extra = {k: v for k, v in record.items() if k not in _CHILD_LOG_FIELDS}
+                extra.update(service=service, child_logger=record.get("logger"))
+                child_log.log(level if isinstance(level, int) else logging.INFO, record["msg"], extra=extra)
+            else:
+                child_log.info(line, extra={"service": service, "stream": stream_name})
+        stream.close()
+    threading.Thread(target=pump, daemon=True, name=f"{service}-{stream_name}").start()
+
+def start_service(args, service):
+    """Starts a child process with both output pipes drained into the log."""
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    processes.append(process)
+    pump_output(process, service, "stdout")
+    pump_output(process, service, "stderr")
+    return process
+
 def cleanup():
     """Ensure all child processes and ngrok tunnels are terminated on exit."""
-    print("Shutting down all services...")
+    log.info("Shutting down all services")
     for p in processes:
         if p.poll() is None:
             p.terminate()
             p.wait()
     if ngrok_tunnel:
+        from pyngrok import ngrok
         ngrok.disconnect(ngrok_tunnel.public_url)
-    print("All services stopped.")
+    if os.path.exists(PUBLIC_URL_FILE):
+        os.remove(PUBLIC_URL_FILE)
+    log.info("All services stopped")
 
 atexit.register(cleanup)
 
+def open_tunnel():
+    """Opens the public ngrok tunnel to the backend and publishes its URL to the dashboard."""
+    global ngrok_tunnel
+    # pyngrok is only needed here, so it loads on this worker thread while the services start
+    from pyngrok import ngrok, conf
+    conf.get_default().config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), NGROK_CONFIG_FILE)
+    ngrok_tunnel = ngrok.connect(FLASK_PORT, "http")
+    os.makedirs(os.path.dirname(PUBLIC_URL_FILE), exist_ok=True)
+    with open(PUBLIC_URL_FILE, "w") as f:
+        f.write(ngrok_tunnel.public_url)
+    return ngrok_tunnel.public_url
+
+def service_specs():
+    """(name, command, health URL) for every child service, in no particular order."""
+    specs = []
+    if LOCAL_TILES and not os.environ.get("SANJAYA_TILES_URL"):
+        specs.append(("tiles", [
+            sys.executable, "-m", "jules.tiles", "serve", "--port", str(TILE_SERVER_PORT), "--prefetch-airports"
+        ], f"http://127.0.0.1:{TILE_SERVER_PORT}/healthz"))
+        # Inherited by the backend (final map images) and the dashboard (live map)
+        os.environ["SANJAYA_TILES_URL"] = f"http://127.0.0.1:{TILE_SERVER_PORT}/tiles/{{z}}/{{x}}/{{y}}.png"
+        os.environ.setdefault("SANJAYA_TILES_ATTR", os.environ.get("SANJAYA_TILES_UPSTREAM_ATTR", "Map tiles"))
+    if BACKEND_WORKERS > 1:
+        backend = [sys.executable, "-m", "jules.cluster", "serve", "--workers", str(BACKEND_WORKERS),
+                   "--threads", str(WAITRESS_THREADS), "--host", "0.0.0.0", "--port", str(FLASK_PORT), FLASK_APP_MODULE]
+    else:
+        backend = ["waitress-serve", f"--threads={WAITRESS_THREADS}",
+                   f"--host=0.0.0.0", f"--port={FLASK_PORT}", FLASK_APP_MODULE]
+    specs.append(("waitress", backend, f"http://127.0.0.1:{FLASK_PORT}/healthz"))
+    # The dashboard picks up the tracking URL from PUBLIC_URL_FILE, so it needn't wait for the tunnel
+    specs.append(("streamlit", [
+        sys.executable, "-m", "streamlit", "run", STREAMLIT_APP_FILE, "--server.port", str(STREAMLIT_PORT)
+    ], f"http://127.0.0.1:{STREAMLIT_PORT}/_stcore/health"))
+    return specs
+
 def run():
     """
     Launches the backend, frontend, and a public ngrok tunnel for the tracking link.
+    Everything starts at once; each service is then probed until it answers,
+    so the banner only appears when the stack is actually usable.
     """
-    print("🚀 Launching Project Sanjaya (Render Edition)...")
+    log.info("Launching Project Sanjaya")
+    launched_at = time.perf_counter()
+    if os.path.exists(PUBLIC_URL_FILE):
+        os.remove(PUBLIC_URL_FILE)
 
-    # --- Start Waitress Server ---
-    try:
-        waitress_process = subprocess.Popen([
-            "waitress-serve", f"--threads={WAITRESS_THREADS}",
-            f"--host=0.0.0.0", f"--port={FLASK_PORT}", FLASK_APP_MODULE
-        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        processes.append(waitress_process)
-        print(f"✅ Waitress server started with PID: {waitress_process.pid}")
-    except Exception as e:
-        print(f"❌ Failed to start Waitress: {e}"); sys.exit(1)
-
-    # --- Start Background Threads ---
-    status_updater = threading.Thread(target=time_based_status_thread, daemon=True)
-    status_updater.start()
-    print("✅ Time-based status updater thread started.")
-
-    # --- Configure and start ngrok tunnel for Flask ---
-    try:
-        conf.get_default().config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), NGROK_CONFIG_FILE)
+    # The status scheduler runs inside the Waitress process (see main.start_background_services)
+    children = {}
+    for name, args, health_url in service_specs():
+        try:
+            children[name] = (start_service(args, name), health_url)
+        except OSError as e:
+            log.error("Failed to start %s: %s", name, e); sys.exit(1)
+        log.info("Service started", extra={"service": name, "pid": children[name][0].pid})
 
-        print("Starting ngrok tunnel for tracking link...")
-        global ngrok_tunnel
-        ngrok_tunnel = ngrok.connect(FLASK_PORT, "http")
-        public_url = ngrok_tunnel.public_url
+    # Probes and the tunnel run on daemon threads, so a failure can exit without waiting on the rest
+    done = queue.Queue()
+    def in_background(name, task):
+        def target():
+            try:
+                done.put((name, task(), None))
+            except Exception as e:
+                done.put((name, None, e))
+        threading.Thread(target=target, daemon=True, name=f"{name}-startup").start()
 
-        print("="*60)
-        print(f"📲 YOUR PUBLIC TRACKING URL: {public_url}")
-        print(f"🖥️  YOUR LOCAL DASHBOARD URL: http://localhost:{STREAMLIT_PORT}")
-        print("="*60)
-    except Exception as e:
-        print(f"❌ Failed to start ngrok tunnel: {e}"); sys.exit(1)
+    for name, (process, health_url) in children.items():
+        in_background(name, lambda p=process, url=health_url: wait_until_ready(url, p, timeout=SERVICE_READY_TIMEOUT))
+    in_background("ngrok", open_tunnel)
 
-    # --- Launch Streamlit Frontend ---
-    try:
-        print(f"Starting Streamlit dashboard...")
-        streamlit_process = subprocess.Popen(
-            [sys.executable, "-m", "streamlit", "run", STREAMLIT_APP_FILE,
-             "--server.port", str(STREAMLIT_PORT), "--",
-             public_url],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        processes.append(streamlit_process)
-        print(f"✅ Streamlit dashboard started with PID: {streamlit_process.pid}")
-    except Exception as e:
-        print(f"❌ Failed to start Streamlit dashboard: {e}"); sys.exit(1)
-
-    print(f"\n🎉 Project Sanjaya is running!")
+    timings, public_url = {}, None
+    for _ in range(len(children) + 1):
+        name, result, error = done.get()
+        if error is not None:
+            reason = "failed to become ready" if isinstance(error, ServiceNotReady) else "failed to start"
+            log.error("%s %s: %s", name, reason, error); sys.exit(1)
+        timings[name] = time.perf_counter() - launched_at
+        if name == "ngrok":
+            public_url = result
+        log.info("Service ready", extra={"service": name, "ready_s": round(timings[name], 3)})
+
+    startup_s = max(timings.values())
+    log.info("Startup complete", extra={"startup_s": round(startup_s, 3),
+                                        **{f"{k}_ready_s": round(v, 3) for k, v in timings.items()}})
+    if startup_s > STARTUP_BUDGET_SECONDS:
+        log.warning("Startup exceeded its budget", extra={"startup_s": round(startup_s, 3),
+                                                          "budget_s": STARTUP_BUDGET_SECONDS})
+
+    print("="*60)
+    print(f"📲 YOUR PUBLIC TRACKING URL: {public_url}")
+    print(f"🖥️  YOUR LOCAL DASHBOARD URL: http://localhost:{STREAMLIT_PORT}")
+    print("="*60)
+    print(f"\n🎉 Project Sanjaya is running! (ready in {startup_s:.1f}s)")
     print("Press Ctrl+C in this window to stop all services.")
 
     try:
-        waitress_process.wait()
+        children["waitress"][0].wait()
     except KeyboardInterrupt:
-        print("\n🛑 Ctrl+C received.")
+        log.info("Ctrl+C received")
         sys.exit(0)
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()
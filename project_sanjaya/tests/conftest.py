@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+# Flight schedule in the past: the status scheduler has nothing to arm and no lookup is made
+PAST_FLIGHT_INFO = {
+    "status": "landed",
+    "scheduled_departure": "2025-10-16T16:15:00+00:00",
+    "scheduled_arrival": "2025-10-16T18:50:00+00:00",
+}
+
+@pytest.fixture(scope="session")
+def backend(tmp_path_factory):
+    """The `main` module, imported with its relative `logs/trips` under a throwaway directory."""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("backend"))
+    os.environ.setdefault("SANJAYA_LOG_LEVEL", "WARNING")
+    try:
+        import main
+    finally:
+        os.chdir(cwd)
+    yield main
+    main.trips.flush()
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+@pytest.fixture
+def start_trip(client):
+    """Starts a trip and returns the /start_trip response body (including its token)."""
+    def start(**body):
+        body.setdefault("flight_info", PAST_FLIGHT_INFO)
+        response = client.post("/start_trip", json=body)
+        assert response.status_code == 200
+        return response.get_json()
+    return start
@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+import pytest
+
+from jules import utils
+from jules.utils import AirportRegistry
+
+AIRPORTS = [
+    {"iata": "BLR", "lat": 13.1986, "lon": 77.7066, "radius_km": 5},
+    {"iata": "BIG", "lat": 13.2, "lon": 77.7, "radius_km": 50},       # Overlaps BLR; later in the file
+    {"iata": "SUV", "lat": -18.0433, "lon": 178.5592, "radius_km": 5},
+    {"iata": "DAT", "lat": 0.0, "lon": 179.95, "radius_km": 20},      # Geofence crosses the antimeridian
+    {"iata": "EDG", "lat": 0.99, "lon": 10.99, "radius_km": 5},       # Geofence spans four grid cells
+    {"iata": "POL", "lat": 89.95, "lon": 0.0, "radius_km": 20},       # Geofence reaches over the pole
+]
+
+@pytest.fixture
+def registry(tmp_path):
+    path = tmp_path / "airports.json"
+    path.write_text(json.dumps(AIRPORTS))
+    return AirportRegistry(str(path))
+
+def test_lookup_by_iata_and_position(registry):
+    assert registry.get("SUV")["lat"] == -18.0433
+    assert registry.get("XXX") is None
+    assert registry.find(13.1986, 77.7066)["iata"] == "BLR"  # First in file order
+    assert registry.find(13.5, 77.7)["iata"] == "BIG"
+    assert registry.find(40.0, 40.0) is None
+
+@pytest.mark.parametrize("lat, lon, iata", [
+    (0.0, -179.95, "DAT"), (0.05, 179.99, "DAT"),
+    (1.01, 11.01, "EDG"), (0.97, 10.97, "EDG"), (1.01, 10.97, "EDG"),
+    (89.95, 180.0, "POL"), (89.99, -90.0, "POL"),
+])
+def test_geofences_reach_into_neighbouring_cells(registry, lat, lon, iata):
+    assert registry.find(lat, lon)["iata"] == iata
+    assert registry.find_many([(lat, lon)])[0]["iata"] == iata
+
+def test_batch_lookup_matches_single_lookups(registry):
+    rng = np.random.default_rng(3)
+    near = [(a["lat"] + dy, a["lon"] + dx) for a in AIRPORTS for dy, dx in rng.uniform(-0.5, 0.5, (50, 2))]
+    anywhere = list(zip(rng.uniform(-90, 90, 500), rng.uniform(-180, 180, 500)))
+    points = near + anywhere
+    assert registry.find_many(points) == [registry.find(lat, lon) for lat, lon in points]
+    assert registry.find_many([]) == []
+
+def test_changed_file_is_reloaded_whole(registry, monkeypatch):
+    monkeypatch.setattr(utils, "RELOAD_CHECK_INTERVAL", 0)
+    assert registry.get("BLR") is not None
+    index = registry._index
+    with open(registry.path, "w") as f:
+        json.dump([{"iata": "LKO", "lat": 26.7606, "lon": 80.8893, "radius_km": 5}], f)
+    assert registry.get("BLR") is None and registry.get("LKO") is not None
+    assert registry.find(13.1986, 77.7066) is None
+    # The previous load is untouched, so readers holding it stay consistent
+    assert index.by_iata["BLR"] in index.airports
+    assert [a["iata"] for a in registry.airports] == ["LKO"]
+
+def test_a_missing_file_means_no_airports(tmp_path):
+    registry = AirportRegistry(str(tmp_path / "missing.json"))
+    assert registry.find(13.1986, 77.7066) is None and registry.airports == ()
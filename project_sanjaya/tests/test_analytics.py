@@ -0,0 +1,70 @@
+import os
+import threading
+
+from jules.analytics import AnalyticsCache, TripAnalyzer
+from jules.eventlog import EventLog
+
+def drive(n, start=0):
+    return [{"lat": 12.9 + i * 0.001, "lon": 77.5, "timestamp": f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}+00:00"}
+            for i in range(start, start + n)]
+
+def test_profiles_are_built_only_when_asked():
+    analyzer = TripAnalyzer(airport_lookup=None)
+    for event in drive(5):
+        analyzer.update_event(event)
+    assert "speed_profile" not in analyzer.summary()
+    summary = analyzer.summary(profile=True)
+    assert len(summary["speed_profile"]) == len(summary["heading_profile"]) == 5
+
+def test_cache_only_reads_new_events(tmp_path):
+    log = EventLog(str(tmp_path / "events.jsonl"))
+    log.append_many(drive(10))
+    cache = AnalyticsCache()
+    assert cache.summary("trip", log, {})["points"] == 10
+    log.append_many(drive(5, start=10))
+    assert cache.summary("trip", log, {}, profile=True)["points"] == 15
+    # A new schedule rebuilds the analyzer from the start of the log
+    schedule = {"scheduled_departure": "2025-01-01T00:00:05+00:00", "scheduled_arrival": "2025-01-01T00:00:08+00:00"}
+    assert cache.summary("trip", log, schedule)["points"] == 15
+
+class SlowLog:
+    """An event log whose reads block until released."""
+
+    def __init__(self):
+        self.reading = threading.Event()
+        self.release = threading.Event()
+
+    def size(self):
+        return 0
+
+    def read_from(self, cursor):
+        self.reading.set()
+        self.release.wait(5)
+        return [], cursor
+
+def test_a_slow_trip_does_not_block_others(tmp_path):
+    cache = AnalyticsCache()
+    slow = SlowLog()
+    reader = threading.Thread(target=cache.summary, args=("slow", slow, {}))
+    reader.start()
+    assert slow.reading.wait(5)
+    log = EventLog(str(tmp_path / "events.jsonl"))
+    log.append_many(drive(3))
+    try:
+        assert cache.summary("fast", log, {})["points"] == 3
+    finally:
+        slow.release.set()
+        reader.join(5)
+
+def test_cache_is_bounded_and_follows_a_recreated_log(tmp_path):
+    cache = AnalyticsCache(max_entries=2)
+    log = EventLog(str(tmp_path / "events.jsonl"))
+    log.append_many(drive(10))
+    for trip_id in ("a", "b", "c"):
+        cache.summary(trip_id, log, {})
+    assert list(cache._entries) == ["b", "c"]
+    # Another worker reset the trip and its log was started again
+    os.remove(log.path)
+    fresh = EventLog(log.path)
+    fresh.append_many(drive(3))
+    assert cache.summary("c", fresh, {})["points"] == 3
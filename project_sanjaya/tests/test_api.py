@@ -0,0 +1,127 @@
+import os
+import json
+import threading
+
+import pytest
+
+HISTORY_ENDPOINTS = ["/status", "/analytics", "/export/geojson", "/stream"]
+
+def test_start_trip_is_the_only_response_with_the_token(client, start_trip):
+    trip = start_trip()
+    assert trip["token"]
+    response = client.post("/flight_info", json={"token": trip["token"], "flight_info": {"gate": "12"}})
+    assert response.status_code == 200
+    assert "token" not in response.get_json()
+    response = client.post("/end_trip", json={"token": trip["token"]})
+    assert response.status_code == 200
+    assert "token" not in response.get_json()
+
+@pytest.mark.parametrize("path", ["/log", "/log/batch", "/end_trip", "/flight_info", "/reset_trip"])
+def test_mutations_need_the_token(client, start_trip, path):
+    trip = start_trip()
+    body = {"lat": 1.0, "lon": 2.0, "points": [], "flight_info": {}}
+    for credentials in ({}, {"trip_id": trip["trip_id"]}, {"token": "not-the-token"}):
+        assert client.post(path, json={**body, **credentials}).status_code == 404
+    assert client.get("/status", query_string={"token": trip["token"]}).get_json()["trip_status"] == "active"
+
+@pytest.mark.parametrize("path", HISTORY_ENDPOINTS)
+def test_history_needs_the_token(client, start_trip, path):
+    trip = start_trip()
+    for query in ({}, {"trip_id": trip["trip_id"]}):
+        response = client.get(path, query_string=query)
+        assert trip["trip_id"] not in response.get_data(as_text=True)
+
+def test_token_resolves_after_trip_ended(client, start_trip):
+    trip = start_trip()
+    client.post("/log", json={"token": trip["token"], "lat": 12.9, "lon": 77.5})
+    client.post("/end_trip", json={"token": trip["token"]})
+    response = client.get("/export/gpx", query_string={"token": trip["token"]})
+    assert response.status_code == 200
+    assert "<trkpt" in response.get_data(as_text=True)
+
+def test_batch_reports_duplicates_and_rejected_points(client, start_trip):
+    trip = start_trip()
+    points = [{"lat": 12.9, "lon": 77.5, "timestamp": 1735689600000},
+              {"lat": 12.9, "lon": 77.5, "timestamp": 1735689600000},
+              {"lat": 95.0, "lon": 77.5, "timestamp": 1735689601000},
+              {"lat": 12.9}]
+    body = client.post("/log/batch", json={"token": trip["token"], "points": points}).get_json()
+    assert (body["accepted"], body["duplicates"], body["rejected"]) == (1, 1, [2, 3])
+    # An earlier point arriving after a later one is still stored
+    late = {"lat": 12.8, "lon": 77.5, "timestamp": 1735689500000}
+    assert client.post("/log/batch", json={"token": trip["token"], "points": [late]}).get_json()["accepted"] == 1
+
+def test_streams_beyond_the_cap_get_503(backend, client, start_trip, monkeypatch):
+    monkeypatch.setattr(backend, "stream_slots", threading.BoundedSemaphore(1))
+    trip = start_trip()
+    query = {"token": trip["token"]}
+    first = client.get("/stream", query_string=query, buffered=False)
+    assert first.status_code == 200
+    message = next(iter(first.response)).decode()
+    status = json.loads(message.split("data: ", 1)[1])
+    assert status["trip_info"]["trip_id"] == trip["trip_id"] and "token" not in status["trip_info"]
+
+    busy = client.get("/stream", query_string=query)
+    assert busy.status_code == 503 and busy.headers["Retry-After"]
+    first.close()  # A disconnecting client frees its slot
+    again = client.get("/stream", query_string=query, buffered=False)
+    assert again.status_code == 200
+    again.close()
+
+def read_sse(response):
+    """Yields (event, data) per message until the server closes the stream."""
+    for chunk in response.response:
+        for message in chunk.decode().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in message.splitlines() if not line.startswith(":"))
+            if "data" in fields:
+                yield fields.get("event"), json.loads(fields["data"])
+            elif message.startswith(": keepalive"):
+                yield "keepalive", None
+
+def test_stream_follows_a_trip_into_its_archive(backend, client, start_trip, monkeypatch):
+    wait = backend.changes.wait
+    monkeypatch.setattr(backend.changes, "wait", lambda version: wait(version, timeout=0.2))
+    trip = start_trip()
+    points = [{"lat": 12.9, "lon": 77.5, "timestamp": 1735689600000 + i * 1000} for i in range(3)]
+    client.post("/log/batch", json={"token": trip["token"], "points": points})
+    response = client.get("/stream", query_string={"token": trip["token"]}, buffered=False)
+    messages = read_sse(response)
+    assert next(messages)[0] == "status"
+    event, data = next(messages)
+    assert event == "locations" and len(data["events"]) == 3
+
+    backend.archive_ended_trip(backend.trips.get(trip["trip_id"]))
+    assert not os.path.exists(backend.trip_events_path(trip["trip_id"], backend.TRIPS_DIR))
+    backend.trips.update(trip["trip_id"], lambda info: info.update(trip_status="ended"))
+    backend.changes.notify()
+    event, data = next(messages)
+    assert event == "status" and data["trip_status"] == "ended"
+    # Nothing new to send: the archive keeps the log's cursors, so this isn't a
+    # reset, and the stream of an ended trip closes
+    assert list(messages) == []
+    response.close()
+
+    replay = client.get("/stream", query_string={"token": trip["token"], "cursor": 0}, buffered=False)
+    (event, status), (_, data) = list(read_sse(replay))
+    assert event == "status" and status["trip_status"] == "ended"
+    assert len(data["events"]) == 3 and not data["reset"]
+    replay.close()
+
+def test_stream_of_a_deleted_trip_closes_and_frees_its_slot(backend, client, start_trip, monkeypatch):
+    monkeypatch.setattr(backend, "stream_slots", threading.BoundedSemaphore(1))
+    wait = backend.changes.wait
+    monkeypatch.setattr(backend.changes, "wait", lambda version: wait(version, timeout=0.2))
+    trip = start_trip()
+    response = client.get("/stream", query_string={"token": trip["token"]}, buffered=False)
+    messages = read_sse(response)
+    assert next(messages)[1]["trip_status"] == "active"
+    assert next(messages) == ("keepalive", None)
+
+    client.post("/reset_trip", json={"token": trip["token"]})
+    assert [data["trip_status"] for _, data in messages] == ["none"]
+    response.close()
+    assert backend.stream_slots.acquire(blocking=False)
+
+def test_start_trip_rejects_a_non_string_flight_number(client):
+    response = client.post("/start_trip", json={"flight_number": 123})
+    assert response.status_code == 400
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+from jules import archive
+from jules.archive import ArchivedEventLog, TripArchive, archive_trip, convert_log
+from jules.eventlog import EventLog
+from jules.export import trip_event_source
+from jules.trips import TripStore, trip_dir, trip_events_path
+from jules.tripdb import SharedTripStore
+
+EVENTS = [
+    {"lat": 12.971598723, "lon": 77.594562113, "timestamp": "2025-01-01T00:00:10+00:00", "source": "web"},
+    {"lat": 12.9716, "lon": 77.5946, "timestamp": "2025-01-01T00:00:05Z", "source": "web", "accuracy": 12.5},
+    {"lat": 13, "lon": 77.6, "timestamp": "2025-01-01T00:00:20.250000+00:00", "source": "flight",
+     "flight": {"number": "6E451"}},
+    {"lat": 13.1, "lon": 77.7, "timestamp": "2025-01-01T00:00:30+00:00"},
+]
+
+def write_log(path, events=EVENTS):
+    log = EventLog(path)
+    cursors = [log.append(e) for e in events]
+    log.close()
+    return cursors
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_archive_round_trip_is_lossless(tmp_path, compress):
+    src = str(tmp_path / "events.jsonl")
+    write_log(src)
+    dst, count = convert_log(src, compress=compress)
+    assert count == len(EVENTS)
+    by_time = sorted(EVENTS, key=lambda e: archive._epoch_us(e["timestamp"]))
+    assert list(TripArchive(dst).iter_events()) == by_time
+    assert list(ArchivedEventLog(dst).iter_events()) == EVENTS
+    assert isinstance(TripArchive(dst).columns["lat"], np.memmap) is not compress
+
+def test_archived_log_keeps_the_logs_cursors(tmp_path):
+    src = str(tmp_path / "events.jsonl")
+    cursors = write_log(src)
+    log, archived = EventLog(src), ArchivedEventLog(convert_log(src)[0])
+    assert archived.size() == log.size() == cursors[-1]
+    for cursor in [0] + cursors:
+        assert archived.read_from(cursor) == log.read_from(cursor)
+        assert archived.read_from(cursor, limit=1) == log.read_from(cursor, limit=1)
+    assert archived.last_event() == EVENTS[-1]
+    with pytest.raises(ValueError):
+        archived.append({"lat": 1.0, "lon": 2.0, "timestamp": "2025-01-01T00:00:00+00:00"})
+
+@pytest.fixture(params=[TripStore, SharedTripStore], ids=["files", "sqlite"])
+def store(request, tmp_path):
+    store = request.param(str(tmp_path))
+    store.create({"trip_id": "trip-1", "trip_status": "active"})
+    store.append_events("trip-1", EVENTS)
+    store.update("trip-1", lambda info: info.update(trip_status="ended"))
+    store.flush()
+    return store
+
+def test_archive_replaces_the_log(store):
+    before = list(store.events("trip-1").iter_events())
+    size = store.events("trip-1").size()
+    path = archive_trip("trip-1", store.root, store=store)
+    assert os.path.exists(path) and not os.path.exists(trip_events_path("trip-1", store.root))
+    log = store.events("trip-1")
+    assert isinstance(log, ArchivedEventLog) and log.size() == size
+    assert list(log.iter_events()) == before
+    assert list(trip_event_source("trip-1", store.root)()) == before
+
+def test_archiving_a_reset_trip_does_not_recreate_it(store, monkeypatch):
+    write = archive.write_archive
+    def write_then_reset(*args, **kwargs):
+        count = write(*args, **kwargs)
+        store.delete("trip-1")  # A /reset_trip landing while the archive is built
+        return count
+    monkeypatch.setattr(archive, "write_archive", write_then_reset)
+    assert archive_trip("trip-1", store.root, store=store) is None
+    assert not os.path.exists(trip_dir("trip-1", store.root))
+    assert [name for name in os.listdir(store.root) if name.endswith(".sja")] == []
+
+def test_a_trip_without_points_is_left_unarchived(tmp_path):
+    store = TripStore(str(tmp_path))
+    store.create({"trip_id": "empty", "trip_status": "active"})
+    store.update("empty", lambda info: info.update(trip_status="ended"))
+    assert archive_trip("empty", store.root, store=store) is None
+    assert os.listdir(trip_dir("empty", store.root)) == ["trip_info.json"]
+    assert store.events("empty").read_from(0) == ([], 0)
@@ -0,0 +1,101 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from jules.aviation import FlightDataClient, QuotaCounter, SharedQuotaCounter, fallback_flight
+
+RECORD = {
+    "flight_status": "active",
+    "departure": {"airport": "Kempegowda International", "iata": "BLR", "scheduled": "2025-10-16T16:15:00+00:00"},
+    "arrival": {"airport": "Chaudhary Charan Singh International", "iata": "LKO", "scheduled": "2025-10-16T18:50:00+00:00"},
+}
+
+class StubAviationstack(BaseHTTPRequestHandler):
+    """Answers like aviationstack: 6E451 exists, FAIL errors out, anything else has no records."""
+    requests = []
+
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+        self.requests.append(params)
+        if params.get("flight_iata") == "FAIL":
+            self.send_error(500)
+            return
+        body = json.dumps({"data": [RECORD] if params.get("flight_iata") == "6E451" else []}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub():
+    handler = type("Handler", (StubAviationstack,), {"requests": []})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield handler, f"http://127.0.0.1:{server.server_address[1]}/v1/flights"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def make_client(stub, tmp_path):
+    def make(**kwargs):
+        kwargs.setdefault("quota", QuotaCounter(str(tmp_path / "usage.json")))
+        return FlightDataClient(base_url=stub[1], api_key="test-key", **kwargs)
+    return make
+
+def test_found_flights_are_normalized_and_cached(stub, make_client):
+    client = make_client()
+    info = client.get("6e451", "2025-10-16")
+    assert (info["status"], info["departure_iata"], info["arrival_iata"]) == ("in_flight", "BLR", "LKO")
+    assert client.get("6E451", "2025-10-16") == info
+    assert len(stub[0].requests) == 1
+    assert stub[0].requests[0]["flight_date"] == "2025-10-16"
+
+def test_unknown_flights_are_negatively_cached(stub, make_client):
+    client = make_client()
+    info = client.get("XX999", "2025-10-16")
+    assert info["status"] == "unknown" and info["scheduled_departure"] is None
+    client.get("XX999", "2025-10-16")
+    assert len(stub[0].requests) == 1
+    expired = make_client(negative_ttl=-1)
+    expired.get("XX999", "2025-10-16")
+    expired.get("XX999", "2025-10-16")
+    assert len(stub[0].requests) == 3
+
+def test_failures_answer_unknown_and_back_off(stub, make_client):
+    client = make_client()
+    assert client.get("FAIL", "2025-10-16")["status"] == "unknown"
+    assert client.get("6E451", "2025-10-16")["status"] == "unknown"  # Still backing off
+    assert len(stub[0].requests) == 1
+
+def test_workers_share_one_quota(stub, make_client, tmp_path):
+    db_path = str(tmp_path / "trips.db")
+    workers = [make_client(quota=SharedQuotaCounter(db_path, limit=3, reserve=0)) for _ in range(2)]
+    answers = [worker.get(f"XX{i}", "2025-10-16")["source"] for i in range(3) for worker in workers]
+    assert len(stub[0].requests) == 3
+    assert answers.count("fallback") == 6
+    assert SharedQuotaCounter(db_path).used() == 3
+
+def test_no_api_key_means_no_calls(stub):
+    client = FlightDataClient(base_url=stub[1], api_key=None)
+    assert client.get("6E451")["status"] == "unknown"
+    assert stub[0].requests == []
+
+def test_unavailable_data_falls_back_to_the_file(stub, make_client, tmp_path):
+    assert fallback_flight()["source"] == "fallback" and fallback_flight()["scheduled_departure"] is None
+    path = tmp_path / "fallback_flight.json"
+    path.write_text(json.dumps({"departure_iata": "BLR", "arrival_iata": "LKO", "source": "fallback"}))
+    info = make_client(fallback_path=str(path)).get("FAIL", "2025-10-16")
+    assert (info["status"], info["departure_iata"], info["arrival_iata"]) == ("unknown", "BLR", "LKO")
+    assert fallback_flight(str(tmp_path / "missing.json"))["source"] == "unavailable"
+
+def test_flight_numbers_are_normalized(stub, make_client):
+    client = make_client()
+    assert client.get(" 6e451 ", "2025-10-16")["departure_iata"] == "BLR"
+    assert client.get(451, "2025-10-16")["status"] == "unknown"
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from jules import cluster
+from jules.cluster import HEALTHY_UPTIME_SECONDS, RESTART_DELAY_SECONDS, Supervisor
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="multi-process mode needs POSIX")
+
+class FakeProcess:
+    pid = 1234
+
+    def __init__(self):
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(cluster.time, "monotonic", lambda: clock["now"])
+    supervisor = Supervisor("main:app", workers=1, host="127.0.0.1", port=0)
+    def spawn(slot):
+        supervisor.processes[slot] = FakeProcess()
+        supervisor._started[slot] = clock["now"]
+    monkeypatch.setattr(supervisor, "_spawn", spawn)
+    supervisor.start()
+    yield supervisor, clock
+    supervisor.sock.close()
+
+def crash_and_restart(supervisor, clock):
+    """Crashes the worker and returns the delay before it was started again."""
+    supervisor.processes[0].returncode = 1
+    crashed_at = clock["now"]
+    supervisor.check()
+    clock["now"] = supervisor._restart_at[0]
+    supervisor.check()
+    assert supervisor.processes[0].poll() is None
+    return clock["now"] - crashed_at
+
+def test_restart_delay_grows_and_resets_after_healthy_uptime(supervisor):
+    supervisor, clock = supervisor
+    assert [crash_and_restart(supervisor, clock) for _ in range(3)] == [RESTART_DELAY_SECONDS[0] * 2 ** i for i in range(3)]
+    clock["now"] += HEALTHY_UPTIME_SECONDS - 1
+    supervisor.check()
+    assert supervisor._failures == [3]
+    clock["now"] += 1
+    supervisor.check()
+    assert supervisor._failures == [0]
+    assert crash_and_restart(supervisor, clock) == RESTART_DELAY_SECONDS[0]
@@ -0,0 +1,90 @@
+import gc
+import json
+import os
+import time
+
+from jules import eventlog
+from jules.eventlog import EventLog, load_events
+
+def event(i, **extra):
+    return {"lat": 12.9 + i / 1000, "lon": 77.5, "timestamp": f"2025-01-01T00:00:{i:02d}+00:00", **extra}
+
+def test_cursor_resumes_where_the_reader_stopped(tmp_path):
+    log = EventLog(str(tmp_path / "events.jsonl"))
+    assert log.read_from(0) == ([], 0)
+    cursor = log.append_many([event(1), event(2)])
+    assert cursor == log.size()
+    events, end = log.read_from(0)
+    assert [e["timestamp"] for e in events] == [event(1)["timestamp"], event(2)["timestamp"]] and end == cursor
+    cursor = log.append(event(3))
+    assert log.read_from(end) == ([event(3)], cursor)
+    assert log.read_from(cursor) == ([], cursor)
+    assert [e["lat"] for e in log.iter_events(end)] == [event(3)["lat"]]
+
+def test_limit_stops_at_a_record_boundary(tmp_path):
+    log = EventLog(str(tmp_path / "events.jsonl"))
+    log.append_many([event(i) for i in range(5)])
+    events, cursor = log.read_from(0, limit=2)
+    assert len(events) == 2
+    rest, _ = log.read_from(cursor)
+    assert [e["timestamp"] for e in events + rest] == [event(i)["timestamp"] for i in range(5)]
+
+def test_a_record_being_written_is_left_for_the_next_read(tmp_path):
+    log = EventLog(str(tmp_path / "events.jsonl"))
+    cursor = log.append(event(1))
+    with open(log.path, "ab") as f:
+        f.write(b'{"lat": 13.0, "lo')
+    assert log.read_from(0) == ([event(1)], cursor)
+    assert list(log.iter_events()) == [event(1)]
+    assert log.last_event() == event(1)
+    with open(log.path, "ab") as f:
+        f.write(b'n": 77.5}\n')
+    assert log.read_from(cursor)[0] == [{"lat": 13.0, "lon": 77.5}]
+
+def test_cursor_past_a_reset_log_starts_over(tmp_path):
+    log = EventLog(str(tmp_path / "events.jsonl"))
+    stale = log.append_many([event(i) for i in range(5)])
+    log.reset()
+    assert log.size() == 0 and log.read_from(stale) == ([], 0)
+    cursor = log.append(event(9))
+    assert log.read_from(stale) == ([event(9)], cursor)
+
+def test_last_event_reads_records_longer_than_the_tail(tmp_path):
+    log = EventLog(str(tmp_path / "events.jsonl"))
+    assert log.last_event() is None
+    big = event(2, note="x" * 10000)
+    log.append_many([event(1), big])
+    assert log.last_event(tail_bytes=512) == big
+    assert log.last_event() == big
+
+def test_legacy_json_files_load(tmp_path):
+    legacy = tmp_path / "session_log.json"
+    legacy.write_text(json.dumps({"events": [event(1)]}))
+    assert list(load_events(str(legacy))) == [event(1)]
+    assert list(load_events(str(tmp_path / "missing.json"))) == []
+
+def test_path_locks_go_away_with_their_logs(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    log = EventLog(path)
+    assert EventLog(path)._lock is log._lock
+    del log
+    gc.collect()
+    assert os.path.abspath(path) not in eventlog._locks
+
+def test_the_end_of_a_burst_is_synced(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(eventlog.os, "fsync", lambda fd: synced.append(fd))
+    log = EventLog(str(tmp_path / "events.jsonl"), fsync_interval=0.05)
+    for i in range(5):
+        log.append(event(i))
+    assert len(synced) == 1  # The first write; the rest wait for the interval
+    deadline = time.monotonic() + 5
+    while len(synced) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(synced) == 2
+    log.fsync_interval = 60
+    log.append(event(9))
+    log.close()
+    assert len(synced) == 3 and log._fsync_timer is None
+    log.close()
+    assert len(synced) == 3  # Nothing left to sync
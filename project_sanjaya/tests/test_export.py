@@ -0,0 +1,63 @@
+import json
+import struct
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from jules.eventlog import EventLog
+from jules.export import encode_chunks, export_chunks, export_trip, svg_chunks
+
+GPX_NS = {"gpx": "http://www.topografix.com/GPX/1/1"}
+
+def event(second, lat, lon, source):
+    return {"lat": lat, "lon": lon, "timestamp": f"2025-01-01T00:00:{second:02d}+00:00", "source": source}
+
+EVENTS = [event(0, 12.90, 77.50, "web"), event(1, 12.95, 77.55, "web"),
+          event(2, 13.20, 77.70, "flight"), event(3, 20.00, 79.00, "flight"), event(4, 26.76, 80.89, "flight"),
+          {"lat": "bad", "lon": 1.0},
+          event(5, 26.80, 80.90, "web")]
+TRIP_INFO = {"trip_id": "trip-1", "user_name": "Asha", "flight_number": "6E451", "token": "secret"}
+
+def export(fmt, events=EVENTS, trip_info=TRIP_INFO):
+    return b"".join(encode_chunks(export_chunks(fmt, events, trip_info)))
+
+def test_geojson_is_a_feature_collection_per_source_run():
+    doc = json.loads(export("geojson"))
+    assert doc["type"] == "FeatureCollection"
+    assert "properties" not in doc
+    assert doc["trip"] == {"trip_id": "trip-1", "user_name": "Asha", "flight_number": "6E451"}
+    kinds = [(f["geometry"]["type"], f["properties"]["source"], f["properties"]["points"]) for f in doc["features"]]
+    assert kinds == [("LineString", "web", 2), ("LineString", "flight", 3), ("Point", "web", 1)]
+    assert doc["features"][0]["geometry"]["coordinates"][0] == [77.5, 12.9]  # Longitude first
+    assert doc["features"][2]["properties"]["start"] == EVENTS[-1]["timestamp"]
+
+def test_gpx_has_a_track_per_source_run():
+    root = ET.fromstring(export("gpx"))
+    assert root.find("gpx:metadata/gpx:name", GPX_NS).text == "Asha (6E451)"
+    tracks = root.findall("gpx:trk", GPX_NS)
+    assert [t.find("gpx:type", GPX_NS).text for t in tracks] == ["web", "flight", "web"]
+    assert [len(t.findall(".//gpx:trkpt", GPX_NS)) for t in tracks] == [2, 3, 1]
+
+def test_single_pass_formats_stream_one_shot_iterators():
+    assert json.loads(export("geojson", iter(EVENTS)))["features"]
+    assert b"<trkpt" in export("gpx", (e for e in EVENTS))
+
+def test_images_need_a_source_they_can_read_twice():
+    with pytest.raises(TypeError):
+        list(svg_chunks(iter(EVENTS)))
+    svg = export("svg", lambda: iter(EVENTS)).decode()
+    assert svg.count("<path") == 3 and 'stroke-dasharray="10,5"' in svg
+    assert export("svg", EVENTS).decode() == svg
+    png = export("png", EVENTS)
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    assert struct.unpack(">II", png[16:24]) == (1024, 768)
+
+def test_export_trip_reads_the_trip_log(tmp_path):
+    trip = tmp_path / "trip-1"
+    trip.mkdir()
+    (trip / "trip_info.json").write_text(json.dumps(TRIP_INFO))
+    EventLog(str(trip / "events.jsonl")).append_many(EVENTS)
+    path = export_trip("trip-1", "geojson", root=str(tmp_path), out_dir=str(tmp_path / "out"))
+    with open(path) as f:
+        doc = json.load(f)
+    assert len(doc["features"]) == 3 and "token" not in doc["trip"]
@@ -0,0 +1,39 @@
+import numpy as np
+
+from jules.geovec import events_to_arrays, haversine_np, pairwise_distances, segment_speeds, to_epoch_seconds, trip_metrics
+from jules.utils import haversine_distance
+
+def random_points(rng, n):
+    lats = rng.uniform(-90, 90, n)
+    lons = rng.uniform(-180, 180, n)
+    # Poles, the antimeridian from both sides, and antipodes
+    edge_lats = np.array([90.0, -90.0, 89.9999, 0.0, 0.0, 45.0, -45.0, 0.0])
+    edge_lons = np.array([0.0, 137.0, -180.0, 180.0, -179.9999, 179.9999, -180.0, 0.0])
+    return np.concatenate((lats, edge_lats)), np.concatenate((lons, edge_lons))
+
+def test_vectorized_distance_matches_the_scalar_reference():
+    rng = np.random.default_rng(7)
+    lat1, lon1 = random_points(rng, 2000)
+    lat2, lon2 = random_points(rng, 2000)
+    lat2[-1], lon2[-1] = 0.0, 180.0  # Antipode of (0, 0)
+    expected = [haversine_distance(*p) for p in zip(lat1, lon1, lat2, lon2)]
+    np.testing.assert_allclose(haversine_np(lat1, lon1, lat2, lon2), expected, rtol=1e-12, atol=1e-9)
+    # Crossing the antimeridian is a short hop, not a trip around the world
+    assert haversine_np(0.0, 179.9999, 0.0, -179.9999) < 0.1
+    matrix = pairwise_distances(lat1[:20], lon1[:20])
+    assert matrix[3, 7] == haversine_np(lat1[3], lon1[3], lat1[7], lon1[7])
+
+def test_missing_timestamps_give_nan_speeds():
+    events = [{"lat": 12.9, "lon": 77.5, "timestamp": "2025-01-01T00:00:00Z"},
+              {"lat": 12.91, "lon": 77.5},
+              {"lat": 12.92, "lon": 77.5, "timestamp": "2025-01-01T00:02:00+00:00"},
+              {"lat": 12.93, "lon": 77.5, "timestamp": "2025-01-01T00:03:00+00:00"}]
+    lats, lons, timestamps = events_to_arrays(events)
+    seconds = to_epoch_seconds(timestamps)
+    assert np.isnan(seconds[1]) and seconds[3] - seconds[2] == 60
+    assert np.isnan(to_epoch_seconds(["not a time"])[0])
+    speeds = segment_speeds(lats, lons, timestamps)
+    assert np.isnan(speeds[:2]).all()
+    assert abs(speeds[2] - haversine_distance(12.92, 77.5, 12.93, 77.5) * 60) < 1e-9
+    metrics = trip_metrics(lats, lons, timestamps)
+    assert metrics["cumulative_km"][-1] == metrics["total_km"]
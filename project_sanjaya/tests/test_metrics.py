@@ -0,0 +1,67 @@
+import pytest
+
+from jules.metrics import Registry
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+def lines(registry):
+    text = registry.render()
+    assert text.endswith("\n")
+    return text.splitlines()
+
+def test_registering_a_name_twice_returns_the_same_metric(registry):
+    requests = registry.counter("app_requests_total", "Requests.", labels=("route",))
+    assert registry.counter("app_requests_total", "Requests.", labels=("route",)) is requests
+    with pytest.raises(ValueError):
+        registry.gauge("app_requests_total", "Requests.")
+    with pytest.raises(ValueError):
+        requests.inc(route="/", method="GET")
+
+def test_metrics_render_in_registration_order_with_help_and_type(registry):
+    registry.counter("app_requests_total", "Requests.").inc(3)
+    registry.gauge("app_queue_depth", "Queued jobs.").set(2)
+    assert lines(registry) == [
+        "# HELP app_requests_total Requests.",
+        "# TYPE app_requests_total counter",
+        "app_requests_total 3",
+        "# HELP app_queue_depth Queued jobs.",
+        "# TYPE app_queue_depth gauge",
+        "app_queue_depth 2",
+    ]
+
+def test_histogram_renders_cumulative_buckets_sum_and_count(registry):
+    latency = registry.histogram("app_latency_seconds", "Latency.", labels=("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):  # A value on a bound counts towards that bucket
+        latency.observe(value, route="/log")
+    assert lines(registry)[2:] == [
+        'app_latency_seconds_bucket{route="/log",le="0.1"} 2',
+        'app_latency_seconds_bucket{route="/log",le="1.0"} 3',
+        'app_latency_seconds_bucket{route="/log",le="+Inf"} 4',
+        'app_latency_seconds_sum{route="/log"} 3.65',
+        'app_latency_seconds_count{route="/log"} 4',
+    ]
+    assert latency.count(route="/log") == 4
+
+def test_labelled_gauges_are_sorted_and_escaped(registry):
+    depth = registry.gauge("app_queue_depth", "Queued jobs.", labels=("queue", "host"))
+    depth.set(1.5, queue="render", host="b")
+    depth.inc(queue="archive", host='a"\\\n')
+    depth.dec(queue="render", host="b")
+    assert lines(registry)[2:] == [
+        'app_queue_depth{queue="archive",host="a\\"\\\\\\n"} 1',
+        'app_queue_depth{queue="render",host="b"} 0.5',
+    ]
+
+def test_set_function_is_read_at_scrape_time(registry):
+    size = registry.gauge("app_log_bytes", "Log size.")
+    current = {"value": 10}
+    size.set_function(lambda: current["value"])
+    assert lines(registry)[-1] == "app_log_bytes 10"
+    current["value"] = 25
+    assert lines(registry)[-1] == "app_log_bytes 25"
+
+    files = registry.gauge("app_files", "Files by kind.", labels=("kind",))
+    files.set_function(lambda: {("log",): 2, ("archive",): 7})
+    assert lines(registry)[-2:] == ['app_files{kind="archive"} 7', 'app_files{kind="log"} 2']
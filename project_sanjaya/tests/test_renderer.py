@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import Future
+
+import pytest
+
+from jules.renderer import MapRenderService, asset_path
+
+def chromium_available():
+    try:
+        from playwright.sync_api import sync_playwright
+    except ImportError:
+        return False
+    try:
+        with sync_playwright() as playwright:
+            return os.path.exists(playwright.chromium.executable_path)
+    except Exception:
+        return False
+
+needs_chromium = pytest.mark.skipif(not chromium_available(), reason="Playwright's Chromium is not installed")
+
+def trip_events(n=50):
+    return [{"lat": 12.95 + i * 0.001, "lon": 77.6 + i * 0.001, "timestamp": f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}+00:00",
+             "source": "web"} for i in range(n)]
+
+def test_asset_paths_stay_under_the_root(tmp_path):
+    root = str(tmp_path)
+    path = asset_path("https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js?v=1", root)
+    assert path == os.path.join(root, "cdn.jsdelivr.net", "npm", "leaflet@1.9.3", "dist", "leaflet.js")
+    assert asset_path("https://cdn.jsdelivr.net/../../etc/passwd", root).startswith(root)
+
+def test_failed_render_is_logged(backend, caplog):
+    future = Future()
+    future.set_exception(RuntimeError("browser crashed"))
+    with caplog.at_level(logging.ERROR, logger="sanjaya.backend"):
+        backend.log_render_failure("trip-1", future)
+    assert "Rendering the final map failed" in caplog.text
+
+@needs_chromium
+def test_renders_survive_failures_and_relaunches(tmp_path):
+    from jules.maps import generate_trip_map
+    service = MapRenderService(pool_size=1, tile_timeout_ms=2000, assets_dir=str(tmp_path / "assets"))
+    html_path = generate_trip_map(trip_events(), html_path=str(tmp_path / "map.html"))
+    try:
+        image = service.submit(html_path, str(tmp_path / "first.png"), remove_html=False).result(60)
+        with open(image, "rb") as f:
+            assert f.read(8) == b"\x89PNG\r\n\x1a\n"
+        # A failing job must not leave a broken page behind for the next one
+        with pytest.raises(Exception):
+            service.submit(str(tmp_path / "missing.html"), str(tmp_path / "bad/dir/x.png")).result(60)
+        assert os.path.exists(service.submit(html_path, str(tmp_path / "second.png"), remove_html=False).result(60))
+        # After the browser goes away, pages from the old one are not reused
+        service.submit(html_path, str(tmp_path / "warm.png"), remove_html=False).result(60)
+        asyncio.run_coroutine_threadsafe(service._browser.close(), service._loop).result(30)
+        assert os.path.exists(service.submit(html_path, str(tmp_path / "third.png"), remove_html=False).result(60))
+    finally:
+        service.stop()
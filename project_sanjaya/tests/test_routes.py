@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from jules import routes
+from jules.geovec import haversine_np
+from jules.routes import great_circle, route_between, split_at_antimeridian
+
+AIRPORTS = {"BLR": (13.1986, 77.7066), "DEL": (28.5562, 77.1), "NRT": (35.772, 140.3929), "SFO": (37.619, -122.375)}
+
+@pytest.fixture(autouse=True)
+def airports(monkeypatch):
+    monkeypatch.setattr(routes, "get_airport_coords", AIRPORTS.get)
+    routes._cached_route.cache_clear()
+
+def test_route_runs_between_the_airports_in_even_steps():
+    route = route_between("BLR", "DEL")
+    assert route[0] == pytest.approx(AIRPORTS["BLR"]) and route[-1] == pytest.approx(AIRPORTS["DEL"])
+    lats, lons = np.array(route).T
+    steps = haversine_np(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    assert len(route) <= routes.ROUTE_MAX_POINTS
+    assert steps.max() == pytest.approx(routes.ROUTE_STEP_KM, rel=0.05) and np.ptp(steps) < 1e-6
+    assert route_between("BLR", "XXX") is None and route_between(None, "DEL") is None
+
+def test_route_follows_the_great_circle_not_the_parallel():
+    # Following the 45th parallel the midpoint would sit at 45°N; the great circle bows poleward
+    (lat, lon), = great_circle(45.0, -60.0, 45.0, 60.0, points=3)[1:2]
+    assert lat > 45.0 and lon == pytest.approx(0.0, abs=1e-9)
+
+def test_a_route_that_stays_on_one_side_is_not_split():
+    route = route_between("BLR", "DEL")
+    assert split_at_antimeridian(route) == [route]
+
+def test_a_trans_pacific_route_is_split_at_the_antimeridian():
+    route = route_between("NRT", "SFO")
+    west, east = split_at_antimeridian(route)
+    assert west[0] == pytest.approx(AIRPORTS["NRT"]) and east[-1] == pytest.approx(AIRPORTS["SFO"])
+    assert all(lon > 0 for _, lon in west) and all(lon < 0 for _, lon in east)
+    # Both pieces meet on the antimeridian at the same latitude
+    assert west[-1][1] == 180.0 and east[0][1] == -180.0 and west[-1][0] == pytest.approx(east[0][0])
+    assert len(west) + len(east) == len(route) + 2
+
+def test_each_crossing_starts_a_new_piece():
+    pieces = split_at_antimeridian([(0.0, 179.0), (0.0, -179.0), (2.0, 179.0)])
+    assert pieces == [[(0.0, 179.0), (0.0, 180.0)], [(0.0, -180.0), (0.0, -179.0), (1.0, -180.0)],
+                      [(1.0, 180.0), (2.0, 179.0)]]
@@ -0,0 +1,66 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from jules.scheduler import BOARDING_OFFSET, COMPACT_MIN_ENTRIES, StatusScheduler, flight_status_at, next_transition
+
+NOW = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+def flight(departure_in, duration=timedelta(hours=2), status="scheduled", now=NOW):
+    dep = now + departure_in
+    return {"status": status, "scheduled_departure": dep.isoformat(), "scheduled_arrival": (dep + duration).isoformat()}
+
+def test_status_follows_the_schedule():
+    info = flight(timedelta(hours=1))
+    assert flight_status_at(info, NOW) == "scheduled"
+    assert flight_status_at(info, NOW + timedelta(minutes=20)) == "boarding"
+    assert flight_status_at(info, NOW + timedelta(hours=2)) == "in_flight"
+    assert flight_status_at(info, NOW + timedelta(hours=4)) == "landed"
+    assert next_transition(info, NOW) == NOW + timedelta(hours=1) - BOARDING_OFFSET
+    assert next_transition(info, NOW + timedelta(hours=4)) is None
+
+def test_rescheduling_and_cancelling_keep_the_heap_bounded():
+    scheduler = StatusScheduler(apply=lambda trip_id: None)
+    for i in range(COMPACT_MIN_ENTRIES * 10):
+        scheduler.schedule("trip", flight(timedelta(days=1 + i)), now=NOW)
+        scheduler.schedule(f"other-{i}", flight(timedelta(days=1)), now=NOW)
+        scheduler.cancel(f"other-{i}")
+    assert scheduler.pending() == 1
+    assert len(scheduler._generations) == 1
+    assert len(scheduler._heap) <= COMPACT_MIN_ENTRIES
+
+def test_landed_and_cancelled_trips_are_forgotten():
+    scheduler = StatusScheduler(apply=lambda trip_id: None)
+    scheduler.schedule("landed", flight(-timedelta(hours=5), status="landed"), now=NOW)
+    scheduler.schedule("cancelled", flight(timedelta(hours=5)), now=NOW)
+    scheduler.cancel("cancelled")
+    scheduler.cancel("never-scheduled")
+    assert scheduler._generations == {}
+
+def test_due_timer_fires_and_rearms():
+    fired = threading.Event()
+    calls = []
+    def apply(trip_id):
+        calls.append(trip_id)
+        fired.set()
+        return None if len(calls) > 1 else flight(timedelta(hours=3), status="boarding", now=datetime.now(timezone.utc))
+    scheduler = StatusScheduler(apply).start()
+    # Boarding has already begun, so the timer is due at once
+    scheduler.schedule("trip", flight(timedelta(minutes=30), now=datetime.now(timezone.utc)))
+    assert fired.wait(5)
+    assert calls == ["trip"]
+    deadline = time.monotonic() + 5
+    while scheduler.pending() != 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert scheduler.pending() == 1  # Re-armed for departure
+    scheduler.cancel("trip")
+    assert scheduler.pending() == 0
+
+def test_apply_for_a_deleted_trip_stops_tracking(backend, start_trip, monkeypatch):
+    trip = start_trip(flight_info=flight(timedelta(minutes=30), now=datetime.now(timezone.utc)))
+    original_update = backend.trips.update
+    def update_after_delete(trip_id, mutate):
+        backend.trips.delete(trip_id)  # A /reset_trip landing mid-update
+        return original_update(trip_id, mutate)
+    monkeypatch.setattr(backend.trips, "update", update_after_delete)
+    assert backend.apply_scheduled_status(trip["trip_id"]) is None
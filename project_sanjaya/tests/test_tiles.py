@@ -0,0 +1,72 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from jules.tiles import MAX_PREFETCH_TILES, TileCache, main, tile_for, tiles_along
+
+BLR_TO_LKO = [(13.1986, 77.7066), (26.7606, 80.8893)]
+
+class StubTiles(BaseHTTPRequestHandler):
+    """Serves the requested path as the tile body."""
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def upstream():
+    handler = type("Handler", (StubTiles,), {"requests": []})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    yield f"http://{host}:{port}/{{z}}/{{x}}/{{y}}.png", handler.requests
+    server.shutdown()
+    server.server_close()
+
+def test_default_trip_corridor_fits_the_cap():
+    corridor = tiles_along(BLR_TO_LKO, range(4, 14), 2.0)
+    assert sum(len(tiles) for tiles in corridor.values()) < MAX_PREFETCH_TILES
+    for lat, lon in BLR_TO_LKO:
+        assert (13, *tile_for(lat, lon, 13)) in corridor[13]
+    # Halfway along the straight line is covered too
+    assert (13, *tile_for(19.9796, 79.29795, 13)) in corridor[13]
+
+def test_prefetch_trip_drops_zoom_levels_over_the_cap(tmp_path, upstream):
+    url, requests = upstream
+    cache = TileCache(str(tmp_path / "tiles.mbtiles"), upstream=url)
+    corridor = tiles_along(BLR_TO_LKO, range(4, 9), 2.0)
+    limit = sum(len(corridor[z]) for z in range(4, 8))
+    assert cache.prefetch_trip(BLR_TO_LKO, zooms=range(4, 9), limit=limit) == limit
+    assert len(requests) == limit and not any(r.startswith("/8/") for r in requests)
+    assert cache.prefetch_trip(BLR_TO_LKO, zooms=range(4, 9), limit=limit) == limit
+    assert len(requests) == limit  # Already cached
+    with pytest.raises(ValueError):
+        cache.prefetch_trip(BLR_TO_LKO, zooms=range(13, 14), limit=10)
+
+def test_prefetch_needs_a_tile_source(tmp_path):
+    cache = TileCache(str(tmp_path / "tiles.mbtiles"), upstream=None)
+    cache.put(5, 1, 2, b"cached")
+    assert cache.fetch(5, 1, 2) == b"cached"
+    assert cache.fetch(5, 1, 3) is None
+    with pytest.raises(ValueError, match="SANJAYA_TILES_UPSTREAM"):
+        cache.prefetch_trip(BLR_TO_LKO)
+
+def test_cli_reports_prefetch_errors(tmp_path, upstream, capsys):
+    db = str(tmp_path / "tiles.mbtiles")
+    with pytest.raises(SystemExit) as exit:
+        main(["--db", db, "--upstream", upstream[0], "prefetch-bbox", "8", "68", "37", "97", "--zooms", "4-13"])
+    assert exit.value.code == 2
+    assert "limit 5000" in capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        main(["--db", db, "--upstream", "", "prefetch-bbox", "13.1", "77.6", "13.2", "77.7", "--zooms", "4"])
+    assert "No tile source configured" in capsys.readouterr().err
@@ -0,0 +1,56 @@
+import asyncio
+import io
+import threading
+
+from jules.eventlog import EventLog
+from jules.tracker import QueueSource, ReplaySource, Tracker, read_points
+
+def fix(second, lat=12.9, lon=77.5, source="fake"):
+    return {"lat": lat, "lon": lon, "timestamp": f"2025-01-01T00:{second // 60:02d}:{second % 60:02d}+00:00", "source": source}
+
+class FlakyStore:
+    """Fails the first `failures` writes, then stores everything."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.events = []
+
+    def append_many(self, events):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.events.extend(events)
+
+def track(store, sources, **options):
+    options.setdefault("retry_backoff", (0.001, 0.01))
+    tracker = Tracker(store, sources, min_move_m=0, **options)
+    return asyncio.run(tracker.run())
+
+def test_failed_writes_are_retried_in_order():
+    store = FlakyStore(failures=3)
+    fixes = [fix(i, lat=12.9 + i / 100) for i in range(50)]
+    stats = track(store, [ReplaySource(fixes)], batch_size=5)
+    assert store.events == fixes
+    assert (stats["written"], stats["failed_flushes"], stats["dropped"]) == (50, 3, 0)
+
+def test_a_batch_is_dropped_after_the_retry_limit():
+    store = FlakyStore(failures=10)
+    stats = track(store, [ReplaySource([fix(1), fix(2, lat=13.0)])], batch_size=10, flush_retries=2)
+    assert store.events == []
+    assert (stats["written"], stats["failed_flushes"], stats["dropped"]) == (0, 3, 2)
+
+def test_stationary_fixes_are_suppressed(tmp_path):
+    log = EventLog(str(tmp_path / "session.jsonl"))
+    fixes = [fix(i) for i in range(10)] + [fix(10, lat=13.0)]
+    stats = asyncio.run(Tracker(log, [ReplaySource(fixes)], keepalive_s=300).run())
+    assert [e["lat"] for e in log.iter_events()] == [12.9, 13.0]
+    assert stats["suppressed"] == 9
+
+def test_points_read_from_a_stream_are_tracked():
+    store = FlakyStore(failures=0)
+    source = QueueSource(name="device")
+    stream = io.StringIO('{"lat": 12.9, "lon": 77.5}\nnot json\n{"lat": "13.0", "lon": 77.5}\n\n{"lon": 1}\n')
+    threading.Thread(target=read_points, args=(stream, source), daemon=True).start()
+    stats = track(store, [source])
+    assert [(e["lat"], e["source"]) for e in store.events] == [(12.9, "device"), (13.0, "device")]
+    assert stats["received"] == 2
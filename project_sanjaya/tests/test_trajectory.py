@@ -0,0 +1,77 @@
+import random
+
+import numpy as np
+
+from jules.trajectory import (PolylineCache, StreamingSimplifier, _project, douglas_peucker, drop_stationary,
+                              simplify_path, tolerance_for_zoom)
+
+def random_walk(n, seed=7):
+    rng = random.Random(seed)
+    lat, lon, heading = 12.95, 77.6, 0.0
+    coords = []
+    for _ in range(n):
+        heading += rng.uniform(-0.4, 0.4)
+        step = rng.choice([0.0, 0.0002, 0.0005])  # Some fixes repeat while standing still
+        lat, lon = lat + step * np.cos(heading), lon + step * np.sin(heading)
+        coords.append((round(float(lat), 6), round(float(lon), 6)))
+    return coords
+
+def max_deviation(coords, polyline):
+    """Largest distance in meters from any of `coords` to the nearest segment of `polyline`."""
+    xy = _project(list(coords) + list(polyline))
+    pts, line = xy[:len(coords)], xy[len(coords):]
+    a, b = line[:-1], line[1:]
+    seg = b - a
+    seg_len2 = np.maximum((seg * seg).sum(axis=1), 1e-12)
+    t = np.clip(((pts[:, None, :] - a) * seg).sum(axis=2) / seg_len2, 0.0, 1.0)
+    nearest = a + t[..., None] * seg
+    return float(np.sqrt(((pts[:, None, :] - nearest) ** 2).sum(axis=2)).min(axis=1).max())
+
+def test_straight_line_and_stationary_points_collapse():
+    line = [(12.0 + i * 0.001, 77.0) for i in range(50)]
+    assert douglas_peucker(line, 1.0) == [line[0], line[-1]]
+    parked = [(12.0, 77.0)] * 10 + [(12.01, 77.0)]
+    assert drop_stationary(parked) == [(12.0, 77.0), (12.01, 77.0)]
+
+def test_simplify_path_respects_max_points():
+    coords = random_walk(3000)
+    assert len(simplify_path(coords, zoom=18, max_points=100)) <= 100
+
+def test_streaming_stays_within_tolerance():
+    coords = random_walk(2000)
+    zoom = 14
+    simplifier = StreamingSimplifier(zoom)
+    for end in range(1, len(coords) + 1, 37):
+        result = simplifier.update(coords[:end])
+    result = simplifier.update(coords)
+    assert result[0] == coords[0] and result[-1] == coords[-1]
+    tolerance = tolerance_for_zoom(zoom, coords[0][0])
+    # Dropped stationary points sit within the threshold of a kept one
+    assert max_deviation(coords, result) <= tolerance + 5.0 + 0.01
+    assert len(result) <= 1.2 * len(simplify_path(coords, zoom))
+
+def test_streaming_only_reprocesses_the_tail():
+    coords = random_walk(5000)
+    simplifier = StreamingSimplifier(zoom=14)
+    simplifier.update(coords[:10])
+    tail_sizes = []
+    for end in range(11, len(coords) + 1):
+        simplifier.update(coords[:end])
+        tail_sizes.append(len(simplifier.tail))
+    assert max(tail_sizes) < 200
+    assert len(simplifier.frozen) > 10
+
+def test_streaming_respects_max_points():
+    coords = random_walk(3000)
+    simplifier = StreamingSimplifier(zoom=18, max_points=100)
+    for end in range(1, len(coords) + 1, 50):
+        assert len(simplifier.update(coords[:end])) <= 100
+
+def test_cache_restarts_when_the_path_is_rewritten():
+    cache = PolylineCache()
+    coords = random_walk(500)
+    first = cache.get("trip", "ground", coords, 14)
+    assert cache.get("trip", "ground", coords, 14) is first
+    rewritten = random_walk(600, seed=8)
+    assert cache.get("trip", "ground", rewritten, 14)[0] == rewritten[0]
+    assert cache.get("trip", "ground", coords[:100], 14)[-1] == coords[99]
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+from jules.trips import TripStore
+from jules.tripdb import SharedTripStore
+
+@pytest.fixture(params=[TripStore, SharedTripStore], ids=["files", "sqlite"])
+def make_store(request, tmp_path):
+    """Opens a store of each kind on the same directory; call again to simulate a restart."""
+    return lambda: request.param(str(tmp_path))
+
+def point(second, lat=12.9, lon=77.5):
+    return {"lat": lat, "lon": lon, "timestamp": f"2025-01-01T00:00:{second:02d}+00:00", "source": "web"}
+
+def new_trip(store, trip_id="trip-1"):
+    return store.create({"trip_id": trip_id, "trip_status": "active"})
+
+def test_resent_points_are_skipped(make_store):
+    store = make_store()
+    new_trip(store)
+    assert store.append_events("trip-1", [point(1), point(2)])[0] == 2
+    assert store.append_events("trip-1", [point(2), point(3), point(3)])[0] == 1
+    assert [e["timestamp"][-8:-6] for e in store.events("trip-1")] == ["01", "02", "03"]
+
+def test_out_of_order_points_are_kept(make_store):
+    store = make_store()
+    new_trip(store)
+    store.append_events("trip-1", [point(30)])
+    # A queued batch from before the live point, plus a second fix at the same instant
+    accepted, _ = store.append_events("trip-1", [point(10), point(20), point(30, lat=13.0)])
+    assert accepted == 3
+    assert len(list(store.events("trip-1"))) == 4
+
+def test_dedupe_survives_a_restart(make_store):
+    store = make_store()
+    new_trip(store)
+    store.append_events("trip-1", [point(1), point(2)])
+    store.flush()
+    assert make_store().append_events("trip-1", [point(1), point(2), point(3)])[0] == 1
+
+def test_cursor_points_past_the_batch(make_store):
+    store = make_store()
+    new_trip(store)
+    _, cursor = store.append_events("trip-1", [point(1)])
+    events, end = store.events("trip-1").read_from(0)
+    assert cursor == end and len(events) == 1
+    assert store.append_events("trip-1", [point(1)]) == (0, cursor)
+
+def test_token_resolves_and_latest_is_not_a_fallback(make_store):
+    store = make_store()
+    trip = new_trip(store)
+    assert store.resolve(token=trip["token"]) == "trip-1"
+    assert store.resolve(token="nope") is None
+    assert store.resolve() is None
+
+def test_ended_trips_leave_memory_but_stay_reachable(tmp_path):
+    store = TripStore(str(tmp_path))
+    trip = new_trip(store)
+    store.append_events("trip-1", [point(1)])
+    store.update("trip-1", lambda info: info.update(trip_status="ended"))
+    store.flush()
+    assert "trip-1" not in store._trips and "trip-1" not in store._logs and "trip-1" not in store._event_keys
+    assert store.get("trip-1")["trip_status"] == "ended"
+    assert "trip-1" not in store._trips
+    assert TripStore(str(tmp_path)).resolve(token=trip["token"]) == "trip-1"
+
+def test_deleting_an_evicted_trip_drops_its_token(tmp_path):
+    store = TripStore(str(tmp_path))
+    trip = new_trip(store)
+    store.update("trip-1", lambda info: info.update(trip_status="ended"))
+    store.flush()
+    assert "trip-1" not in store._trips
+    store.delete("trip-1")
+    assert store.resolve(token=trip["token"]) is None
+
+def test_a_slow_append_holds_up_only_its_own_trip(tmp_path, monkeypatch):
+    store = TripStore(str(tmp_path))
+    new_trip(store, "slow")
+    new_trip(store, "other")
+    slow_log = store.events("slow")
+    writing, release = threading.Event(), threading.Event()
+    append_many = slow_log.append_many
+    def blocking_append(events):
+        writing.set()
+        release.wait(5)
+        return append_many(events)
+    monkeypatch.setattr(slow_log, "append_many", blocking_append)
+    writer = threading.Thread(target=store.append_events, args=("slow", [point(1)]))
+    writer.start()
+    assert writing.wait(5)
+    try:
+        # Neither waits on the blocked write
+        assert store.get("other")["trip_status"] == "active"
+        assert store.append_events("other", [point(1)])[0] == 1
+        assert len(store.active_trips()) == 2
+    finally:
+        release.set()
+        writer.join()
+    assert store.append_events("slow", [point(1)])[0] == 0
+
+def test_keys_are_compared_exactly(make_store):
+    store = make_store()
+    new_trip(store)
+    store.append_events("trip-1", [point(1)])
+    # Same timestamp, nearly the same position: a distinct point, whatever its hash
+    assert store.append_events("trip-1", [point(1, lat=12.9 + 1e-12)])[0] == 1